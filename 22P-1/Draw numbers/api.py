@@ -1,20 +1,51 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from pydantic import BaseModel
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
-import tensorflow as tf
 from PIL import Image
 import io
+import os
+import sys
 import base64
+import asyncio
 import logging
 import re
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from service_metrics import Metrics
+from micro_batching import MicroBatcher
+from bounded_executor import BoundedExecutor
+from numpy_runtime import NumpyModel
+
 # Настройка логирования
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Среда выполнения модели: keras - TensorFlow и digit_model.h5, numpy - digit_model.npz без импорта TensorFlow
+# (экспорт в папке 22P-1: python numpy_runtime.py "Draw numbers/digit_model.h5")
+MODEL_RUNTIME = os.environ.get('MODEL_RUNTIME', 'keras')
+# Объединение одновременных запросов в один вызов модели: до INFERENCE_BATCH_SIZE изображений,
+# первое ждет остальных не дольше INFERENCE_BATCH_WINDOW_MS. INFERENCE_BATCH_SIZE=1 - каждый запрос отдельно
+INFERENCE_BATCH_SIZE = int(os.environ.get('INFERENCE_BATCH_SIZE', '32'))
+INFERENCE_BATCH_WINDOW_MS = float(os.environ.get('INFERENCE_BATCH_WINDOW_MS', '1'))
+# Где считается модель: thread - пул потоков (TensorFlow и NumPy отпускают GIL), process - пул процессов, inline - в event loop.
+# Одновременно не больше INFERENCE_MAX_IN_FLIGHT запросов (не меньше INFERENCE_BATCH_SIZE, иначе батчи не наберутся),
+# еще INFERENCE_MAX_QUEUE ждут, остальные получают 503
+INFERENCE_EXECUTOR = os.environ.get('INFERENCE_EXECUTOR', 'thread')
+INFERENCE_WORKERS = int(os.environ.get('INFERENCE_WORKERS', str(os.cpu_count() or 1)))
+INFERENCE_MAX_IN_FLIGHT = int(os.environ.get('INFERENCE_MAX_IN_FLIGHT', '64'))
+INFERENCE_MAX_QUEUE = int(os.environ.get('INFERENCE_MAX_QUEUE', '256'))
+# Потоки для декодирования изображений (PIL отпускает GIL)
+PREPROCESS_WORKERS = int(os.environ.get('PREPROCESS_WORKERS', str(os.cpu_count() or 1)))
+
 app = FastAPI(title="Digit Recognition API")
 
+# Длительности этапов и счетчики запросов на /metrics (METRICS_ENABLED=0 - выключить)
+metrics = Metrics()
+metrics.instrument(app)
+
 # Разрешаем CORS для веб-приложения
 app.add_middleware(
     CORSMiddleware,
@@ -30,53 +61,70 @@ class PredictionRequest(BaseModel):
 
 # Загрузка модели
 try:
-    model = tf.keras.models.load_model('digit_model.h5')
+    with metrics.model_load('digit_model'):
+        if MODEL_RUNTIME == 'numpy':
+            model = NumpyModel.load('digit_model.npz')
+        else:
+            import tensorflow as tf
+            model = tf.keras.models.load_model('digit_model.h5')
     logger.info("✅ Модель успешно загружена")
 except Exception as e:
     logger.error(f"❌ Ошибка загрузки модели: {e}")
     model = None
 
-def preprocess_image(image_data: str) -> np.ndarray:
-    """Предобработка изображения для модели"""
+def run_model(batch: np.ndarray) -> np.ndarray:
+    """Один проход модели по батчу (n, 28, 28, 1)"""
+    return model.predict(batch, verbose=0)
+
+inference_pool = BoundedExecutor(INFERENCE_EXECUTOR, INFERENCE_WORKERS, INFERENCE_MAX_IN_FLIGHT, INFERENCE_MAX_QUEUE,
+                               name='digit_model')
+batcher = MicroBatcher(run_model, INFERENCE_BATCH_SIZE, INFERENCE_BATCH_WINDOW_MS, metrics=metrics, name='digit_model',
+                       run=inference_pool.submit)
+preprocess_pool = ThreadPoolExecutor(PREPROCESS_WORKERS, thread_name_prefix='preprocess')
+
+def preprocess_image(image_data) -> np.ndarray:
+    """Предобработка изображения для модели: base64-строка (возможно с data URL prefix), байты или открытый файл"""
     try:
-        logger.info("Начало предобработки изображения")
-        
-        # Убираем префикс data:image/png;base64, если есть
-        if ',' in image_data:
-            image_data = image_data.split(',')[1]
-            logger.info("Убран префикс data URL")
-        
-        # Декодируем base64
-        image_bytes = base64.b64decode(image_data)
-        logger.info("Base64 декодирован")
-        
-        # Открываем изображение
-        image = Image.open(io.BytesIO(image_bytes)).convert('L')
-        logger.info("Изображение открыто и конвертировано в grayscale")
-        
-        # Преобразуем в numpy array
-        image_array = np.array(image)
-        logger.info(f"Размер изображения после загрузки: {image_array.shape}")
-        
-        # Инвертируем цвета (белый на черном -> черный на белом)
-        # В MNIST цифры белые на черном фоне, у нас обычно черные на белом
-        image_array = 255 - image_array
-        logger.info("Цвета инвертированы")
-        
-        # Нормализуем пиксели к диапазону [0, 1]
-        image_array = image_array.astype('float32') / 255.0
-        logger.info("Изображение нормализовано")
-        
-        # Добавляем размерности для модели (batch_size, height, width, channels)
-        image_array = image_array.reshape(1, 28, 28, 1)
-        logger.info(f"Финальный размер для модели: {image_array.shape}")
-        
+        with metrics.stage('decode'):
+            if isinstance(image_data, str):
+                # Убираем префикс data:image/png;base64, если есть
+                if ',' in image_data:
+                    image_data = image_data.split(',')[1]
+
+                # Декодируем base64
+                image_data = base64.b64decode(image_data)
+
+            # BytesIO над bytes не копирует буфер; файл из multipart PIL читает сам
+            if isinstance(image_data, bytes):
+                image_data = io.BytesIO(image_data)
+
+            # Открываем изображение в grayscale
+            image = Image.open(image_data).convert('L')
+
+        with metrics.stage('preprocess'):
+            # Преобразуем в numpy array
+            image_array = np.array(image)
+
+            # Инвертируем цвета (белый на черном -> черный на белом)
+            # В MNIST цифры белые на черном фоне, у нас обычно черные на белом
+            image_array = 255 - image_array
+
+            # Нормализуем пиксели к диапазону [0, 1]
+            image_array = image_array.astype('float32') / 255.0
+
+            # Добавляем размерности для модели (batch_size, height, width, channels)
+            image_array = image_array.reshape(1, 28, 28, 1)
+
         return image_array
         
     except Exception as e:
         logger.error(f"Ошибка в preprocess_image: {str(e)}")
         raise
 
+async def preprocess_in_pool(image_data) -> np.ndarray:
+    """preprocess_image в пуле потоков предобработки: декодирование не занимает event loop"""
+    return await asyncio.get_running_loop().run_in_executor(preprocess_pool, preprocess_image, image_data)
+
 @app.get("/")
 async def root():
     return {"message": "Digit Recognition API is running!"}
@@ -87,53 +135,92 @@ async def health_check():
     return {
         "status": "healthy", 
         "model_loaded": model is not None,
+        "runtime": MODEL_RUNTIME,
         "message": "API готов к работе"
     }
 
+@app.get("/batching_stats")
+async def batching_stats():
+    """Размеры батчей, время ожидания в очереди и время прохода модели"""
+    return batcher.stats()
+
+@app.get("/inference_stats")
+async def inference_stats():
+    """Запросы в очереди и в работе, отказы из-за перегрузки, среднее ожидание и время работы модели"""
+    return inference_pool.stats()
+
 @app.post("/predict")
 async def predict_digit(request: PredictionRequest):
     """Основной эндпоинт для предсказания цифры"""
     try:
-        logger.info("Получен запрос на /predict")
-        
         if model is None:
             raise HTTPException(status_code=500, detail="Модель не загружена")
         
         image_data = request.image
         if not image_data:
             raise HTTPException(status_code=400, detail="No image data provided")
-        
-        logger.info(f"Длина image_data: {len(image_data)}")
-        
+
         # Предобработка изображения
-        processed_image = preprocess_image(image_data)
-        
-        # Предсказание
-        logger.info("Начало предсказания...")
-        predictions = model.predict(processed_image, verbose=0)
-        logger.info("Предсказание завершено")
-        
+        processed_image = await preprocess_in_pool(image_data)
+
+        return await classify_digit(processed_image)
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Ошибка в predict_digit: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/predict_raw")
+async def predict_digit_raw(request: Request):
+    """Предсказание цифры без base64 и JSON: тело application/octet-stream с байтами PNG/JPEG
+    или multipart/form-data с файлом в поле image"""
+    try:
+        if model is None:
+            raise HTTPException(status_code=500, detail="Модель не загружена")
+
+        if request.headers.get('content-type', '').startswith('multipart/form-data'):
+            async with request.form(max_files=1) as form:
+                upload = form.get('image')
+                if upload is None or isinstance(upload, str):
+                    raise HTTPException(status_code=400, detail="No image file provided")
+                processed_image = await preprocess_in_pool(upload.file)
+        else:
+            image_bytes = await request.body()
+            if not image_bytes:
+                raise HTTPException(status_code=400, detail="No image data provided")
+            processed_image = await preprocess_in_pool(image_bytes)
+
+        return await classify_digit(processed_image)
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Ошибка в predict_digit_raw: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+async def classify_digit(processed_image: np.ndarray) -> JSONResponse:
+    # Предсказание: изображение уходит в общий батч с другими одновременными запросами, модель считается в пуле
+    with metrics.stage('inference'):
+        async with inference_pool.slot():
+            predictions = await batcher.predict(processed_image)
+
+    with metrics.stage('serialization'):
         # Получаем предсказанную цифру и уверенность
         predicted_digit = int(np.argmax(predictions[0]))
         confidence = float(np.max(predictions[0]))
-        
+
         # Вероятности для всех цифр
         probabilities = {
             str(i): float(predictions[0][i]) for i in range(10)
         }
-        
-        logger.info(f"Предсказанная цифра: {predicted_digit}, уверенность: {confidence:.4f}")
-        
-        return {
+
+        return JSONResponse({
             "success": True,
             "predicted_digit": predicted_digit,
             "confidence": confidence,
             "probabilities": probabilities
-        }
-        
-    except Exception as e:
-        logger.error(f"Ошибка в predict_digit: {str(e)}")
-        raise HTTPException(status_code=500, detail=str(e))
+        })
 
 # Альтернативный эндпоинт для тестирования
 @app.post("/predict_test")
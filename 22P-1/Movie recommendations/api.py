@@ -1,84 +1,218 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.responses import Response, StreamingResponse
+from pydantic import BaseModel, Field
 from scipy.sparse import csr_matrix
-from sklearn.neighbors import NearestNeighbors
-import uvicorn, pandas as pd
+from neighbours import create_neighbours
+from users_pivot import UsersPivot
+from popularity import PopularityStats
+from user_index import UserReviewsIndex
+from similarity_index import SimilarityIndex, dataset_signature
+from factorization import MatrixFactorization
+from snapshot import RecommenderSnapshot
+from ingestion import RatingsIngestor, IngestionError
+from response_cache import ResponseCache
+from responses import encode_json, gzip_body, accepts_gzip
+import ratings_store, shared_snapshot
+import uvicorn, logging, threading, time, os, sys, pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from service_metrics import Metrics
+from bounded_executor import BoundedExecutor
+
+logging.basicConfig(level=logging.INFO)
+# Длительности этапов и счетчики запросов на /metrics (METRICS_ENABLED=0 - выключить)
+metrics = Metrics()
+
+DATASET_PATH = 'datasets/df_films_reviews.csv'
+RATINGS_STORE_PATH = 'datasets/df_films_reviews.store'
+SIMILARITY_INDEX_PATH = 'datasets/same_films_index.npz'
+FACTORIZATION_PATH = 'datasets/factorization'
+# Число латентных факторов для /get_recommended_films/, 0 - матричное разложение выключено
+FACTORIZATION_FACTORS = int(os.environ.get('FACTORIZATION_FACTORS', 32))
+# brute - точный косинус, lsh / ivf - приближенный поиск соседей для больших датасетов
+NEIGHBOURS_BACKEND = os.environ.get('NEIGHBOURS_BACKEND', 'brute')
+MIN_USER_RATINGS = int(os.environ.get('MIN_USER_RATINGS', 1000))
+# Больше одного воркера - снимок строится один раз в SHARED_SNAPSHOT_PATH, воркеры подключают его через mmap.
+# Экономится память самого снимка (на 4 млн оценок - около 30 МБ на воркер); интерпретатор и библиотеки
+# (~115 МБ) у каждого воркера свои, поэтому на маленьком датасете разницы почти нет
+# Новые оценки из /add_ratings/ применяются только в принявшем их воркере, остальные увидят их после перезапуска
+SERVING_WORKERS = int(os.environ.get('SERVING_WORKERS', 1))
+SHARED_SNAPSHOT_PATH = 'datasets/shared_snapshot'
+# Где выполняются тяжелые запросы (соседи, рекомендации, оценки пользователя): inline - прямо в event loop,
+# thread - отдельный пул потоков, process - пул процессов, подключающих общий снимок
+QUERY_EXECUTOR = os.environ.get('QUERY_EXECUTOR', 'thread')
+QUERY_WORKERS = int(os.environ.get('QUERY_WORKERS', os.cpu_count()))
+QUERY_CONCURRENCY = int(os.environ.get('QUERY_CONCURRENCY', QUERY_WORKERS))
+QUERY_QUEUE = int(os.environ.get('QUERY_QUEUE', 256))
+QUERY_TIMEOUT = float(os.environ.get('QUERY_TIMEOUT', 10))
+SHARED_SNAPSHOT = SERVING_WORKERS > 1 or QUERY_EXECUTOR == 'process'
+RESPONSE_CACHE_SIZE = int(os.environ.get('RESPONSE_CACHE_SIZE', 4096))
+RESPONSE_CACHE_TTL = float(os.environ.get('RESPONSE_CACHE_TTL', 3600))
+# Ответы из кэша больше этого размера отдаются в gzip клиентам с Accept-Encoding: gzip
+GZIP_MIN_SIZE = int(os.environ.get('GZIP_MIN_SIZE', 4096))
 
 class RecomendationSystem:
     def __init__(self):
-        self.df_films_reviews = self.load_dataset()
-        self.users_pivot = self.create_users_pivot(self.df_films_reviews)
-        self.film_df_matrix = self.create_csr_matrix(self.users_pivot)
+        self.snapshot = self.load_shared_snapshot() if SHARED_SNAPSHOT else self.create_snapshot(self.load_dataset())
+        self.shared_version = self.snapshot.version if SHARED_SNAPSHOT else None
+        self.update_lock = threading.Lock()
+        self.update_listeners = []
+
+    def __getattr__(self, name):
+        # df_films_reviews, users_pivot, film_df_matrix и т.д. берутся из текущего снимка
+        if name == 'snapshot':
+            raise AttributeError(name)
+        return getattr(self.snapshot, name)
 
     def load_dataset(self) -> pd.DataFrame:
-        return pd.read_csv('datasets/df_films_reviews.csv')
+        with metrics.model_load('ratings_store'):
+            return ratings_store.load_reviews(DATASET_PATH, RATINGS_STORE_PATH)
+
+    def create_snapshot(self, df_films_reviews: pd.DataFrame) -> RecommenderSnapshot:
+        with metrics.model_load('users_pivot'):
+            user_reviews = UserReviewsIndex(df_films_reviews, min_ratings=MIN_USER_RATINGS)
+            users_pivot = self.create_users_pivot(user_reviews)
+            film_df_matrix = self.create_csr_matrix(users_pivot)
+        with metrics.model_load('similarity_index'):
+            similarity_index = self.load_similarity_index(film_df_matrix, users_pivot.columns)
+        with metrics.model_load('user_neighbours'):
+            user_neighbours = create_neighbours(film_df_matrix, NEIGHBOURS_BACKEND)
+        with metrics.model_load('popularity'):
+            popularity = PopularityStats(df_films_reviews)
+        with metrics.model_load('factorization'):
+            factorization = self.load_factorization(users_pivot)
+        return RecommenderSnapshot(df_films_reviews, user_reviews, users_pivot, similarity_index,
+                                   user_neighbours, popularity, factorization=factorization)
     
-    def create_users_pivot(self, df_films_reviews: pd.DataFrame) -> pd.DataFrame:
-        new_df = df_films_reviews[(df_films_reviews['userId'].map(df_films_reviews['userId'].value_counts()) > 1000) | (df_films_reviews['userId'] == 222333)| (df_films_reviews['userId'] == 333222)]
-        users_pivot=new_df.pivot_table(index=["userId"],columns=["title"],values="rating")
-        users_pivot.fillna(0,inplace=True)
-        return users_pivot
+    def load_shared_snapshot(self) -> RecommenderSnapshot:
+        """Подключает общий снимок; если его нет или он устарел - строит, сохраняет и подключает (так память тоже общая)"""
+        signature = dataset_signature(DATASET_PATH)
+        settings = {'min_user_ratings': MIN_USER_RATINGS, 'neighbours_backend': NEIGHBOURS_BACKEND, 'factorization_factors': FACTORIZATION_FACTORS}
+        with metrics.model_load('shared_snapshot'):
+            snapshot = shared_snapshot.attach(SHARED_SNAPSHOT_PATH, signature, settings)
+        if snapshot is None:
+            shared_snapshot.export(self.create_snapshot(self.load_dataset()), SHARED_SNAPSHOT_PATH, signature, settings)
+            with metrics.model_load('shared_snapshot'):
+                snapshot = shared_snapshot.attach(SHARED_SNAPSHOT_PATH, signature, settings)
+        return snapshot
+
+    def create_users_pivot(self, user_reviews: UserReviewsIndex) -> UsersPivot:
+        new_df = user_reviews.eligible_reviews()
+        return UsersPivot.from_reviews(new_df, index='userId', columns='title', values='rating')
     
-    def create_csr_matrix(self, users_pivot: pd.DataFrame) -> csr_matrix:
-        return csr_matrix(users_pivot.values)
+    def create_csr_matrix(self, users_pivot: UsersPivot) -> csr_matrix:
+        return users_pivot.matrix
 
-    def popularite_films(self) -> dict:
-        avg_ratings = self.df_films_reviews.groupby('title')['rating'].mean().reset_index().rename(columns={'rating': 'avg_rating'})
-        avg = pd.DataFrame(avg_ratings).sort_values('avg_rating',ascending=False)
-        cnt_ratings = self.df_films_reviews.groupby('title')['rating'].count().reset_index().rename(columns={'rating': 'count_rating'})
-        cnt=pd.DataFrame(cnt_ratings).sort_values('count_rating',ascending=False)
-        popularite=avg.merge(cnt,on='title')
-        v=popularite["count_rating"]
-        R=popularite["avg_rating"]
-        m=v.quantile(0.90)
-        c=R.mean()
-        popularite['w_score']=((v*R) + (m*c)) / (v+m)
-        return popularite.sort_values('w_score',ascending=False).head(10).reset_index()[['title', 'w_score']]
+    def load_similarity_index(self, film_df_matrix: csr_matrix, titles) -> SimilarityIndex:
+        signature = dataset_signature(DATASET_PATH)
+        similarity_index = SimilarityIndex.load(SIMILARITY_INDEX_PATH, signature)
+        if similarity_index is None:
+            similarity_index = SimilarityIndex.build(film_df_matrix, titles)
+            similarity_index.save(SIMILARITY_INDEX_PATH, signature)
+        return similarity_index
+
+    def load_factorization(self, users_pivot: UsersPivot) -> MatrixFactorization | None:
+        if not FACTORIZATION_FACTORS:
+            return None
+        signature = dataset_signature(DATASET_PATH)
+        # Факторы сохранены вместе с порядком пользователей и фильмов и переставляются под текущую таблицу
+        factorization = MatrixFactorization.load(FACTORIZATION_PATH, signature, users_pivot.index, users_pivot.columns)
+        if factorization is None or factorization.shape != users_pivot.shape or factorization.n_factors != FACTORIZATION_FACTORS:
+            factorization = MatrixFactorization.train(users_pivot.matrix, n_factors=FACTORIZATION_FACTORS)
+            factorization.save(FACTORIZATION_PATH, signature, users_pivot.index, users_pivot.columns)
+        return factorization
+
+    def save_indexes(self):
+        """Сохраняет индексы текущего снимка с подписью CSV, чтобы следующий запуск не строил их заново"""
+        snapshot, signature = self.snapshot, dataset_signature(DATASET_PATH)
+        snapshot.similarity_index.save(SIMILARITY_INDEX_PATH, signature)
+        if snapshot.factorization is not None:
+            snapshot.factorization.save(FACTORIZATION_PATH, signature, snapshot.users_pivot.index, snapshot.users_pivot.columns)
+
+    def film_info(self, title: str):
+        films = self.snapshot.films
+        return films.loc[title] if title in films.index else None
+
+    def apply_ratings(self, new_reviews: pd.DataFrame):
+        """Строит снимок с новыми оценками и подменяет текущий; читатели продолжают работать со старым"""
+        with self.update_lock:
+            self.snapshot = self.snapshot.with_ratings(new_reviews)
+        for listener in self.update_listeners:
+            listener()
+
+    def popularite_films(self) -> pd.DataFrame:
+        return self.snapshot.popularity.popularite_films()
     
     def popularite_films_by_genre(self, genre: str) -> pd.DataFrame:
-        df = self.df_films_reviews[self.df_films_reviews['genres'] == genre]
-        avg_ratings = df.groupby('title')['rating'].mean().reset_index().rename(columns={'rating': 'avg_rating'})
-        avg = pd.DataFrame(avg_ratings).sort_values('avg_rating',ascending=False)
-        cnt_ratings = df.groupby('title')['rating'].count().reset_index().rename(columns={'rating': 'count_rating'})
-        cnt=pd.DataFrame(cnt_ratings).sort_values('count_rating',ascending=False)
-        popularite=avg.merge(cnt,on='title')
-        v=popularite["count_rating"]
-        R=popularite["avg_rating"]
-        m=v.quantile(0.90)
-        c=R.mean()
-        popularite['w_score']=((v*R) + (m*c)) / (v+m)
-        return popularite.sort_values('w_score',ascending=False).head(10).reset_index()[['title', 'w_score']]
+        return self.snapshot.popularity.popularite_films_by_genre(genre)
     
     def same_films(self, name_film):
-        users_vote_film=self.users_pivot[name_film]
-        similar_with=self.users_pivot.corrwith(users_vote_film)
-        similar_with = pd.DataFrame({'title' : similar_with.to_dict().keys(), 'correlation' : similar_with.to_dict().values()})
-        df=similar_with.sort_values('correlation',ascending=False).reset_index(drop=True).iloc[1:11]
-        return df
+        titles, correlations = self.snapshot.similarity_index.similar(name_film)
+        return pd.DataFrame({'title': titles, 'correlation': correlations}, index=range(1, len(titles) + 1))
     
     def find_favorite_films(self, User_id, num_books=10):
-        model_knn = NearestNeighbors(metric='cosine', algorithm='brute')
-        model_knn.fit(self.film_df_matrix)
-        
-        user_index = self.users_pivot.index.get_loc(User_id)
-        
-        distances, indices = model_knn.kneighbors(self.film_df_matrix[user_index], n_neighbors=num_books+1)
+        snapshot = self.snapshot
+        user_index = snapshot.users_pivot.index.get_loc(User_id)
+        neighbour_distances, neighbour_indices = snapshot.user_neighbours.kneighbors(user_index, n_neighbors=num_books)
 
-        favorite_indices = indices[0][1:]
-        favorite_distances = distances[0][1:]
+        # Соседи - строки пользователей, а не фильмов: фильмы ранжируются по оценкам соседей, которых пользователь не оценил
+        favorite_columns, favorite_distances = snapshot.users_pivot.favorite_columns(
+            [user_index], neighbour_indices[None, :], neighbour_distances[None, :], num_books)
+        found = favorite_columns[0] >= 0
+        list_favorite_films = [snapshot.users_pivot.columns[idx] for idx in favorite_columns[0][found]]
+        favorite_films=pd.DataFrame({"favorite films ":list_favorite_films, "distances" : favorite_distances[0][found]})
+        return favorite_films
 
+    def recommended_films(self, User_id, num_books=10):
+        """Рекомендации по матричному разложению: оценка фильма - скалярное произведение факторов пользователя и фильма"""
+        snapshot = self.snapshot
+        if snapshot.factorization is None:
+            raise HTTPException(status_code=503, detail="Матричное разложение выключено (FACTORIZATION_FACTORS=0)")
+        user_index = snapshot.users_pivot.index.get_loc(User_id)
+        scores, indices = snapshot.factorization.recommend(user_index, snapshot.film_df_matrix, top_n=num_books)
+        return pd.DataFrame({"recommended films": snapshot.users_pivot.columns[indices], "score": scores.astype(float)})
 
-        list_favorite_films = [self.users_pivot.columns[idx] for idx in favorite_indices]
-        favorite_films=pd.DataFrame({"favorite films ":list_favorite_films, "distances" : favorite_distances})
-        return favorite_films
+    def find_favorite_films_batch(self, users_id: list, num_books=10) -> dict:
+        snapshot = self.snapshot
+        user_indices = [snapshot.users_pivot.index.get_loc(user_id) for user_id in users_id]
+        distances, indices = snapshot.user_neighbours.kneighbors_batch(user_indices, n_neighbors=num_books)
+        indices, distances = snapshot.users_pivot.favorite_columns(user_indices, indices, distances, num_books)
+        titles, counts = snapshot.users_pivot.column_labels(indices)
+        return {
+            user_id: pd.DataFrame({"favorite films ": titles[i][:counts[i]], "distances": distances[i][:counts[i]]})
+            for i, user_id in enumerate(users_id)
+        }
     
+    def iter_favorite_films(self, users_id: list = None, num_books=10, chunk_size=512):
+        """Рекомендации для многих пользователей: одно матричное произведение на пачку chunk_size пользователей"""
+        snapshot = self.snapshot
+        users_pivot = snapshot.users_pivot
+        users_id = snapshot.user_reviews.eligible_users if users_id is None else users_id
+        for start in range(0, len(users_id), chunk_size):
+            chunk = users_id[start:start + chunk_size]
+            user_indices = users_pivot.index.get_indexer(chunk)
+            known = user_indices >= 0
+            distances, indices = snapshot.user_neighbours.kneighbors_batch(user_indices[known], n_neighbors=num_books)
+            indices, distances = users_pivot.favorite_columns(user_indices[known], indices, distances, num_books)
+            # Названия и расстояния всей пачки - одним переводом в списки, строке остается только срез
+            titles, counts = users_pivot.column_labels(indices)
+            titles, distances = titles.tolist(), distances.tolist()
+            rows = iter(range(len(distances)))
+            for user_id, is_known in zip(chunk, known):
+                if not is_known:
+                    yield {"user_id": user_id, "error": "user not found"}
+                    continue
+                i = next(rows)
+                yield {"user_id": user_id, "favorite films ": titles[i][:counts[i]], "distances": distances[i][:counts[i]]}
+
     def find_rating_films_user(self, User_id):
-        return self.df_films_reviews[self.df_films_reviews['userId'] == User_id][['title', 'year-production', 'genres', 'rating']].sort_values(by='genres')
+        return self.snapshot.user_reviews.reviews(User_id)[['title', 'year-production', 'genres', 'rating']].sort_values(by='genres')
     
     def find_favorite_genres_user(self, User_id):
-        new_df = self.df_films_reviews[self.df_films_reviews['userId'] == User_id]
-        avg_ratings = new_df.groupby('genres')['rating'].mean().reset_index().rename(columns={'rating': 'avg_rating'})
+        new_df = self.snapshot.user_reviews.reviews(User_id)
+        avg_ratings = new_df.groupby('genres', observed=True)['rating'].mean().reset_index().rename(columns={'rating': 'avg_rating'})
         avg = pd.DataFrame(avg_ratings).sort_values('avg_rating',ascending=False)
-        cnt_ratings = new_df.groupby('genres')['rating'].count().reset_index().rename(columns={'rating': 'count_rating'})
+        cnt_ratings = new_df.groupby('genres', observed=True)['rating'].count().reset_index().rename(columns={'rating': 'count_rating'})
         cnt=pd.DataFrame(cnt_ratings).sort_values('count_rating',ascending=False)
         popularite=avg.merge(cnt,on='genres')
         v=popularite["count_rating"]
@@ -89,53 +223,189 @@ class RecomendationSystem:
         return popularite.sort_values('w_score',ascending=False).head(10).reset_index()[['genres', 'w_score']]
     
     def genre_films(self):
-        return self.df_films_reviews['genres'].unique().tolist()
+        return self.snapshot.df_films_reviews['genres'].unique().tolist()
     
     def name_films(self):
-        return self.df_films_reviews['title'].unique().tolist()
+        return self.snapshot.df_films_reviews['title'].unique().tolist()
 
     def users_id(self):
-        new_df = self.df_films_reviews[(self.df_films_reviews['userId'].map(self.df_films_reviews['userId'].value_counts()) > 1000) | (self.df_films_reviews['userId'] == 222333) | (self.df_films_reviews['userId'] == 333222)]
-        return new_df.userId.unique().tolist()
+        return self.snapshot.user_reviews.eligible_users
+
+class NewRating(BaseModel):
+    userId: int
+    title: str
+    rating: float = Field(ge=0.5, le=5)
+    genres: str | None = None
+    year_production: int | None = None
+
+class FavoriteFilmsBatchRequest(BaseModel):
+    users_id: list[int] | None = None
+    num_books: int = Field(default=10, ge=1, le=100)
+
+# Схемы ответов для документации: обработчики отдают готовые байты массивом записей
+class ScoredFilm(BaseModel):
+    title: str
+    w_score: float
+
+class SameFilm(BaseModel):
+    title: str
+    correlation: float
+
+class FavoriteFilm(BaseModel):
+    favorite_films: str = Field(alias='favorite films ')
+    distances: float
+
+class RecommendedFilm(BaseModel):
+    recommended_films: str = Field(alias='recommended films')
+    score: float
+
+class RatedFilm(BaseModel):
+    title: str
+    year_production: int | None = Field(alias='year-production')
+    genres: str
+    rating: float
+
+class GenreScore(BaseModel):
+    genres: str
+    w_score: float
 
 app = FastAPI()
+metrics.instrument(app)
 recomendation_system = RecomendationSystem()
+# Несколько воркеров дописывают общий CSV, но индексы не сохраняют: снимок у каждого свой и не содержит оценок других
+ratings_ingestor = RatingsIngestor(recomendation_system, csv_path=DATASET_PATH, save_indexes=SERVING_WORKERS == 1)
+response_cache = ResponseCache(RESPONSE_CACHE_SIZE, RESPONSE_CACHE_TTL)
+recomendation_system.update_listeners.append(response_cache.clear)
+query_executor = BoundedExecutor(QUERY_EXECUTOR, QUERY_WORKERS, QUERY_CONCURRENCY, QUERY_QUEUE, QUERY_TIMEOUT, name='query')
+
+def run_query(name: str, args: tuple, page: tuple = None) -> tuple:
+    """Вызов метода recomendation_system с сериализацией ответа; функция модуля, чтобы ее можно было передать в пул процессов.
+    page=(offset, limit) - отдается только часть строк таблицы; возвращает (тело, всего строк, длительности этапов)"""
+    start = time.perf_counter()
+    result = getattr(recomendation_system, name)(*args)
+    total = len(result)
+    if page is not None:
+        offset, limit = page
+        result = result.iloc[offset:None if limit is None else offset + limit]
+    computed = time.perf_counter()
+    body = encode_json(result)
+    return body, total, (computed - start, time.perf_counter() - computed)
+
+async def heavy_query(name: str, *args, page: tuple = None) -> Response:
+    # Процессы пула видят снимок с диска; после онлайн-обновлений он устарел, и запрос выполняется в потоке
+    process = recomendation_system.snapshot.version == recomendation_system.shared_version
+    body, total, (inference_seconds, serialization_seconds) = await query_executor.run(run_query, name, args, page, process=process)
+    # Длительности измерены там, где выполнялся запрос (в том числе в процессе пула), и записываются здесь
+    metrics.observe_stage('inference', inference_seconds)
+    metrics.observe_stage('serialization', serialization_seconds)
+    headers = {'X-Total-Count': str(total)} if page is not None else None
+    return Response(body, media_type='application/json', headers=headers)
+
+def cached_response(endpoint: str, compute, *args, accept_encoding: str = None) -> Response:
+    """Ответ из кэша по (эндпоинт, аргументы, версия данных); при промахе результат сериализуется один раз.
+    Большие ответы сжимаются gzip тоже один раз и хранятся в кэше отдельной записью"""
+    key = (endpoint, args, recomendation_system.snapshot.version)
+    body = response_cache.get(key)
+    if body is None:
+        with metrics.stage('inference'):
+            result = compute(*args)
+        with metrics.stage('serialization'):
+            body = encode_json(result)
+        response_cache.put(key, body)
+    if len(body) < GZIP_MIN_SIZE or not accepts_gzip(accept_encoding):
+        return Response(body, media_type='application/json')
+    gzip_key = key + ('gzip',)
+    compressed = response_cache.get(gzip_key)
+    if compressed is None:
+        compressed = gzip_body(body)
+        response_cache.put(gzip_key, compressed)
+    return Response(compressed, media_type='application/json', headers={'Content-Encoding': 'gzip', 'Vary': 'Accept-Encoding'})
+
+@app.get('/get_popularite_films', response_model=list[ScoredFilm])
+async def get_popularite_films():
+    return cached_response('popularite_films', recomendation_system.popularite_films)
+
+@app.get('/get_popularite_films_by_genre/{genre}', response_model=list[ScoredFilm])
+async def get_popularite_films_by_genre(genre: str):
+    return cached_response('popularite_films_by_genre', recomendation_system.popularite_films_by_genre, genre)
+
+@app.get('/get_same_films_by_name/{name_film}', response_model=list[SameFilm])
+async def get_same_films_by_name(name_film: str):
+    return cached_response('same_films', recomendation_system.same_films, name_film)
+
+@app.get('/get_favorite_films/{user_id}', response_model=list[FavoriteFilm])
+async def get_favorite_films(user_id: int):
+    return await heavy_query('find_favorite_films', user_id)
+
+@app.get('/get_recommended_films/{user_id}', response_model=list[RecommendedFilm])
+async def get_recommended_films(user_id: int, num_books: int = 10):
+    return await heavy_query('recommended_films', user_id, num_books)
+
+@app.post('/get_favorite_films_batch/')
+def get_favorite_films_batch(request: FavoriteFilmsBatchRequest):
+    # users_id не передан - рекомендации для всех пользователей из /get_users_id/
+    lines = (encode_json(row) + b'\n' for row in recomendation_system.iter_favorite_films(request.users_id, request.num_books))
+    return StreamingResponse(lines, media_type='application/x-ndjson')
 
-@app.get('/get_popularite_films')
-def get_popularite_films():
-    return recomendation_system.popularite_films()
+@app.get('/get_find_rating_films_user/{user_id}', response_model=list[RatedFilm])
+async def get_find_rating_films_user(user_id: int, offset: int = Query(0, ge=0), limit: int | None = Query(None, ge=1)):
+    # С offset/limit отдается страница, общее число оценок - в заголовке X-Total-Count
+    page = (offset, limit) if offset or limit is not None else None
+    return await heavy_query('find_rating_films_user', user_id, page=page)
 
-@app.get('/get_popularite_films_by_genre/{genre}')
-def get_popularite_films_by_genre(genre: str):
-    return recomendation_system.popularite_films_by_genre(genre)
+@app.get('/get_find_favorite_genres_user/{user_id}', response_model=list[GenreScore])
+async def get_find_favorite_genres_user(user_id: int):
+    return await heavy_query('find_favorite_genres_user', user_id)
 
-@app.get('/get_same_films_by_name/{name_film}')
-def get_same_films_by_name(name_film: str):
-    return recomendation_system.same_films(name_film)
+@app.get('/get_genre_films/', response_model=list[str])
+async def get_genre_films(request: Request):
+    return cached_response('genre_films', recomendation_system.genre_films, accept_encoding=request.headers.get('accept-encoding'))
 
-@app.get('/get_favorite_films/{user_id}')
-def get_favorite_films(user_id: int):
-    return recomendation_system.find_favorite_films(user_id)
+@app.get('/get_name_films/', response_model=list[str])
+async def get_name_films(request: Request):
+    return cached_response('name_films', recomendation_system.name_films, accept_encoding=request.headers.get('accept-encoding'))
 
-@app.get('/get_find_rating_films_user/{user_id}')
-def get_find_rating_films_user(user_id: int):
-    return recomendation_system.find_rating_films_user(user_id)
+@app.get('/get_users_id/', response_model=list[int])
+async def get_users_id(request: Request):
+    return cached_response('users_id', recomendation_system.users_id, accept_encoding=request.headers.get('accept-encoding'))
 
-@app.get('/get_find_favorite_genres_user/{user_id}')
-def get_find_favorite_genres_user(user_id: int):
-    return recomendation_system.find_favorite_genres_user(user_id)
+@app.post('/add_ratings/')
+def add_ratings(ratings: list[NewRating], wait: bool = False):
+    rows = []
+    for rating in ratings:
+        film = recomendation_system.film_info(rating.title)
+        if film is None and rating.genres is None:
+            raise HTTPException(status_code=400, detail=f"Неизвестный фильм '{rating.title}': укажите genres")
+        rows.append({
+            'userId': rating.userId,
+            'title': rating.title,
+            'year-production': rating.year_production if film is None else film['year-production'],
+            'genres': rating.genres if film is None else film['genres'],
+            'rating': rating.rating,
+        })
+    seq = ratings_ingestor.submit(pd.DataFrame(rows))
+    if wait:
+        try:
+            ratings_ingestor.wait(seq)
+        except IngestionError as e:
+            raise HTTPException(status_code=500, detail=str(e))
+    return {'accepted': len(rows), **ratings_ingestor.stats()}
 
-@app.get('/get_genre_films/')
-def get_genre_films():
-    return recomendation_system.genre_films()
+@app.get('/worker_memory/')
+async def get_worker_memory():
+    return {'version': recomendation_system.snapshot.version, **shared_snapshot.memory_usage()}
 
-@app.get('/get_name_films/')
-def get_name_films():
-    return recomendation_system.name_films()
+@app.get('/executor_stats/')
+async def get_executor_stats():
+    return query_executor.stats()
 
-@app.get('/get_users_id/')
-def get_users_id():
-    return recomendation_system.users_id()
+@app.get('/cache_stats/')
+async def get_cache_stats():
+    return {'version': recomendation_system.snapshot.version, **response_cache.stats()}
 
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    if SERVING_WORKERS > 1:
+        # Снимок уже построен при импорте этого модуля, воркеры только подключают его
+        uvicorn.run("api:app", host="0.0.0.0", port=8000, workers=SERVING_WORKERS)
+    else:
+        uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
@@ -0,0 +1,598 @@
+import argparse, os, sys, time, tempfile, importlib, resource, subprocess, tracemalloc, threading
+import numpy as np, pandas as pd
+
+GENRES = ['Drama', 'Comedy', 'Action', 'Thriller', 'Horror', 'Documentary', 'Adventure', 'Crime', 'Animation', 'Romance']
+
+
+def make_synthetic_reviews(n_users: int = 3000, n_titles: int = 2000, n_ratings: int = 1_000_000, n_tastes: int = 20, seed: int = 42) -> pd.DataFrame:
+    """Синтетический датасет в формате df_films_reviews.csv (userId, title, year-production, genres, rating).
+    У пользователей есть "вкусы": чаще и выше они оценивают фильмы своей группы, иначе соседи были бы случайными"""
+    rng = np.random.default_rng(seed)
+    user_weights = rng.pareto(1.2, n_users) + 1
+    title_weights = 1 / np.arange(1, n_titles + 1) ** 0.8
+    user_taste = rng.integers(n_tastes, size=n_users)
+    title_taste = rng.integers(n_tastes, size=n_titles)
+    titles_by_taste = np.argsort(title_taste, kind='stable')
+    taste_offsets = np.searchsorted(title_taste[titles_by_taste], np.arange(n_tastes + 1))
+
+    users = rng.choice(n_users, n_ratings, p=user_weights / user_weights.sum())
+    titles = rng.choice(n_titles, n_ratings, p=title_weights / title_weights.sum())
+    own_taste = rng.random(n_ratings) < 0.7
+    taste = user_taste[users[own_taste]]
+    sizes = taste_offsets[taste + 1] - taste_offsets[taste]
+    titles[own_taste] = titles_by_taste[taste_offsets[taste] + (rng.random(len(taste)) * sizes).astype(int)]
+    df = pd.DataFrame({'userId': users + 1, 'title_id': titles}).drop_duplicates()
+
+    # Тестовые пользователи, которые всегда попадают в сводную таблицу
+    test_users = pd.DataFrame({
+        'userId': np.repeat([222333, 333222], 100),
+        'title_id': np.concatenate([rng.choice(n_titles, 100, replace=False) for _ in range(2)]),
+    })
+    df = pd.concat([df, test_users], ignore_index=True)
+
+    user_taste = dict(zip(np.arange(n_users) + 1, user_taste))
+    liked = df['userId'].map(user_taste).to_numpy() == title_taste[df['title_id']]
+    ratings = np.clip(np.round((np.where(liked, 4.0, 2.5) + rng.normal(0, 0.8, len(df))) * 2) / 2, 0.5, 5)
+
+    title_names = np.array([f'Film {i}' for i in range(n_titles)])
+    years = rng.integers(1950, 2024, n_titles)
+    genres = rng.choice(GENRES, n_titles)
+    return pd.DataFrame({
+        'userId': df['userId'].to_numpy(),
+        'title': title_names[df['title_id']],
+        'year-production': years[df['title_id']],
+        'genres': genres[df['title_id']],
+        'rating': ratings,
+    })
+
+
+def prepare_workdir(args) -> str:
+    """Создает рабочую папку с datasets/df_films_reviews.csv и переходит в нее"""
+    workdir = args.workdir or tempfile.mkdtemp(prefix='movie_bench_')
+    os.makedirs(os.path.join(workdir, 'datasets'), exist_ok=True)
+    csv_path = os.path.join(workdir, 'datasets', 'df_films_reviews.csv')
+    if not os.path.exists(csv_path):
+        make_synthetic_reviews(args.users, args.titles, args.ratings).to_csv(csv_path, index=False)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    os.chdir(workdir)
+    return workdir
+
+
+def load_api():
+    start = time.perf_counter()
+    api = importlib.import_module('api')
+    print(f'Запуск RecomendationSystem: {time.perf_counter() - start:.2f} c')
+    return api
+
+
+def timeit(func, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat
+
+
+def rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def legacy_create_users_pivot(df_films_reviews: pd.DataFrame) -> pd.DataFrame:
+    new_df = df_films_reviews[(df_films_reviews['userId'].map(df_films_reviews['userId'].value_counts()) > 1000) | (df_films_reviews['userId'] == 222333) | (df_films_reviews['userId'] == 333222)]
+    users_pivot = new_df.pivot_table(index=["userId"], columns=["title"], values="rating")
+    users_pivot.fillna(0, inplace=True)
+    return users_pivot
+
+
+def legacy_same_films(users_pivot: pd.DataFrame, name_film):
+    users_vote_film = users_pivot[name_film]
+    similar_with = users_pivot.corrwith(users_vote_film)
+    similar_with = pd.DataFrame({'title': similar_with.to_dict().keys(), 'correlation': similar_with.to_dict().values()})
+    return similar_with.sort_values('correlation', ascending=False).reset_index(drop=True).iloc[1:11]
+
+
+def bench_similarity(args):
+    api = load_api()
+    system = api.recomendation_system
+    index = system.similarity_index
+    print(f'Индекс: построение {index.build_seconds:.2f} c, размер {index.nbytes / 2**20:.2f} МБ')
+
+    users_pivot = system.users_pivot.to_dense()
+    titles = list(users_pivot.columns[:args.repeat])
+    legacy = timeit(lambda: [legacy_same_films(users_pivot, title) for title in titles], 1) / len(titles)
+    lookup = timeit(lambda: [system.same_films(title) for title in titles], 1) / len(titles)
+    print(f'same_films: corrwith {legacy * 1000:.2f} мс, индекс {lookup * 1000:.3f} мс')
+
+    title = titles[0]
+    expected = legacy_same_films(users_pivot, title)['correlation'].to_numpy()
+    actual = system.same_films(title)['correlation'].to_numpy()
+    n = min(len(expected), len(actual))
+    print(f'Максимальное расхождение корреляций: {np.nanmax(np.abs(expected[:n] - actual[:n])):.2e}')
+
+
+def legacy_find_favorite_films(film_df_matrix, users_pivot, User_id, num_books=10):
+    from sklearn.neighbors import NearestNeighbors
+    model_knn = NearestNeighbors(metric='cosine', algorithm='brute')
+    model_knn.fit(film_df_matrix)
+    user_index = users_pivot.index.get_loc(User_id)
+    distances, indices = model_knn.kneighbors(film_df_matrix[user_index], n_neighbors=num_books+1)
+    return indices[0][1:], distances[0][1:]
+
+
+def bench_neighbours(args):
+    api = load_api()
+    system = api.recomendation_system
+    users_id = list(system.users_pivot.index)
+    sample = users_id[:args.repeat]
+
+    legacy = timeit(lambda: [legacy_find_favorite_films(system.film_df_matrix, system.users_pivot, user_id) for user_id in sample], 1) / len(sample)
+    fitted = timeit(lambda: [system.find_favorite_films(user_id) for user_id in sample], 1) / len(sample)
+    batch = timeit(lambda: system.find_favorite_films_batch(users_id), 1) / len(users_id)
+    print(f'find_favorite_films: NearestNeighbors {legacy * 1000:.2f} мс, '
+          f'нормированная матрица {fitted * 1000:.2f} мс, пакетно {batch * 1000:.3f} мс на пользователя')
+    rows = np.arange(len(users_id))
+    knn = timeit(lambda: system.user_neighbours.kneighbors_batch(rows, 10), 1)
+    distances, indices = system.user_neighbours.kneighbors_batch(rows, 10)
+    ranking = timeit(lambda: system.users_pivot.favorite_columns(rows, indices, distances, 10), 1)
+    print(f'Пакет из {len(rows)} пользователей по этапам: соседи {knn:.3f} c, ранжирование фильмов {ranking:.3f} c')
+
+    actual, _ = system.user_neighbours.kneighbors(system.users_pivot.index.get_loc(sample[0]), 10)
+    _, expected_distances = legacy_find_favorite_films(system.film_df_matrix, system.users_pivot, sample[0])
+    print(f'Максимальное расхождение расстояний до соседей: {np.abs(expected_distances - actual).max():.2e}')
+    favorites = system.find_favorite_films_batch(users_id)
+    repeated = sum(films['favorite films '].duplicated().any() for films in favorites.values())
+    print(f'Пользователей с повторами в любимых фильмах: {repeated} из {len(users_id)}')
+
+
+def bench_pivot(args):
+    """Пиковый RSS построения сводной таблицы: каждый вариант в отдельном процессе"""
+    for mode in ('legacy', 'sparse'):
+        output = subprocess.run([sys.executable, os.path.abspath(__file__), 'pivot-worker', '--mode', mode, '--workdir', os.getcwd()],
+                                capture_output=True, text=True, check=True).stdout
+        print(output.strip())
+
+
+def bench_pivot_worker(args):
+    from scipy.sparse import csr_matrix
+    from users_pivot import UsersPivot
+    df_films_reviews = pd.read_csv('datasets/df_films_reviews.csv')
+    # ru_maxrss включает пик разбора CSV, поэтому пик самого построения считаем через tracemalloc
+    tracemalloc.start()
+    start = time.perf_counter()
+    if args.mode == 'legacy':
+        film_df_matrix = csr_matrix(legacy_create_users_pivot(df_films_reviews).values)
+    else:
+        new_df = df_films_reviews[(df_films_reviews['userId'].map(df_films_reviews['userId'].value_counts()) > 1000) | (df_films_reviews['userId'] == 222333) | (df_films_reviews['userId'] == 333222)]
+        film_df_matrix = UsersPivot.from_reviews(new_df).matrix
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    print(f'{args.mode}: матрица {film_df_matrix.shape}, nnz={film_df_matrix.nnz}, {elapsed:.2f} c, '
+          f'пик памяти построения {peak / 2**20:.0f} МБ, пиковый RSS процесса {rss_mb():.0f} МБ')
+
+
+def bench_store(args):
+    import ratings_store
+    csv_path, store_dir = 'datasets/df_films_reviews.csv', 'datasets/df_films_reviews.store'
+    read_csv = timeit(lambda: pd.read_csv(csv_path), 1)
+    convert = timeit(lambda: ratings_store.convert(csv_path, store_dir), 1)
+    load = timeit(lambda: ratings_store.load(store_dir), args.repeat)
+    size = sum(os.path.getsize(os.path.join(store_dir, name)) for name in os.listdir(store_dir))
+    print(f'pd.read_csv {read_csv:.2f} c, конвертация {convert:.2f} c, загрузка memory-map {load * 1000:.2f} мс')
+    print(f'CSV {os.path.getsize(csv_path) / 2**20:.1f} МБ, хранилище {size / 2**20:.1f} МБ')
+
+
+def legacy_popularite_films(df: pd.DataFrame) -> pd.DataFrame:
+    avg_ratings = df.groupby('title', observed=True)['rating'].mean().reset_index().rename(columns={'rating': 'avg_rating'})
+    cnt_ratings = df.groupby('title', observed=True)['rating'].count().reset_index().rename(columns={'rating': 'count_rating'})
+    popularite = avg_ratings.sort_values('avg_rating', ascending=False).merge(cnt_ratings, on='title')
+    v = popularite["count_rating"]
+    R = popularite["avg_rating"]
+    m = v.quantile(0.90)
+    c = R.mean()
+    popularite['w_score'] = ((v * R) + (m * c)) / (v + m)
+    return popularite.sort_values('w_score', ascending=False).head(10).reset_index()[['title', 'w_score']]
+
+
+def bench_popularity(args):
+    from popularity import PopularityStats
+    api = load_api()
+    system = api.recomendation_system
+    df = system.df_films_reviews
+    genre = system.genre_films()[0]
+
+    legacy = timeit(lambda: legacy_popularite_films(df), args.repeat)
+    legacy_genre = timeit(lambda: legacy_popularite_films(df[df['genres'] == genre]), args.repeat)
+    cached = timeit(system.popularite_films, args.repeat)
+    cached_genre = timeit(lambda: system.popularite_films_by_genre(genre), args.repeat)
+    print(f'popularite_films: groupby {legacy * 1000:.2f} мс, агрегаты {cached * 1000:.4f} мс')
+    print(f'popularite_films_by_genre: groupby {legacy_genre * 1000:.2f} мс, агрегаты {cached_genre * 1000:.4f} мс')
+
+    build = timeit(lambda: PopularityStats(df), 1)
+    new_reviews = df.sample(1000, random_state=0)
+    add = timeit(lambda: system.popularity.add(new_reviews), 1)
+    print(f'Построение агрегатов {build * 1000:.0f} мс, добавление 1000 оценок {add * 1000:.1f} мс')
+
+
+def bench_users(args):
+    api = load_api()
+    system = api.recomendation_system
+    df = system.df_films_reviews
+    users_id = system.users_id()[:args.repeat]
+
+    def legacy_click():
+        for user_id in users_id:
+            df[df['userId'] == user_id][['title', 'year-production', 'genres', 'rating']].sort_values(by='genres')
+            df[df['userId'] == user_id].groupby('genres', observed=True)['rating'].mean()
+        new_df = df[(df['userId'].map(df['userId'].value_counts()) > 1000) | (df['userId'] == 222333) | (df['userId'] == 333222)]
+        new_df.userId.unique().tolist()
+
+    def indexed_click():
+        for user_id in users_id:
+            system.find_rating_films_user(user_id)
+            system.find_favorite_genres_user(user_id)
+        system.users_id()
+
+    legacy = timeit(legacy_click, 1) / len(users_id)
+    indexed = timeit(indexed_click, 1) / len(users_id)
+    print(f'Запросы по пользователю: маска по всему датасету {legacy * 1000:.2f} мс, индекс по userId {indexed * 1000:.2f} мс')
+
+
+def percentiles(latencies) -> str:
+    p50, p95, p99 = np.percentile(np.asarray(latencies) * 1000, [50, 95, 99])
+    return f'p50 {p50:.2f} мс, p95 {p95:.2f} мс, p99 {p99:.2f} мс'
+
+
+def bench_ingest(args):
+    """Пропускная способность приёма оценок, пока читающие потоки нагружают запросы"""
+    api = load_api()
+    system, ingestor = api.recomendation_system, api.ratings_ingestor
+    ingestor.csv_path = None
+    users_id = system.users_id()
+    titles = system.name_films()
+    films = system.snapshot.films
+    rng = np.random.default_rng(0)
+
+    stop = threading.Event()
+    latencies = []
+
+    def reader():
+        while not stop.is_set():
+            user_id = users_id[rng.integers(len(users_id))]
+            start = time.perf_counter()
+            system.find_favorite_films(user_id)
+            system.same_films(titles[rng.integers(len(titles))])
+            system.popularite_films()
+            latencies.append(time.perf_counter() - start)
+
+    readers = [threading.Thread(target=reader) for _ in range(args.concurrency)]
+    for thread in readers:
+        thread.start()
+
+    batch_titles = rng.choice(np.asarray(titles, dtype=object), (args.repeat, args.batch))
+    start = time.perf_counter()
+    for i in range(args.repeat):
+        new_reviews = pd.DataFrame({
+            'userId': rng.choice(users_id, args.batch),
+            'title': batch_titles[i],
+            'year-production': films.loc[batch_titles[i], 'year-production'].to_numpy(),
+            'genres': films.loc[batch_titles[i], 'genres'].astype(str).to_numpy(),
+            'rating': rng.integers(1, 11, args.batch) / 2,
+        })
+        seq = ingestor.submit(new_reviews)
+    ingestor.wait(seq)
+    elapsed = time.perf_counter() - start
+    stop.set()
+    for thread in readers:
+        thread.join()
+
+    print(f'Приём: {args.repeat * args.batch} оценок за {elapsed:.2f} c ({args.repeat * args.batch / elapsed:.0f} оценок/c), '
+          f'версия снимка {system.snapshot.version}, последнее обновление {ingestor.last_refresh_seconds:.2f} c')
+    print(f'Запросы во время приёма ({args.concurrency} потоков, {len(latencies)} запросов): {percentiles(latencies)}')
+
+
+def bench_batch(args):
+    """/get_favorite_films/{user_id} по одному пользователю против /get_favorite_films_batch/ (NDJSON)"""
+    from fastapi.testclient import TestClient
+    api = load_api()
+    client = TestClient(api.app, raise_server_exceptions=False)
+    users_id = api.recomendation_system.users_id()
+    sample = users_id[:args.repeat]
+
+    statuses = []
+    single = timeit(lambda: statuses.extend(client.get(f'/get_favorite_films/{user_id}').status_code for user_id in sample), 1) / len(sample)
+    lines = []
+    batch = timeit(lambda: lines.extend(client.post('/get_favorite_films_batch/', json={'users_id': None}).iter_lines()), 1) / len(users_id)
+    print(f'По одному: {single * 1000:.2f} мс на пользователя (коды ответов {sorted(set(statuses))})')
+    print(f'Пакетно: {batch * 1000:.3f} мс на пользователя ({len(lines)} строк NDJSON), ускорение x{single / batch:.0f}')
+
+
+ANN_CONFIGS = [
+    ('brute', {}),
+    ('lsh', {'n_tables': 10, 'n_bits': 8}),
+    ('lsh', {'n_tables': 20, 'n_bits': 8}),
+    ('lsh', {'n_tables': 20, 'n_bits': 6}),
+    ('ivf', {'n_probe': 2}),
+    ('ivf', {'n_probe': 8}),
+    ('ivf', {'n_probe': 32}),
+]
+
+
+def bench_ann(args):
+    """recall@10 и задержка приближенных алгоритмов против точного перебора (сводная таблица с MIN_USER_RATINGS=--min-ratings)"""
+    from neighbours import create_neighbours
+    os.environ['MIN_USER_RATINGS'] = str(args.min_ratings)
+    api = load_api()
+    film_df_matrix = api.recomendation_system.film_df_matrix
+    print(f'Матрица пользователи × фильмы: {film_df_matrix.shape}, nnz={film_df_matrix.nnz}')
+    sample = np.random.default_rng(0).choice(film_df_matrix.shape[0], min(args.repeat * 10, film_df_matrix.shape[0]), replace=False)
+
+    exact = None
+    for backend, params in ANN_CONFIGS:
+        start = time.perf_counter()
+        neighbours = create_neighbours(film_df_matrix, backend, **params)
+        build = time.perf_counter() - start
+        latencies = []
+        found = []
+        for user_index in sample:
+            start = time.perf_counter()
+            found.append(neighbours.kneighbors(user_index, 10)[1])
+            latencies.append(time.perf_counter() - start)
+        if exact is None:
+            exact = found
+        recall = np.mean([len(np.intersect1d(a, b)) / len(b) for a, b in zip(found, exact)])
+        print(f'{backend:5} {str(params):32} построение {build:6.2f} c, recall@10 {recall:.3f}, {percentiles(latencies)}')
+
+
+def bench_cache(args):
+    from fastapi.testclient import TestClient
+    api = load_api()
+    client = TestClient(api.app)
+    genre = api.recomendation_system.genre_films()[0]
+    title = api.recomendation_system.name_films()[0]
+    for path in ['/get_name_films/', '/get_genre_films/', '/get_popularite_films', f'/get_popularite_films_by_genre/{genre}', f'/get_same_films_by_name/{title}']:
+        def miss():
+            api.response_cache.clear()
+            client.get(path)
+        cold = timeit(miss, args.repeat)
+        warm = timeit(lambda: client.get(path), args.repeat)
+        print(f'{path}: без кэша {cold * 1000:.2f} мс, из кэша {warm * 1000:.2f} мс')
+    print(api.response_cache.stats())
+
+
+def hit_rate(recommended: np.ndarray, held_out: np.ndarray) -> float:
+    return float(np.mean([title in row for row, title in zip(recommended, held_out)]))
+
+
+def bench_mf(args):
+    """Матричное разложение против соседей find_favorite_films: обучение, задержка, память и hit-rate@10 (leave-one-out)"""
+    from factorization import MatrixFactorization
+    from neighbours import UserNeighbours
+    from scipy.sparse import csr_matrix
+    os.environ['MIN_USER_RATINGS'] = str(args.min_ratings)
+    api = load_api()
+    film_df_matrix = api.recomendation_system.film_df_matrix
+    print(f'Матрица пользователи × фильмы: {film_df_matrix.shape}, nnz={film_df_matrix.nnz}')
+
+    # Для части пользователей прячем одну высокую оценку и проверяем, попадет ли фильм в top-10
+    rng = np.random.default_rng(0)
+    liked = film_df_matrix.multiply(film_df_matrix >= 4).tocsr()
+    candidates = np.flatnonzero((np.diff(liked.indptr) > 0) & (np.diff(film_df_matrix.indptr) > 1))
+    sample = rng.choice(candidates, min(args.repeat * 10, len(candidates)), replace=False)
+    held_out = np.array([rng.choice(liked.indices[liked.indptr[row]:liked.indptr[row + 1]]) for row in sample])
+    train = film_df_matrix.tolil()
+    train[sample, held_out] = 0
+    train = csr_matrix(train)
+    train.eliminate_zeros()
+
+    start = time.perf_counter()
+    neighbours = UserNeighbours(train)
+    knn_build = time.perf_counter() - start
+    _, neighbour_rows = neighbours.kneighbors_batch(sample, 10)
+    knn_scores = np.vstack([np.asarray(train[rows].sum(axis=0)) for rows in neighbour_rows])
+    rated = train[sample].tocoo()
+    knn_scores[rated.row, rated.col] = -np.inf
+    knn_top = np.argsort(-knn_scores, axis=1)[:, :10]
+    knn_bytes = sum(m.data.nbytes + m.indices.nbytes + m.indptr.nbytes for m in (neighbours.normalized, neighbours.normalized_t))
+    knn_latency = timeit(lambda: [neighbours.kneighbors(row, 10) for row in sample[:args.repeat]], 1) / min(args.repeat, len(sample))
+    print(f'Соседи (find_favorite_films): построение {knn_build:.2f} c, {knn_latency * 1000:.2f} мс на пользователя, '
+          f'{knn_bytes / 2 ** 20:.1f} МБ, hit-rate@10 {hit_rate(knn_top, held_out):.3f} (фильмы 10 соседей)')
+
+    for n_factors in [16, 32, 64]:
+        factorization = MatrixFactorization.train(train, n_factors=n_factors)
+        _, mf_top = factorization.recommend_batch(sample, train, 10)
+        mf_latency = timeit(lambda: [factorization.recommend(row, train, 10) for row in sample[:args.repeat]], 1) / min(args.repeat, len(sample))
+        print(f'ALS {n_factors:3} факторов: обучение {factorization.train_seconds:.2f} c, {mf_latency * 1000:.2f} мс на пользователя, '
+              f'{factorization.nbytes / 2 ** 20:.1f} МБ, hit-rate@10 {hit_rate(mf_top, held_out):.3f}')
+
+
+def bench_workers(args):
+    """Запуск --concurrency воркеров: у каждого свой снимок против общего снимка через mmap (время запуска и память)"""
+    import json, shutil
+    os.environ['MIN_USER_RATINGS'] = str(args.min_ratings)
+    shutil.rmtree('datasets/shared_snapshot', ignore_errors=True)
+    for serving_workers in (1, args.concurrency):
+        env = dict(os.environ, SERVING_WORKERS=str(serving_workers))
+        if serving_workers > 1:
+            # Как при python api.py: снимок строит главный процесс до запуска воркеров
+            start = time.perf_counter()
+            subprocess.run([sys.executable, os.path.abspath(__file__), 'worker-process', '--workdir', os.getcwd()],
+                           env=env, input='', capture_output=True, check=True)
+            print(f'Построение общего снимка: {time.perf_counter() - start:.2f} c')
+        workers = [subprocess.Popen([sys.executable, os.path.abspath(__file__), 'worker-process', '--workdir', os.getcwd()],
+                                    env=env, stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+                   for _ in range(args.concurrency)]
+        # Все воркеры живы одновременно, иначе PSS не покажет разделение страниц
+        reports = [json.loads(next(line for line in worker.stdout if line.startswith('{'))) for worker in workers]
+        for worker in workers:
+            worker.communicate('')
+        mode = 'общий снимок' if serving_workers > 1 else 'свой снимок'
+        for report in reports:
+            print(f"{mode}: pid {report['pid']}, запуск {report['startup_seconds']:.2f} c, RSS {report.get('rss_mb', 0):.0f} МБ, "
+                  f"PSS {report.get('pss_mb', 0):.0f} МБ, общая {report.get('shared_mb', 0):.0f} МБ, приватная {report.get('private_mb', 0):.0f} МБ")
+        print(f"{mode}: суммарный PSS {args.concurrency} воркеров {sum(report.get('pss_mb', 0) for report in reports):.0f} МБ")
+
+
+def bench_worker_process(args):
+    import json
+    start = time.perf_counter()
+    api = load_api()
+    startup = time.perf_counter() - start
+    system = api.recomendation_system
+    # Запросы ко всем структурам снимка, чтобы их страницы попали в память процесса
+    for user_id in system.users_id()[:args.repeat]:
+        system.find_rating_films_user(user_id)
+        system.find_favorite_genres_user(user_id)
+        system.recommended_films(user_id)
+        system.find_favorite_films_batch([user_id])
+    for title in system.name_films()[:args.repeat]:
+        system.same_films(title)
+    system.popularite_films()
+    print(json.dumps({'startup_seconds': startup, **api.shared_snapshot.memory_usage()}), flush=True)
+    sys.stdin.read()
+
+
+def bench_executor(args):
+    """Задержка дешевого /get_genre_films/ под нагрузкой тяжелыми запросами для каждого QUERY_EXECUTOR"""
+    for mode in ('inline', 'thread', 'process'):
+        env = dict(os.environ, QUERY_EXECUTOR=mode, MIN_USER_RATINGS=str(args.min_ratings))
+        output = subprocess.run([sys.executable, os.path.abspath(__file__), 'executor-server', '--workdir', os.getcwd(),
+                                 '--concurrency', str(args.concurrency), '--repeat', str(args.repeat)],
+                                env=env, capture_output=True, text=True, check=True).stdout
+        print('\n'.join(line for line in output.splitlines() if line.startswith(mode)))
+
+
+def bench_executor_server(args):
+    import httpx, socket, uvicorn
+    api = load_api()
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(api.app, host='127.0.0.1', port=port, log_level='warning'))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    base_url = f'http://127.0.0.1:{port}'
+
+    # Тяжелые запросы - пользователи с наибольшим числом оценок
+    user_reviews = api.recomendation_system.snapshot.user_reviews
+    eligible = np.array(api.recomendation_system.users_id())
+    heavy_users = eligible[np.argsort(-user_reviews.counts[np.searchsorted(user_reviews.users, eligible)])][:50].tolist()
+    stop = threading.Event()
+    heavy_latencies = []
+
+    def heavy_load():
+        with httpx.Client(base_url=base_url, timeout=60) as client:
+            i = 0
+            while not stop.is_set():
+                user_id = heavy_users[i % len(heavy_users)]
+                path = f'/get_find_favorite_genres_user/{user_id}' if i % 2 else f'/get_recommended_films/{user_id}'
+                start = time.perf_counter()
+                client.get(path)
+                heavy_latencies.append(time.perf_counter() - start)
+                i += 1
+
+    with httpx.Client(base_url=base_url, timeout=60) as client:
+        client.get('/get_genre_films/')
+        client.get(f'/get_recommended_films/{heavy_users[0]}')
+        idle = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            client.get('/get_genre_films/')
+            idle.append(time.perf_counter() - start)
+
+        threads = [threading.Thread(target=heavy_load) for _ in range(args.concurrency)]
+        for thread in threads:
+            thread.start()
+        time.sleep(0.5)
+        loaded = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            client.get('/get_genre_films/')
+            loaded.append(time.perf_counter() - start)
+            time.sleep(0.01)
+        stop.set()
+        for thread in threads:
+            thread.join()
+        executor_stats = client.get('/executor_stats/').json()
+
+    mode = api.QUERY_EXECUTOR
+    print(f'{mode}: /get_genre_films/ без нагрузки {percentiles(idle)}')
+    print(f'{mode}: /get_genre_films/ при {args.concurrency} потоках тяжелых запросов {percentiles(loaded)}')
+    print(f'{mode}: тяжелые запросы {percentiles(heavy_latencies)}, {len(heavy_latencies)} шт.; '
+          f"max очередь {executor_stats['max_queue_depth']}, среднее ожидание {executor_stats['avg_wait_ms']:.1f} мс")
+    server.should_exit = True
+
+
+def bench_serialization(args):
+    """Стоимость сериализации ответа каждого эндпоинта: jsonable_encoder + json (как FastAPI для DataFrame) против responses.encode_json"""
+    import json
+    from fastapi.encoders import jsonable_encoder
+    from responses import encode_json, gzip_body
+    os.environ['MIN_USER_RATINGS'] = str(args.min_ratings)
+    api = load_api()
+    system = api.recomendation_system
+    user_reviews = system.snapshot.user_reviews
+    eligible = np.array(system.users_id())
+    heavy_user = int(eligible[np.argmax(user_reviews.counts[np.searchsorted(user_reviews.users, eligible)])])
+    endpoints = {
+        'get_popularite_films': system.popularite_films(),
+        'get_popularite_films_by_genre': system.popularite_films_by_genre(system.genre_films()[0]),
+        'get_same_films_by_name': system.same_films(system.name_films()[0]),
+        'get_recommended_films': system.recommended_films(heavy_user),
+        'get_find_rating_films_user': system.find_rating_films_user(heavy_user),
+        'get_find_favorite_genres_user': system.find_favorite_genres_user(heavy_user),
+        'get_genre_films': system.genre_films(),
+        'get_name_films': system.name_films(),
+        'get_users_id': system.users_id(),
+    }
+
+    def legacy(result):
+        return json.dumps(jsonable_encoder(result), ensure_ascii=False, allow_nan=False, separators=(',', ':')).encode('utf-8')
+
+    for name, result in endpoints.items():
+        try:
+            legacy_body = legacy(result)
+            legacy_time = f'{timeit(lambda: legacy(result), args.repeat) * 1000:8.3f} мс, {len(legacy_body) / 1024:7.1f} КБ'
+        except (TypeError, ValueError) as e:
+            # Типы NumPy в DataFrame jsonable_encoder не сериализует - так эндпоинт отвечал 500
+            legacy_time = f'ошибка ({type(e).__name__})'
+        body = encode_json(result)
+        new_time = timeit(lambda: encode_json(result), args.repeat)
+        print(f'{name:30} было: {legacy_time:28} стало: {new_time * 1000:7.3f} мс, {len(body) / 1024:7.1f} КБ, '
+              f'gzip {len(gzip_body(body)) / 1024:6.1f} КБ')
+
+
+BENCHMARKS = {
+    'similarity': bench_similarity,
+    'neighbours': bench_neighbours,
+    'pivot': bench_pivot,
+    'pivot-worker': bench_pivot_worker,
+    'store': bench_store,
+    'popularity': bench_popularity,
+    'users': bench_users,
+    'ingest': bench_ingest,
+    'batch': bench_batch,
+    'ann': bench_ann,
+    'cache': bench_cache,
+    'mf': bench_mf,
+    'workers': bench_workers,
+    'worker-process': bench_worker_process,
+    'executor': bench_executor,
+    'executor-server': bench_executor_server,
+    'serialization': bench_serialization,
+}
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Бенчмарки системы рекомендаций фильмов')
+    parser.add_argument('benchmark', choices=BENCHMARKS)
+    parser.add_argument('--workdir', help='папка с datasets/df_films_reviews.csv (по умолчанию синтетический датасет)')
+    parser.add_argument('--users', type=int, default=3000)
+    parser.add_argument('--titles', type=int, default=2000)
+    parser.add_argument('--ratings', type=int, default=1_000_000)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--mode', default='sparse')
+    parser.add_argument('--batch', type=int, default=1000)
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--min-ratings', type=int, default=20)
+    args = parser.parse_args()
+    prepare_workdir(args)
+    BENCHMARKS[args.benchmark](args)
@@ -0,0 +1,164 @@
+import os, json, time, logging
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np, pandas as pd
+from scipy.sparse import csr_matrix
+
+logger = logging.getLogger(__name__)
+
+
+class MatrixFactorization:
+    """Матричное разложение оценок R ≈ U·Vᵀ (ALS); рекомендации - одно скалярное произведение на пользователя"""
+
+    def __init__(self, user_factors: np.ndarray, item_factors: np.ndarray, regularization: float = 0.1, train_seconds: float = 0.0):
+        self.user_factors = user_factors
+        self.item_factors = item_factors
+        self.regularization = regularization
+        self.train_seconds = train_seconds
+
+    @classmethod
+    def train(cls, film_df_matrix: csr_matrix, n_factors: int = 32, regularization: float = 0.1, n_iter: int = 10,
+              n_threads: int = None, seed: int = 0) -> 'MatrixFactorization':
+        start = time.perf_counter()
+        ratings = csr_matrix(film_df_matrix, dtype=np.float32)
+        ratings_t = ratings.T.tocsr()
+        rng = np.random.default_rng(seed)
+        user_factors = np.zeros((ratings.shape[0], n_factors), dtype=np.float32)
+        item_factors = rng.normal(0, 0.1, (ratings.shape[1], n_factors)).astype(np.float32)
+        with ThreadPoolExecutor(n_threads or os.cpu_count()) as executor:
+            for _ in range(n_iter):
+                user_factors = _als_step(ratings, item_factors, regularization, executor)
+                item_factors = _als_step(ratings_t, user_factors, regularization, executor)
+
+        model = cls(user_factors, item_factors, regularization, time.perf_counter() - start)
+        rows = np.repeat(np.arange(ratings.shape[0]), np.diff(ratings.indptr))
+        rmse = np.sqrt(np.mean((np.sum(user_factors[rows] * item_factors[ratings.indices], axis=1) - ratings.data) ** 2))
+        logger.info(f"ALS: {n_factors} факторов, {n_iter} итераций за {model.train_seconds:.2f} c, RMSE на обучении {rmse:.3f}")
+        return model
+
+    def fold_in(self, film_df_matrix: csr_matrix, user_indices) -> 'MatrixFactorization':
+        """Пересчитывает факторы только указанных пользователей при фиксированных факторах фильмов (новые оценки без переобучения)"""
+        n_users, n_titles = film_df_matrix.shape
+        item_factors = _pad_rows(self.item_factors, n_titles)
+        user_factors = _pad_rows(self.user_factors, n_users)
+        user_indices = np.asarray(user_indices, dtype=np.int64)
+        if len(user_indices):
+            ratings = csr_matrix(film_df_matrix, dtype=np.float32)[user_indices]
+            user_factors[user_indices] = _solve_rows(ratings, item_factors, self.regularization)
+        return MatrixFactorization(user_factors, item_factors, self.regularization, self.train_seconds)
+
+    def recommend_batch(self, user_indices, film_df_matrix: csr_matrix, top_n: int = 10):
+        """Top-N фильмов по U·Vᵀ без уже оцененных пользователем"""
+        user_indices = np.asarray(user_indices, dtype=np.int64)
+        scores = self.user_factors[user_indices] @ self.item_factors.T
+        rated = film_df_matrix[user_indices].tocoo()
+        scores[rated.row, rated.col] = -np.inf
+        top_n = min(top_n, scores.shape[1])
+        part = np.argpartition(-scores, top_n - 1, axis=1)[:, :top_n] if scores.shape[1] > top_n else np.argsort(-scores, axis=1)
+        order = np.argsort(-np.take_along_axis(scores, part, axis=1), axis=1, kind='stable')
+        indices = np.take_along_axis(part, order, axis=1)
+        return np.take_along_axis(scores, indices, axis=1), indices
+
+    def recommend(self, user_index: int, film_df_matrix: csr_matrix, top_n: int = 10):
+        scores, indices = self.recommend_batch([user_index], film_df_matrix, top_n)
+        return scores[0], indices[0]
+
+    @property
+    def shape(self) -> tuple:
+        return len(self.user_factors), len(self.item_factors)
+
+    @property
+    def n_factors(self) -> int:
+        return self.item_factors.shape[1]
+
+    @property
+    def nbytes(self) -> int:
+        return self.user_factors.nbytes + self.item_factors.nbytes
+
+    def save(self, path: str, source_signature=None, users=None, titles=None):
+        """Файлы пишутся во временные и подменяются через os.replace: снимки, открывшие старые факторы через mmap, не ломаются.
+        users и titles - метки строк факторов (порядок строк и столбцов users_pivot), по ним load() сверяет порядок"""
+        os.makedirs(path, exist_ok=True)
+        meta = {'regularization': self.regularization, 'train_seconds': self.train_seconds,
+                'source_signature': list(source_signature) if source_signature is not None else None}
+        arrays = [('user_factors.npy', self.user_factors), ('item_factors.npy', self.item_factors)]
+        if users is not None and titles is not None:
+            arrays += [('users.npy', np.asarray(users)), ('titles.npy', np.asarray(titles, dtype=str))]
+        for name, factors in arrays:
+            with open(os.path.join(path, name + '.tmp'), 'wb') as f:
+                np.save(f, factors)
+            os.replace(os.path.join(path, name + '.tmp'), os.path.join(path, name))
+        with open(os.path.join(path, 'meta.json.tmp'), 'w') as f:
+            json.dump(meta, f)
+        os.replace(os.path.join(path, 'meta.json.tmp'), os.path.join(path, 'meta.json'))
+
+    @classmethod
+    def load(cls, path: str, source_signature=None, users=None, titles=None) -> 'MatrixFactorization | None':
+        """Загружает факторы через memory-map, если они обучены на той же версии датасета.
+        users и titles - текущий порядок строк и столбцов users_pivot: после /add_ratings/ новые пользователи и фильмы
+        были в конце, а при запуске таблица строится в отсортированном порядке - строки факторов переставляются под него.
+        Другой набор пользователей или фильмов (или метки не сохранены) - None, факторы надо обучить заново"""
+        meta_path = os.path.join(path, 'meta.json')
+        if not os.path.exists(meta_path):
+            return None
+        with open(meta_path) as f:
+            meta = json.load(f)
+        if source_signature is not None and meta['source_signature'] != list(source_signature):
+            return None
+        user_factors = np.load(os.path.join(path, 'user_factors.npy'), mmap_mode='r')
+        item_factors = np.load(os.path.join(path, 'item_factors.npy'), mmap_mode='r')
+        if users is not None and titles is not None:
+            try:
+                saved_users = np.load(os.path.join(path, 'users.npy'))
+                saved_titles = np.load(os.path.join(path, 'titles.npy'))
+            except OSError:
+                return None
+            user_factors = _reorder(user_factors, saved_users, users)
+            item_factors = _reorder(item_factors, saved_titles, titles)
+            if user_factors is None or item_factors is None:
+                return None
+        return cls(user_factors, item_factors, meta['regularization'], meta['train_seconds'])
+
+
+def _reorder(factors: np.ndarray, saved_labels: np.ndarray, labels) -> np.ndarray | None:
+    """Строки factors (в порядке saved_labels) в порядке labels; порядок тот же - без копирования, другой набор - None"""
+    labels = pd.Index(labels)
+    if len(saved_labels) != len(factors) or len(labels) != len(saved_labels):
+        return None
+    if labels.equals(pd.Index(saved_labels)):
+        return factors
+    positions = pd.Index(saved_labels).get_indexer(labels)
+    if (positions < 0).any():
+        return None
+    return np.ascontiguousarray(factors[positions])
+
+
+def _als_step(ratings: csr_matrix, fixed_factors: np.ndarray, regularization: float, executor, chunk_rows: int = 4096) -> np.ndarray:
+    """Решает ридж-регрессию для каждой строки ratings при фиксированных факторах другой стороны, блоками строк в потоках"""
+    outer = _outer_products(fixed_factors)
+    bounds = list(range(0, ratings.shape[0], chunk_rows)) + [ratings.shape[0]]
+    chunks = executor.map(lambda b: _solve_rows(ratings[b[0]:b[1]], fixed_factors, regularization, outer), zip(bounds[:-1], bounds[1:]))
+    return np.vstack(list(chunks)).astype(np.float32)
+
+
+def _outer_products(factors: np.ndarray) -> np.ndarray:
+    """v·vᵀ для каждой строки v, развернутые в вектор: сумма по оцененным строкам - одно разреженное произведение"""
+    return (factors[:, :, None] * factors[:, None, :]).reshape(len(factors), -1)
+
+
+def _solve_rows(ratings: csr_matrix, fixed_factors: np.ndarray, regularization: float, outer: np.ndarray = None) -> np.ndarray:
+    n_rows, n_factors = ratings.shape[0], fixed_factors.shape[1]
+    outer = _outer_products(fixed_factors) if outer is None else outer
+    rated = csr_matrix((np.ones_like(ratings.data), ratings.indices, ratings.indptr), shape=ratings.shape)
+    gram = np.asarray(rated @ outer, dtype=np.float64).reshape(n_rows, n_factors, n_factors)
+    rhs = np.asarray(ratings @ fixed_factors, dtype=np.float64)
+
+    # Регуляризация, взвешенная числом оценок (ALS-WR); у строк без оценок фактор получается нулевым
+    counts = np.diff(ratings.indptr)
+    gram += regularization * np.maximum(counts, 1)[:, None, None] * np.eye(n_factors)
+    return np.linalg.solve(gram, rhs[:, :, None])[:, :, 0]
+
+
+def _pad_rows(factors: np.ndarray, n_rows: int) -> np.ndarray:
+    padded = np.zeros((n_rows, factors.shape[1]), dtype=np.float32)
+    padded[:len(factors)] = factors
+    return padded
@@ -0,0 +1,128 @@
+import io, os, queue, threading, time, logging
+from collections import OrderedDict
+import pandas as pd
+
+try:
+    import fcntl
+except ImportError:  # Windows: там сервис запускается одним воркером
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+# Сколько последних неудачных пачек помнить для wait()
+MAX_FAILED_BATCHES = 1024
+
+
+class IngestionError(Exception):
+    """Пачка оценок не применена: ошибка при построении снимка или записи на диск"""
+
+
+class RatingsIngestor:
+    """Фоновый приём оценок: пачки копятся в очереди, один поток строит новый снимок и подменяет его атомарно.
+    csv_path - куда дописывать принятые оценки; save_indexes=False - индексы на диск не сохраняются
+    (несколько воркеров: у каждого свой снимок, и индекс одного не соответствует CSV с оценками всех)"""
+
+    def __init__(self, recomendation_system, max_batch: int = 50_000, max_delay: float = 0.5, csv_path: str = None,
+                 save_indexes: bool = True):
+        self.recomendation_system = recomendation_system
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.csv_path = csv_path
+        self.save_indexes = save_indexes
+        self.queue = queue.Queue()
+        self.applied = threading.Condition()
+        self.submitted_seq = 0
+        self.applied_seq = 0
+        self.applied_ratings = 0
+        self.failed_seqs = OrderedDict()
+        self.failed_batches = 0
+        self.last_error = None
+        self.last_refresh_seconds = 0.0
+        self.submit_lock = threading.Lock()
+        self.thread = threading.Thread(target=self._run, name='ratings-ingestor', daemon=True)
+        self.thread.start()
+
+    def submit(self, new_reviews: pd.DataFrame) -> int:
+        """Ставит оценки в очередь и возвращает номер пачки для wait()"""
+        with self.submit_lock:
+            self.submitted_seq += 1
+            self.queue.put((self.submitted_seq, new_reviews))
+            return self.submitted_seq
+
+    def wait(self, seq: int, timeout: float = None) -> bool:
+        """Ждет обработки пачки seq: True - применена, False - не дождались; пачка не применилась - IngestionError"""
+        with self.applied:
+            if not self.applied.wait_for(lambda: self.applied_seq >= seq, timeout):
+                return False
+            error = self.failed_seqs.get(seq)
+        if error is not None:
+            raise IngestionError(error)
+        return True
+
+    def stats(self) -> dict:
+        return {
+            'pending': self.queue.qsize(),
+            'submitted': self.submitted_seq,
+            'applied': self.applied_seq,
+            'applied_ratings': self.applied_ratings,
+            'failed_batches': self.failed_batches,
+            'last_error': self.last_error,
+            'last_refresh_seconds': self.last_refresh_seconds,
+            'version': self.recomendation_system.snapshot.version,
+        }
+
+    def _run(self):
+        while True:
+            seq, new_reviews = self.queue.get()
+            seqs, batch = [seq], [new_reviews]
+            rows = len(new_reviews)
+            deadline = time.monotonic() + self.max_delay
+            while rows < self.max_batch:
+                try:
+                    seq, new_reviews = self.queue.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    break
+                seqs.append(seq)
+                batch.append(new_reviews)
+                rows += len(new_reviews)
+
+            start, error = time.perf_counter(), None
+            try:
+                new_reviews = pd.concat(batch, ignore_index=True)
+                self.recomendation_system.apply_ratings(new_reviews)
+                if self.csv_path:
+                    self._persist(new_reviews)
+                self.applied_ratings += len(new_reviews)
+            except Exception as e:
+                error = f"Ошибка применения новых оценок: {e}"
+                logger.error(error)
+            self.last_refresh_seconds = time.perf_counter() - start
+
+            with self.applied:
+                if error is not None:
+                    # Ожидающие запросы этих пачек получат ошибку, а не ответ об успехе
+                    for failed in seqs:
+                        self.failed_seqs[failed] = error
+                    while len(self.failed_seqs) > MAX_FAILED_BATCHES:
+                        self.failed_seqs.popitem(last=False)
+                    self.failed_batches += len(seqs)
+                    self.last_error = error
+                self.applied_seq = seq
+                self.applied.notify_all()
+
+    def _persist(self, new_reviews: pd.DataFrame):
+        """Дописывает оценки в CSV одной записью под блокировкой файла: воркеры с общим CSV не перемешивают строки"""
+        with open(self.csv_path, 'a+', encoding='utf-8', newline='') as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.seek(0)
+                header = f.readline()
+                columns = pd.read_csv(io.StringIO(header), nrows=0).columns if header else new_reviews.columns
+                f.seek(0, os.SEEK_END)
+                f.write(new_reviews.reindex(columns=columns).to_csv(header=not header, index=False))
+                f.flush()
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+        if self.save_indexes:
+            self.recomendation_system.save_indexes()
@@ -0,0 +1,147 @@
+import abc
+import numpy as np
+from scipy.sparse import coo_matrix, csr_matrix
+from sklearn.preprocessing import normalize
+
+
+class UserNeighbours:
+    """Косинусные соседи пользователей: строки нормируются один раз, запрос - разреженное скалярное произведение"""
+
+    def __init__(self, film_df_matrix: csr_matrix, batch_size: int = 256):
+        self.params = {'batch_size': batch_size}
+        self.normalized = normalize(csr_matrix(film_df_matrix, dtype=np.float32), norm='l2', axis=1)
+        self.normalized_t = self.normalized.T.tocsr()
+        self.batch_size = batch_size
+
+    def rebuild(self, film_df_matrix: csr_matrix) -> 'UserNeighbours':
+        """Та же структура с теми же параметрами для новой матрицы оценок"""
+        return type(self)(film_df_matrix, **self.params)
+
+    def kneighbors(self, user_index: int, n_neighbors: int = 10):
+        distances, indices = self.kneighbors_batch([user_index], n_neighbors)
+        return distances[0], indices[0]
+
+    def kneighbors_batch(self, user_indices, n_neighbors: int = 10):
+        """Соседи для многих пользователей сразу (без самого пользователя), отсортированные по косинусному расстоянию"""
+        user_indices = np.asarray(user_indices, dtype=np.int64)
+        n_neighbors = min(n_neighbors, self.normalized.shape[0] - 1)
+        distances = np.empty((len(user_indices), n_neighbors), dtype=np.float32)
+        indices = np.empty((len(user_indices), n_neighbors), dtype=np.int64)
+        for start in range(0, len(user_indices), self.batch_size):
+            rows = user_indices[start:start + self.batch_size]
+            similarities = (self.normalized[rows] @ self.normalized_t).toarray()
+            similarities[np.arange(len(rows)), rows] = -np.inf
+            best = _top_k(similarities, n_neighbors)
+            indices[start:start + len(rows)] = best
+            distances[start:start + len(rows)] = 1 - np.take_along_axis(similarities, best, axis=1)
+        return distances, indices
+
+
+class _CandidateNeighbours(UserNeighbours, abc.ABC):
+    """Приближенный поиск: индекс отбирает кандидатов, среди них считается точный косинус"""
+
+    def kneighbors_batch(self, user_indices, n_neighbors: int = 10):
+        user_indices = np.asarray(user_indices, dtype=np.int64)
+        n_neighbors = min(n_neighbors, self.normalized.shape[0] - 1)
+        distances = np.empty((len(user_indices), n_neighbors), dtype=np.float32)
+        indices = np.empty((len(user_indices), n_neighbors), dtype=np.int64)
+        for i, (row, candidates) in enumerate(zip(user_indices, self.candidates(user_indices))):
+            candidates = candidates[candidates != row]
+            if len(candidates) < n_neighbors:
+                # Кандидатов не хватило - точный поиск для этого пользователя
+                exact_distances, exact_indices = UserNeighbours.kneighbors_batch(self, [row], n_neighbors)
+                distances[i], indices[i] = exact_distances[0], exact_indices[0]
+                continue
+            similarities = (self.normalized[candidates] @ self.normalized[row].T).toarray().ravel()
+            best = _top_k(similarities[None, :], n_neighbors)[0]
+            indices[i] = candidates[best]
+            distances[i] = 1 - similarities[best]
+        return distances, indices
+
+    @abc.abstractmethod
+    def candidates(self, user_indices: np.ndarray) -> list:
+        """Кандидаты в соседи для каждого пользователя - массивы индексов строк"""
+
+    def _random_projection(self, n_components: int, seed: int) -> np.ndarray:
+        rng = np.random.default_rng(seed)
+        projection = rng.standard_normal((self.normalized.shape[1], n_components), dtype=np.float32)
+        return np.asarray(self.normalized @ projection)
+
+
+class LSHNeighbours(_CandidateNeighbours):
+    """LSH случайными гиперплоскостями: n_tables таблиц по n_bits знаков проекций, кандидаты - общие корзины"""
+
+    def __init__(self, film_df_matrix: csr_matrix, n_tables: int = 20, n_bits: int = 8, seed: int = 0, batch_size: int = 256):
+        super().__init__(film_df_matrix, batch_size)
+        self.params = {'n_tables': n_tables, 'n_bits': n_bits, 'seed': seed, 'batch_size': batch_size}
+        signs = self._random_projection(n_tables * n_bits, seed) > 0
+        self.codes = (signs.reshape(-1, n_tables, n_bits) << np.arange(n_bits)).sum(axis=2)
+        self.orders = np.argsort(self.codes.T, axis=1, kind='stable')
+        self.sorted_codes = np.take_along_axis(self.codes.T, self.orders, axis=1)
+
+    def candidates(self, user_indices: np.ndarray) -> list:
+        result = []
+        for row in user_indices:
+            buckets = []
+            for table, code in enumerate(self.codes[row]):
+                lo, hi = np.searchsorted(self.sorted_codes[table], [code, code + 1])
+                buckets.append(self.orders[table, lo:hi])
+            result.append(np.unique(np.concatenate(buckets)))
+        return result
+
+
+class IVFNeighbours(_CandidateNeighbours):
+    """IVF: пользователи разбиты k-means (по случайной проекции) на n_lists кластеров, поиск в n_probe ближайших"""
+
+    def __init__(self, film_df_matrix: csr_matrix, n_lists: int = None, n_probe: int = 8, n_components: int = 128,
+                 n_iter: int = 10, seed: int = 0, batch_size: int = 256):
+        super().__init__(film_df_matrix, batch_size)
+        self.params = {'n_lists': n_lists, 'n_probe': n_probe, 'n_components': n_components, 'n_iter': n_iter,
+                       'seed': seed, 'batch_size': batch_size}
+        n_users = self.normalized.shape[0]
+        n_lists = min(n_lists or max(int(np.sqrt(n_users)), 1), n_users)
+        self.n_probe = min(n_probe, n_lists)
+        self.embeddings = normalize(self._random_projection(n_components, seed))
+
+        rng = np.random.default_rng(seed)
+        self.centroids = self.embeddings[rng.choice(n_users, n_lists, replace=False)]
+        for _ in range(n_iter):
+            assignment = self._assign(self.embeddings)
+            members = coo_matrix((np.ones(n_users, dtype=np.float32), (assignment, np.arange(n_users))), shape=(n_lists, n_users))
+            sums = members @ self.embeddings
+            filled = np.abs(sums).sum(axis=1) > 0
+            self.centroids[filled] = normalize(sums[filled])
+        assignment = self._assign(self.embeddings)
+        self.order = np.argsort(assignment, kind='stable')
+        self.offsets = np.searchsorted(assignment[self.order], np.arange(n_lists + 1))
+
+    def _assign(self, embeddings: np.ndarray) -> np.ndarray:
+        return np.concatenate([
+            np.argmax(embeddings[start:start + 4096] @ self.centroids.T, axis=1)
+            for start in range(0, len(embeddings), 4096)
+        ])
+
+    def candidates(self, user_indices: np.ndarray) -> list:
+        probes = _top_k(self.embeddings[user_indices] @ self.centroids.T, self.n_probe)
+        return [
+            np.concatenate([self.order[self.offsets[cluster]:self.offsets[cluster + 1]] for cluster in clusters])
+            for clusters in probes
+        ]
+
+
+NEIGHBOURS_BACKENDS = {'brute': UserNeighbours, 'lsh': LSHNeighbours, 'ivf': IVFNeighbours}
+
+
+def create_neighbours(film_df_matrix: csr_matrix, backend: str = 'brute', **params) -> UserNeighbours:
+    if backend not in NEIGHBOURS_BACKENDS:
+        raise ValueError(f"Неизвестный алгоритм поиска соседей '{backend}', доступны: {list(NEIGHBOURS_BACKENDS)}")
+    return NEIGHBOURS_BACKENDS[backend](film_df_matrix, **params)
+
+
+def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    if scores.shape[1] > k:
+        part = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    else:
+        part = np.argsort(-scores, axis=1)[:, :k]
+    order = np.argsort(-np.take_along_axis(scores, part, axis=1), axis=1, kind='stable')
+    return np.take_along_axis(part, order, axis=1)
@@ -0,0 +1,52 @@
+import copy
+import numpy as np, pandas as pd
+
+
+class PopularityStats:
+    """Счетчики count/sum оценок по фильмам и по жанр×фильм с готовыми топами по взвешенному рейтингу"""
+
+    def __init__(self, df_films_reviews: pd.DataFrame, top_n: int = 10, quantile: float = 0.90):
+        self.top_n = top_n
+        self.quantile = quantile
+        self.title_stats = self._aggregate(df_films_reviews, ['title'])
+        self.genre_stats = self._aggregate(df_films_reviews, ['genres', 'title'])
+        self.top_films = self._weighted_top(self.title_stats)
+        self.top_films_by_genre = {
+            genre: self._weighted_top(stats.droplevel('genres'))
+            for genre, stats in self.genre_stats.groupby(level='genres', sort=False)
+        }
+
+    def add(self, new_reviews: pd.DataFrame) -> 'PopularityStats':
+        """Новые агрегаты с учетом новых оценок: топы пересчитываются только для затронутых жанров"""
+        stats = copy.copy(self)
+        stats.title_stats = self.title_stats.add(self._aggregate(new_reviews, ['title']), fill_value=0)
+        new_genre_stats = self._aggregate(new_reviews, ['genres', 'title'])
+        stats.genre_stats = self.genre_stats.add(new_genre_stats, fill_value=0)
+
+        stats.top_films = stats._weighted_top(stats.title_stats)
+        stats.top_films_by_genre = dict(self.top_films_by_genre)
+        for genre in new_genre_stats.index.unique(level='genres'):
+            stats.top_films_by_genre[genre] = stats._weighted_top(stats.genre_stats.xs(genre, level='genres'))
+        return stats
+
+    def popularite_films(self) -> pd.DataFrame:
+        return self.top_films
+
+    def popularite_films_by_genre(self, genre: str) -> pd.DataFrame:
+        if genre not in self.top_films_by_genre:
+            return pd.DataFrame({'title': [], 'w_score': []})
+        return self.top_films_by_genre[genre]
+
+    @staticmethod
+    def _aggregate(df: pd.DataFrame, keys: list) -> pd.DataFrame:
+        grouped = df['rating'].astype(np.float64).groupby([df[key] for key in keys], observed=True)
+        return pd.DataFrame({'count_rating': grouped.count(), 'sum_rating': grouped.sum()})
+
+    def _weighted_top(self, stats: pd.DataFrame) -> pd.DataFrame:
+        v = stats['count_rating'].to_numpy(dtype=np.float64)
+        R = stats['sum_rating'].to_numpy() / v
+        m = np.quantile(v, self.quantile)
+        c = R.mean()
+        w_score = ((v * R) + (m * c)) / (v + m)
+        order = np.argsort(-w_score, kind='stable')[:self.top_n]
+        return pd.DataFrame({'title': stats.index[order].astype(str), 'w_score': w_score[order]})
@@ -0,0 +1,97 @@
+import os, json, shutil, time, logging
+import numpy as np, pandas as pd
+
+logger = logging.getLogger(__name__)
+
+META_FILE = 'meta.json'
+COLUMN_DTYPES = {'userId': np.int32, 'rating': np.float32}
+# Поврежденное хранилище: нет файла, битый meta.json (JSONDecodeError - это ValueError), столбец не той длины или формата
+STORE_ERRORS = (OSError, ValueError, KeyError)
+
+
+def convert(csv_path: str, store_dir: str) -> None:
+    """Переводит CSV с оценками в колоночный формат: по .npy на столбец + meta.json с категориями"""
+    start = time.perf_counter()
+    df = pd.read_csv(csv_path)
+    tmp_dir = f'{store_dir}.tmp{os.getpid()}'
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    meta = {'source_signature': _signature(csv_path), 'rows': len(df), 'columns': []}
+    for name in df.columns:
+        column = df[name]
+        if name in COLUMN_DTYPES:
+            values, categories = column.to_numpy(dtype=COLUMN_DTYPES[name]), None
+        elif pd.api.types.is_integer_dtype(column):
+            values, categories = column.to_numpy(dtype=np.int32), None
+        elif pd.api.types.is_float_dtype(column):
+            values, categories = column.to_numpy(dtype=np.float32), None
+        else:
+            categorical = pd.Categorical(column)
+            values, categories = categorical.codes, categorical.categories.tolist()
+        np.save(os.path.join(tmp_dir, _column_file(len(meta['columns']))), values)
+        meta['columns'].append({'name': name, 'categories': categories})
+
+    with open(os.path.join(tmp_dir, META_FILE), 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False)
+
+    # Подменяем хранилище целиком, чтобы другие воркеры не увидели его наполовину записанным
+    old_dir = f'{store_dir}.old{os.getpid()}'
+    if os.path.exists(store_dir):
+        os.replace(store_dir, old_dir)
+    os.replace(tmp_dir, store_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+    logger.info(f"Хранилище оценок {store_dir} построено за {time.perf_counter() - start:.2f} c ({len(df)} строк)")
+
+
+def load(store_dir: str) -> pd.DataFrame:
+    """Открывает хранилище через memory-map: страницы столбцов общие для всех процессов"""
+    with open(os.path.join(store_dir, META_FILE), encoding='utf-8') as f:
+        meta = json.load(f)
+
+    data = {}
+    for i, column in enumerate(meta['columns']):
+        values = np.load(os.path.join(store_dir, _column_file(i)), mmap_mode='r')
+        if values.shape != (meta['rows'],):
+            raise ValueError(f"Столбец {column['name']}: форма {values.shape}, ожидалось ({meta['rows']},)")
+        if column['categories'] is not None:
+            values = pd.Categorical.from_codes(values, dtype=pd.CategoricalDtype(column['categories']), validate=False)
+        data[column['name']] = values
+    return pd.DataFrame(data, copy=False)
+
+
+def is_stale(csv_path: str, store_dir: str) -> bool:
+    meta_path = os.path.join(store_dir, META_FILE)
+    if not os.path.exists(meta_path):
+        return True
+    if not os.path.exists(csv_path):
+        return False
+    with open(meta_path, encoding='utf-8') as f:
+        return json.load(f)['source_signature'] != _signature(csv_path)
+
+
+def load_reviews(csv_path: str, store_dir: str) -> pd.DataFrame:
+    """Читает оценки из хранилища, пересобирая его, если CSV новее или хранилище повреждено;
+    если и пересобрать не удалось - обычный pd.read_csv"""
+    try:
+        if is_stale(csv_path, store_dir):
+            convert(csv_path, store_dir)
+        return load(store_dir)
+    except STORE_ERRORS as e:
+        logger.error(f"Хранилище {store_dir} повреждено, пересобираем из CSV: {e}")
+
+    try:
+        convert(csv_path, store_dir)
+        return load(store_dir)
+    except STORE_ERRORS as e:
+        logger.error(f"Не удалось пересобрать хранилище {store_dir}, читаем CSV: {e}")
+        return pd.read_csv(csv_path)
+
+
+def _signature(path: str) -> list:
+    stat = os.stat(path)
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+def _column_file(i: int) -> str:
+    return f'column_{i}.npy'
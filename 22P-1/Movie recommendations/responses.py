@@ -0,0 +1,47 @@
+import gzip, json
+import numpy as np, pandas as pd
+
+try:
+    import orjson  # необязательная зависимость, см. requirements-optional.txt
+except ImportError:
+    orjson = None
+
+
+def to_records(df: pd.DataFrame) -> list:
+    """DataFrame -> [{столбец: значение}, ...] с обычными типами Python; NaN становится null"""
+    columns = []
+    for name in df.columns:
+        column = df[name]
+        values = column.tolist()
+        if column.hasnans:
+            values = [None if pd.isna(value) else value for value in values]
+        columns.append(values)
+    names = [str(name) for name in df.columns]
+    return [dict(zip(names, row)) for row in zip(*columns)]
+
+
+def to_native(value):
+    """Хук default для json/orjson: таблицы - массивом записей, массивы и скаляры NumPy - обычными типами Python.
+    Вызывается только для объектов, которые кодировщик не знает, поэтому списки строк и чисел не обходятся заново"""
+    if isinstance(value, pd.DataFrame):
+        return to_records(value)
+    if isinstance(value, (pd.Series, pd.Index, np.ndarray)):
+        return [None if isinstance(item, float) and item != item else item for item in value.tolist()]
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"Тип {type(value).__name__} не сериализуется в JSON")
+
+
+def encode_json(result) -> bytes:
+    """Компактный JSON в UTF-8: orjson, если установлен, иначе стандартный json"""
+    if orjson is not None:
+        return orjson.dumps(result, default=to_native)
+    return json.dumps(result, default=to_native, ensure_ascii=False, allow_nan=False, separators=(',', ':')).encode('utf-8')
+
+
+def gzip_body(body: bytes, level: int = 6) -> bytes:
+    return gzip.compress(body, compresslevel=level, mtime=0)
+
+
+def accepts_gzip(accept_encoding: str | None) -> bool:
+    return accept_encoding is not None and 'gzip' in accept_encoding.lower()
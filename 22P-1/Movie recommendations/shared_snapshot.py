@@ -0,0 +1,123 @@
+import os, io, json, mmap, pickle, shutil, time, logging
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+META_FILE = 'meta.json'
+STATE_FILE = 'state.pickle'
+ARRAYS_FILE = 'arrays.bin'
+ALIGNMENT = 64
+
+
+def export(snapshot, path: str, source_signature=None, settings: dict = None) -> None:
+    """Сохраняет снимок для воркеров: объекты - в pickle, все массивы NumPy (DataFrame, CSR, факторы) - одним файлом рядом"""
+    start = time.perf_counter()
+    buffers = []
+    state = io.BytesIO()
+    _SnapshotPickler(state, protocol=5, buffer_callback=buffers.append).dump(snapshot)
+    state = state.getbuffer()
+    tmp_dir = f'{path}.tmp{os.getpid()}'
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    layout = []
+    with open(os.path.join(tmp_dir, ARRAYS_FILE), 'wb') as f:
+        for buffer in buffers:
+            raw = buffer.raw()
+            f.write(b'\0' * (-f.tell() % ALIGNMENT))
+            layout.append([f.tell(), raw.nbytes])
+            f.write(raw)
+    with open(os.path.join(tmp_dir, STATE_FILE), 'wb') as f:
+        f.write(state)
+    meta = {'source_signature': list(source_signature) if source_signature is not None else None,
+            'settings': settings, 'version': snapshot.version, 'buffers': layout}
+    with open(os.path.join(tmp_dir, META_FILE), 'w', encoding='utf-8') as f:
+        json.dump(meta, f)
+
+    # Как и в ratings_store: уже подключенные воркеры держат открытыми старые файлы, новые видят каталог целиком
+    old_dir = f'{path}.old{os.getpid()}'
+    if os.path.exists(path):
+        os.replace(path, old_dir)
+    os.replace(tmp_dir, path)
+    shutil.rmtree(old_dir, ignore_errors=True)
+    size = sum(length for _, length in layout)
+    logger.info(f"Общий снимок {path} сохранен за {time.perf_counter() - start:.2f} c ({size / 2**20:.1f} МБ массивов)")
+
+
+class _SnapshotPickler(pickle.Pickler):
+    """pandas кладет блоки DataFrame и коды Categorical внутрь pickle, а не отдельными буферами: каждый воркер получил бы
+    свою копию таблицы оценок. Здесь они раскладываются на массивы NumPy, которые уходят в общий файл: столбцы - как есть,
+    категориальные - коды плюс категории. Приватными в воркере остаются только объекты-метки (названия фильмов, жанры) -
+    по одному на фильм, а не на оценку"""
+
+    def reducer_override(self, obj):
+        if isinstance(obj, np.memmap):
+            # Факторы открыты из файла через memmap, а pickle memmap пишет данные внутрь
+            return np.asarray, (obj.view(np.ndarray),)
+        if isinstance(obj, pd.DataFrame) and obj.columns.is_unique:
+            return _frame, ([_values(obj[column]) for column in obj.columns], obj.columns, obj.index)
+        if isinstance(obj, pd.Series):
+            return _series, (_values(obj), obj.index, obj.name)
+        if isinstance(obj, pd.Categorical):
+            return _categorical, (obj.codes, obj.categories, obj.ordered)
+        return NotImplemented
+
+
+def _values(series: pd.Series):
+    # Categorical и другие расширенные типы - как есть, обычные столбцы - массивом NumPy без копирования
+    return series.array if isinstance(series.dtype, pd.api.extensions.ExtensionDtype) else series.to_numpy()
+
+
+def _frame(columns: list, names: pd.Index, index: pd.Index) -> pd.DataFrame:
+    # copy=False: столбцы не склеиваются в общие блоки и остаются видом на memory-map
+    return pd.DataFrame(dict(zip(names, columns)), index=index, columns=names, copy=False)
+
+
+def _series(values, index: pd.Index, name) -> pd.Series:
+    return pd.Series(values, index=index, name=name, copy=False)
+
+
+def _categorical(codes: np.ndarray, categories: pd.Index, ordered: bool) -> pd.Categorical:
+    return pd.Categorical.from_codes(codes, categories=categories, ordered=ordered, validate=False)
+
+
+def attach(path: str, source_signature=None, settings: dict = None):
+    """Подключает снимок без копирования: массивы смотрят в общий memory-map, страницы делятся между процессами.
+    Возвращает None, если снимка нет или он построен по другой версии датасета или с другими настройками"""
+    meta_path = os.path.join(path, META_FILE)
+    if not os.path.exists(meta_path):
+        return None
+    with open(meta_path, encoding='utf-8') as f:
+        meta = json.load(f)
+    if source_signature is not None and meta['source_signature'] != list(source_signature):
+        return None
+    if settings is not None and meta['settings'] != settings:
+        return None
+
+    start = time.perf_counter()
+    with open(os.path.join(path, ARRAYS_FILE), 'rb') as f:
+        # mmap нулевой длины не создается - пустой файл бывает, только если в снимке нет массивов
+        arrays = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if meta['buffers'] else b''
+    view = memoryview(arrays)
+    with open(os.path.join(path, STATE_FILE), 'rb') as f:
+        snapshot = pickle.load(f, buffers=[view[offset:offset + length] for offset, length in meta['buffers']])
+    logger.info(f"Общий снимок {path} подключен за {time.perf_counter() - start:.2f} c")
+    return snapshot
+
+
+def memory_usage() -> dict:
+    """RSS, PSS (доля общих страниц) и приватная память процесса в МБ; PSS и private есть только в Linux"""
+    usage = {'pid': os.getpid()}
+    try:
+        with open('/proc/self/smaps_rollup') as f:
+            fields = dict(line.split(':', 1) for line in f if ':' in line and not line.startswith(' '))
+    except OSError:
+        return usage
+
+    def mb(*names):
+        return sum(int(fields[name].split()[0]) for name in names if name in fields) / 1024
+
+    usage.update({'rss_mb': mb('Rss'), 'pss_mb': mb('Pss'), 'shared_mb': mb('Shared_Clean', 'Shared_Dirty'),
+                  'private_mb': mb('Private_Clean', 'Private_Dirty')})
+    return usage
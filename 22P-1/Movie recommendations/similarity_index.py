@@ -0,0 +1,147 @@
+import os, time, logging
+import numpy as np
+from scipy.sparse import csr_matrix
+
+logger = logging.getLogger(__name__)
+
+
+class SimilarityIndex:
+    """Top-K коррелирующих фильмов для каждого фильма (item-item индекс для same_films)"""
+
+    def __init__(self, titles, neighbours: np.ndarray, scores: np.ndarray, n_users: int, build_seconds: float = 0.0):
+        self.titles = np.asarray(titles, dtype=str)
+        self.neighbours = neighbours
+        self.scores = scores
+        self.n_users = n_users
+        self.build_seconds = build_seconds
+        self.title_index = {title: idx for idx, title in enumerate(self.titles)}
+
+    @classmethod
+    def build(cls, film_df_matrix: csr_matrix, titles, top_k: int = 50, block_bytes: int = 64 * 2**20) -> 'SimilarityIndex':
+        start = time.perf_counter()
+        n_users, n_titles = film_df_matrix.shape
+        top_k = min(top_k, max(n_titles - 1, 1))
+        neighbours = np.full((n_titles, top_k), -1, dtype=np.int32)
+        scores = np.full((n_titles, top_k), -np.inf, dtype=np.float32)
+
+        stats = _column_stats(film_df_matrix)
+        csc = film_df_matrix.tocsc()
+        for columns in _column_blocks(np.arange(n_titles), n_titles, block_bytes):
+            corr = _correlation_block(csc, columns, stats)
+            corr[columns, np.arange(len(columns))] = -np.inf
+            neighbours[columns], scores[columns] = _top_k(corr.T, np.arange(n_titles), top_k)
+
+        index = cls(titles, neighbours, scores, n_users, time.perf_counter() - start)
+        logger.info(f"Индекс похожих фильмов построен за {index.build_seconds:.2f} c, {index.nbytes / 2**20:.1f} МБ")
+        return index
+
+    def update(self, film_df_matrix: csr_matrix, titles, changed_titles, block_bytes: int = 64 * 2**20) -> 'SimilarityIndex':
+        """Пересчитывает только изменившиеся фильмы; при изменении числа пользователей - полная перестройка"""
+        titles = np.asarray(titles, dtype=str)
+        top_k = self.neighbours.shape[1]
+        n_users, n_titles = film_df_matrix.shape
+        if n_users != self.n_users or len(titles) < len(self.titles) or not np.array_equal(titles[:len(self.titles)], self.titles):
+            return SimilarityIndex.build(film_df_matrix, titles, top_k, block_bytes)
+
+        start = time.perf_counter()
+        title_index = {title: idx for idx, title in enumerate(titles)}
+        changed = np.union1d(
+            np.array([title_index[title] for title in changed_titles], dtype=np.int64),
+            np.arange(len(self.titles), n_titles),
+        )
+        neighbours = np.full((n_titles, top_k), -1, dtype=np.int32)
+        scores = np.full((n_titles, top_k), -np.inf, dtype=np.float32)
+        neighbours[:len(self.titles)] = self.neighbours
+        scores[:len(self.titles)] = self.scores
+        # Старые значения корреляции с изменившимися фильмами больше не действительны
+        scores[np.isin(neighbours, changed)] = -np.inf
+
+        stats = _column_stats(film_df_matrix)
+        csc = film_df_matrix.tocsc()
+        others = np.setdiff1d(np.arange(n_titles), changed)
+        for columns in _column_blocks(changed, n_titles, block_bytes):
+            corr = _correlation_block(csc, columns, stats)
+            corr[columns, np.arange(len(columns))] = -np.inf
+            neighbours[columns], scores[columns] = _top_k(corr.T, np.arange(n_titles), top_k)
+
+            merged_scores = np.hstack([scores[others], corr[others].astype(np.float32)])
+            merged_neighbours = np.hstack([neighbours[others], np.broadcast_to(columns, (len(others), len(columns)))])
+            order = np.argsort(-merged_scores, axis=1, kind='stable')[:, :top_k]
+            scores[others] = np.take_along_axis(merged_scores, order, axis=1)
+            neighbours[others] = np.take_along_axis(merged_neighbours, order, axis=1)
+
+        neighbours[~np.isfinite(scores)] = -1
+        index = SimilarityIndex(titles, neighbours, scores, n_users, time.perf_counter() - start)
+        logger.info(f"Индекс похожих фильмов обновлен ({len(changed)} фильмов) за {index.build_seconds:.2f} c")
+        return index
+
+    def similar(self, name_film: str, top_n: int = 10):
+        idx = self.title_index[name_film]
+        valid = self.neighbours[idx] >= 0
+        neighbours = self.neighbours[idx][valid][:top_n]
+        return self.titles[neighbours].tolist(), self.scores[idx][valid][:top_n].tolist()
+
+    @property
+    def nbytes(self) -> int:
+        return self.titles.nbytes + self.neighbours.nbytes + self.scores.nbytes
+
+    def save(self, path: str, source_signature=None):
+        """Пишет во временный файл и подменяет через os.replace: читатель не увидит наполовину записанный индекс"""
+        tmp_path = f'{path}.tmp{os.getpid()}'
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, titles=self.titles, neighbours=self.neighbours, scores=self.scores,
+                     n_users=self.n_users, build_seconds=self.build_seconds,
+                     source_signature=np.asarray(source_signature if source_signature is not None else (), dtype=np.int64))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str, source_signature=None) -> 'SimilarityIndex | None':
+        """Загружает индекс с диска, если он построен по той же версии датасета"""
+        if not os.path.exists(path):
+            return None
+        with np.load(path) as data:
+            if source_signature is not None and data['source_signature'].tolist() != list(source_signature):
+                return None
+            return cls(data['titles'], data['neighbours'], data['scores'], int(data['n_users']), float(data['build_seconds']))
+
+
+def dataset_signature(path: str) -> tuple:
+    stat = os.stat(path)
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+def _column_stats(film_df_matrix: csr_matrix):
+    n_users = film_df_matrix.shape[0]
+    sums = np.asarray(film_df_matrix.sum(axis=0)).ravel()
+    squares = np.asarray(film_df_matrix.multiply(film_df_matrix).sum(axis=0)).ravel()
+    variances = n_users * squares - sums ** 2
+    return n_users, sums, variances
+
+
+def _column_blocks(columns: np.ndarray, n_titles: int, block_bytes: int):
+    block = max(1, block_bytes // (8 * max(n_titles, 1)))
+    for start in range(0, len(columns), block):
+        yield columns[start:start + block]
+
+
+def _correlation_block(csc, columns: np.ndarray, stats) -> np.ndarray:
+    """Корреляция Пирсона всех фильмов с фильмами columns (как DataFrame.corrwith по матрице с нулями)"""
+    n_users, sums, variances = stats
+    products = (csc.T @ csc[:, columns]).toarray()
+    numerator = n_users * products - np.outer(sums, sums[columns])
+    denominator = np.sqrt(np.outer(variances, variances[columns]))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        corr = numerator / denominator
+    corr[~np.isfinite(corr)] = -np.inf
+    return corr
+
+
+def _top_k(scores: np.ndarray, labels: np.ndarray, top_k: int):
+    part = np.argpartition(-scores, top_k - 1, axis=1)[:, :top_k] if scores.shape[1] > top_k else np.argsort(-scores, axis=1)[:, :top_k]
+    part_scores = np.take_along_axis(scores, part, axis=1)
+    order = np.argsort(-part_scores, axis=1, kind='stable')
+    best = np.take_along_axis(part, order, axis=1)
+    best_scores = np.take_along_axis(part_scores, order, axis=1).astype(np.float32)
+    best_labels = labels[best].astype(np.int32)
+    best_labels[~np.isfinite(best_scores)] = -1
+    return best_labels, best_scores
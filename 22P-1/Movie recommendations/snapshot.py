@@ -0,0 +1,75 @@
+import numpy as np, pandas as pd
+from factorization import MatrixFactorization
+from neighbours import UserNeighbours
+from popularity import PopularityStats
+from similarity_index import SimilarityIndex
+from user_index import UserReviewsIndex
+from users_pivot import UsersPivot
+
+FILM_COLUMNS = ['year-production', 'genres']
+
+
+class RecommenderSnapshot:
+    """Неизменяемое состояние рекомендательной системы: при новых оценках строится новый снимок и подменяется целиком"""
+
+    def __init__(self, df_films_reviews: pd.DataFrame, user_reviews: UserReviewsIndex, users_pivot: UsersPivot,
+                 similarity_index: SimilarityIndex, user_neighbours: UserNeighbours, popularity: PopularityStats,
+                 films: pd.DataFrame = None, version: int = 0, factorization: MatrixFactorization = None):
+        self.df_films_reviews = df_films_reviews
+        self.user_reviews = user_reviews
+        self.users_pivot = users_pivot
+        self.film_df_matrix = users_pivot.matrix
+        self.similarity_index = similarity_index
+        self.user_neighbours = user_neighbours
+        self.popularity = popularity
+        if films is None:
+            films = df_films_reviews.drop_duplicates('title').set_index('title')[FILM_COLUMNS]
+        self.films = films
+        self.version = version
+        self.factorization = factorization
+
+    def with_ratings(self, new_reviews: pd.DataFrame) -> 'RecommenderSnapshot':
+        """Снимок с дописанными оценками (userId, title, rating, year-production, genres); обновляются только затронутые части"""
+        df_films_reviews = append_reviews(self.df_films_reviews, new_reviews)
+        user_reviews = self.user_reviews.append(df_films_reviews)
+        films = self.films
+        unseen_films = new_reviews.drop_duplicates('title').set_index('title')[FILM_COLUMNS]
+        unseen_films = unseen_films[~unseen_films.index.isin(films.index)]
+        if len(unseen_films):
+            films = pd.concat([films, unseen_films])
+
+        users_pivot, similarity_index, user_neighbours = self.users_pivot, self.similarity_index, self.user_neighbours
+        factorization = self.factorization
+        affected_users = np.intersect1d(new_reviews['userId'].unique(), user_reviews.eligible_users)
+        if len(affected_users):
+            positions = np.sort(np.concatenate([user_reviews.positions(user_id) for user_id in affected_users]))
+            users_pivot = users_pivot.update(df_films_reviews.iloc[positions])
+            changed_titles = new_reviews.loc[new_reviews['userId'].isin(affected_users), 'title'].unique()
+            similarity_index = similarity_index.update(users_pivot.matrix, users_pivot.columns, changed_titles)
+            user_neighbours = user_neighbours.rebuild(users_pivot.matrix)
+            if factorization is not None:
+                # Факторы фильмов не меняются до переобучения, пересчитываются только затронутые пользователи
+                factorization = factorization.fold_in(users_pivot.matrix, users_pivot.index.get_indexer(affected_users))
+
+        return RecommenderSnapshot(df_films_reviews, user_reviews, users_pivot, similarity_index, user_neighbours,
+                                   self.popularity.add(new_reviews), films, self.version + 1, factorization)
+
+
+def append_reviews(df_films_reviews: pd.DataFrame, new_reviews: pd.DataFrame) -> pd.DataFrame:
+    """Дописывает оценки в конец датасета, сохраняя категориальные и числовые типы столбцов"""
+    new_reviews = new_reviews.reindex(columns=df_films_reviews.columns)
+    columns = {}
+    for name in df_films_reviews.columns:
+        column, new_column = df_films_reviews[name], new_reviews[name]
+        if isinstance(column.dtype, pd.CategoricalDtype):
+            unseen = pd.Index(new_column.dropna().unique()).difference(column.cat.categories)
+            if len(unseen):
+                column = column.cat.add_categories(unseen)
+            new_column = new_column.astype(column.dtype)
+        elif not new_column.isna().any():
+            new_column = new_column.astype(column.dtype)
+        columns[name] = (column, new_column)
+
+    df = pd.DataFrame({name: column for name, (column, _) in columns.items()}, copy=False)
+    new_df = pd.DataFrame({name: new_column for name, (_, new_column) in columns.items()})
+    return pd.concat([df, new_df], ignore_index=True)
@@ -0,0 +1,67 @@
+import os
+import numpy as np, pandas as pd
+import pytest
+import ratings_store
+
+
+@pytest.fixture
+def csv_path(tmp_path):
+    path = tmp_path / 'df_films_reviews.csv'
+    pd.DataFrame({
+        'userId': [1, 1, 2, 3],
+        'title': ['Alien', 'Heat', 'Alien', 'Up'],
+        'year-production': [1979, 1995, 1979, 2009],
+        'genres': ['horror', 'crime', 'horror', 'animation'],
+        'rating': [4.5, 3.0, 5.0, 4.0],
+    }).to_csv(path, index=False)
+    return str(path)
+
+
+def assert_same_reviews(loaded: pd.DataFrame, csv_path: str):
+    expected = pd.read_csv(csv_path)
+    assert list(loaded.columns) == list(expected.columns)
+    for column in expected.columns:
+        np.testing.assert_array_equal(np.asarray(loaded[column], dtype=object), np.asarray(expected[column], dtype=object))
+
+
+def append_row(csv_path: str, row: str):
+    with open(csv_path, 'a', encoding='utf-8') as f:
+        f.write(row + '\n')
+
+
+def test_store_is_built_once_and_reused(csv_path, tmp_path):
+    store = str(tmp_path / 'store')
+    assert ratings_store.is_stale(csv_path, store)
+    assert_same_reviews(ratings_store.load_reviews(csv_path, store), csv_path)
+    assert not ratings_store.is_stale(csv_path, store)
+
+    meta_mtime = os.stat(os.path.join(store, ratings_store.META_FILE)).st_mtime_ns
+    ratings_store.load_reviews(csv_path, store)
+    assert os.stat(os.path.join(store, ratings_store.META_FILE)).st_mtime_ns == meta_mtime
+
+
+def test_changed_csv_rebuilds_store(csv_path, tmp_path):
+    store = str(tmp_path / 'store')
+    ratings_store.load_reviews(csv_path, store)
+    append_row(csv_path, '4,Solaris,1972,drama,3.5')
+
+    assert ratings_store.is_stale(csv_path, store)
+    reviews = ratings_store.load_reviews(csv_path, store)
+    assert_same_reviews(reviews, csv_path)
+    assert 'Solaris' in reviews['title'].cat.categories
+
+
+@pytest.mark.parametrize('damage', ['meta', 'column', 'truncated'])
+def test_corrupt_store_is_rebuilt(csv_path, tmp_path, damage):
+    store = str(tmp_path / 'store')
+    ratings_store.load_reviews(csv_path, store)
+    if damage == 'meta':
+        with open(os.path.join(store, ratings_store.META_FILE), 'w', encoding='utf-8') as f:
+            f.write('{"source_signature": ')
+    elif damage == 'column':
+        os.remove(os.path.join(store, 'column_1.npy'))
+    else:
+        np.save(os.path.join(store, 'column_4.npy'), np.zeros(2, dtype=np.float32))
+
+    assert_same_reviews(ratings_store.load_reviews(csv_path, store), csv_path)
+    assert_same_reviews(ratings_store.load(store), csv_path)
@@ -0,0 +1,64 @@
+import pytest
+import response_cache
+from response_cache import ResponseCache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(response_cache.time, 'monotonic', clock)
+    return clock
+
+
+def test_least_recently_used_entry_is_evicted(clock):
+    cache = ResponseCache(max_entries=2, ttl=60)
+    cache.put('a', b'1')
+    cache.put('b', b'2')
+    assert cache.get('a') == b'1'
+    cache.put('c', b'3')
+
+    assert cache.get('b') is None
+    assert cache.get('a') == b'1'
+    assert cache.get('c') == b'3'
+    assert cache.stats()['evictions'] == 1
+
+
+def test_expired_entry_is_a_miss(clock):
+    cache = ResponseCache(max_entries=10, ttl=60)
+    cache.put('a', b'1')
+    clock.now += 59
+    assert cache.get('a') == b'1'
+    clock.now += 2
+
+    assert cache.get('a') is None
+    stats = cache.stats()
+    assert (stats['entries'], stats['expirations'], stats['hits'], stats['misses']) == (0, 1, 1, 1)
+
+
+def test_put_refreshes_ttl(clock):
+    cache = ResponseCache(max_entries=10, ttl=60)
+    cache.put('a', b'1')
+    clock.now += 50
+    cache.put('a', b'2')
+    clock.now += 50
+
+    assert cache.get('a') == b'2'
+
+
+def test_clear_drops_all_entries(clock):
+    cache = ResponseCache(max_entries=10, ttl=60)
+    cache.put(('/get_name_films/', 0), b'[]')
+    cache.put(('/get_popularite_films/', 0), b'[]')
+    cache.clear()
+
+    assert cache.get(('/get_name_films/', 0)) is None
+    stats = cache.stats()
+    assert (stats['entries'], stats['bytes'], stats['invalidations']) == (0, 0, 1)
@@ -0,0 +1,101 @@
+import numpy as np, pandas as pd
+import pytest
+from neighbours import create_neighbours
+from popularity import PopularityStats
+from similarity_index import SimilarityIndex
+from snapshot import RecommenderSnapshot
+from user_index import UserReviewsIndex
+from users_pivot import UsersPivot
+
+MIN_RATINGS = 5
+
+
+def make_reviews(seed: int = 0, n_users: int = 60, n_titles: int = 30, n_ratings: int = 900) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    titles = np.array([f'Film {i:02d}' for i in range(n_titles)])
+    title_codes = rng.integers(0, n_titles, n_ratings)
+    df = pd.DataFrame({
+        'userId': rng.integers(1, n_users + 1, n_ratings).astype(np.int32),
+        'title': pd.Categorical(titles[title_codes]),
+        'year-production': (1990 + title_codes).astype(np.int32),
+        'genres': pd.Categorical(np.array(['drama', 'comedy', 'horror'])[title_codes % 3]),
+        # Непрерывные оценки: у корреляций фильмов нет равных значений, порядок соседей однозначен
+        'rating': rng.uniform(0.5, 5.0, n_ratings).astype(np.float32),
+    })
+    return df
+
+
+def build_snapshot(df: pd.DataFrame) -> RecommenderSnapshot:
+    """Полная сборка, как RecomendationSystem.create_snapshot, без файловых кэшей"""
+    user_reviews = UserReviewsIndex(df, min_ratings=MIN_RATINGS)
+    users_pivot = UsersPivot.from_reviews(user_reviews.eligible_reviews())
+    similarity_index = SimilarityIndex.build(users_pivot.matrix, users_pivot.columns)
+    return RecommenderSnapshot(df, user_reviews, users_pivot, similarity_index,
+                               create_neighbours(users_pivot.matrix), PopularityStats(df))
+
+
+@pytest.fixture
+def snapshot_and_new_reviews():
+    df = make_reviews()
+    snapshot = build_snapshot(df)
+    users = snapshot.users_pivot.index[:4].to_numpy()
+    new_reviews = pd.DataFrame({
+        'userId': np.repeat(users, 3),
+        'title': ['Film 00', 'Film 07', 'New film'] * len(users),
+        'rating': np.linspace(1.0, 5.0, 3 * len(users)),
+        'year-production': 2020,
+        'genres': ['drama', 'comedy', 'documentary'] * len(users),
+    })
+    return snapshot, new_reviews
+
+
+def dense_pivot(users_pivot: UsersPivot) -> pd.DataFrame:
+    frame = pd.DataFrame(users_pivot.matrix.toarray(), index=users_pivot.index, columns=users_pivot.columns)
+    return frame.sort_index().sort_index(axis=1)
+
+
+def test_with_ratings_pivot_matches_full_rebuild(snapshot_and_new_reviews):
+    snapshot, new_reviews = snapshot_and_new_reviews
+    updated = snapshot.with_ratings(new_reviews)
+    rebuilt = build_snapshot(pd.concat([snapshot.df_films_reviews, new_reviews], ignore_index=True))
+
+    assert updated.version == snapshot.version + 1
+    pd.testing.assert_frame_equal(dense_pivot(updated.users_pivot), dense_pivot(rebuilt.users_pivot),
+                                  check_names=False, rtol=1e-6)
+    for user_id in new_reviews['userId'].unique():
+        np.testing.assert_array_equal(updated.user_reviews.positions(user_id), rebuilt.user_reviews.positions(user_id))
+    assert updated.user_reviews.eligible_users == rebuilt.user_reviews.eligible_users
+
+
+def test_with_ratings_similarity_matches_full_rebuild(snapshot_and_new_reviews):
+    snapshot, new_reviews = snapshot_and_new_reviews
+    updated = snapshot.with_ratings(new_reviews).similarity_index
+    rebuilt = build_snapshot(pd.concat([snapshot.df_films_reviews, new_reviews], ignore_index=True)).similarity_index
+
+    assert sorted(updated.titles) == sorted(rebuilt.titles)
+    for title in rebuilt.titles:
+        updated_titles, updated_scores = updated.similar(title, top_n=20)
+        rebuilt_titles, rebuilt_scores = rebuilt.similar(title, top_n=20)
+        assert updated_titles == rebuilt_titles, title
+        np.testing.assert_allclose(updated_scores, rebuilt_scores, rtol=1e-5, atol=1e-6)
+
+
+def test_with_ratings_popularity_matches_full_rebuild(snapshot_and_new_reviews):
+    snapshot, new_reviews = snapshot_and_new_reviews
+    updated = snapshot.with_ratings(new_reviews).popularity
+    rebuilt = PopularityStats(pd.concat([snapshot.df_films_reviews, new_reviews], ignore_index=True))
+
+    pd.testing.assert_frame_equal(updated.title_stats.sort_index(), rebuilt.title_stats.sort_index(),
+                                  check_dtype=False, check_index_type=False)
+    pd.testing.assert_frame_equal(updated.popularite_films(), rebuilt.popularite_films())
+    for genre in ('drama', 'documentary'):
+        pd.testing.assert_frame_equal(updated.popularite_films_by_genre(genre), rebuilt.popularite_films_by_genre(genre))
+
+
+def test_with_ratings_keeps_previous_snapshot(snapshot_and_new_reviews):
+    snapshot, new_reviews = snapshot_and_new_reviews
+    before = dense_pivot(snapshot.users_pivot)
+    snapshot.with_ratings(new_reviews)
+
+    pd.testing.assert_frame_equal(dense_pivot(snapshot.users_pivot), before)
+    assert 'New film' not in snapshot.films.index
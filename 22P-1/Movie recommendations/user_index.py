@@ -0,0 +1,48 @@
+import numpy as np, pandas as pd
+
+TEST_USERS = (222333, 333222)
+
+
+class UserReviewsIndex:
+    """Оценки, сгруппированные по userId: позиции строк каждого пользователя лежат подряд в order[offsets[i]:offsets[i + 1]]"""
+
+    def __init__(self, df_films_reviews: pd.DataFrame, min_ratings: int = 1000, test_users=TEST_USERS, order: np.ndarray = None):
+        self.df_films_reviews = df_films_reviews
+        self.min_ratings = min_ratings
+        self.test_users = test_users
+        user_ids = df_films_reviews['userId'].to_numpy()
+        # Стабильная сортировка сохраняет исходный порядок строк внутри пользователя
+        self.order = np.argsort(user_ids, kind='stable') if order is None else order
+        sorted_ids = user_ids[self.order]
+        starts = np.flatnonzero(np.diff(sorted_ids, prepend=sorted_ids[:1] - 1)) if len(sorted_ids) else np.array([], dtype=np.int64)
+        self.users = sorted_ids[starts]
+        self.offsets = np.append(starts, len(user_ids))
+        self.counts = np.diff(self.offsets)
+
+        eligible = (self.counts > min_ratings) | np.isin(self.users, test_users)
+        first_seen = self.order[starts[eligible]]
+        self.eligible_users = self.users[eligible][np.argsort(first_seen)].tolist()
+
+    def append(self, df_films_reviews: pd.DataFrame) -> 'UserReviewsIndex':
+        """Индекс для df_films_reviews, в котором к прежним строкам дописаны новые: слияние вместо полной сортировки"""
+        n_old = len(self.order)
+        user_ids = df_films_reviews['userId'].to_numpy()
+        new_order = np.argsort(user_ids[n_old:], kind='stable') + n_old
+        insert_at = np.searchsorted(user_ids[self.order], user_ids[new_order], side='right')
+        order = np.insert(self.order, insert_at, new_order)
+        return UserReviewsIndex(df_films_reviews, self.min_ratings, self.test_users, order)
+
+    def positions(self, user_id) -> np.ndarray:
+        i = np.searchsorted(self.users, user_id)
+        if i == len(self.users) or self.users[i] != user_id:
+            return self.order[:0]
+        return self.order[self.offsets[i]:self.offsets[i + 1]]
+
+    def reviews(self, user_id) -> pd.DataFrame:
+        return self.df_films_reviews.iloc[self.positions(user_id)]
+
+    def eligible_reviews(self, users_id=None) -> pd.DataFrame:
+        """Оценки пользователей, попадающих в сводную таблицу (> min_ratings оценок или тестовые)"""
+        users_id = self.eligible_users if users_id is None else users_id
+        mask = np.isin(self.df_films_reviews['userId'].to_numpy(), users_id)
+        return self.df_films_reviews[mask]
@@ -0,0 +1,106 @@
+import numpy as np, pandas as pd
+from scipy.sparse import coo_matrix, csr_matrix, diags
+
+
+class UsersPivot:
+    """Разреженная сводная таблица пользователи × фильмы с метками строк (index) и столбцов (columns)"""
+
+    def __init__(self, matrix: csr_matrix, index: pd.Index, columns: pd.Index):
+        self.matrix = matrix
+        self.index = index
+        self.columns = columns
+
+    @classmethod
+    def from_reviews(cls, df: pd.DataFrame, index: str = 'userId', columns: str = 'title', values: str = 'rating') -> 'UsersPivot':
+        """Аналог pivot_table(...).fillna(0) без плотной матрицы: повторные оценки усредняются, как aggfunc='mean'"""
+        row_codes, row_labels = pd.factorize(df[index], sort=True)
+        column_codes, column_labels = pd.factorize(df[columns], sort=True)
+        shape = (len(row_labels), len(column_labels))
+        matrix = _mean_matrix(df[values].to_numpy(dtype=np.float64), row_codes, column_codes, shape)
+        return cls(matrix, pd.Index(np.asarray(row_labels), name=index), pd.Index(np.asarray(column_labels), name=columns))
+
+    def update(self, user_reviews: pd.DataFrame, index: str = 'userId', columns: str = 'title', values: str = 'rating') -> 'UsersPivot':
+        """Новая таблица, где строки пользователей из user_reviews (все их оценки) пересчитаны; новые пользователи и фильмы дописываются в конец"""
+        new_index = self.index.append(pd.Index(np.asarray(pd.unique(user_reviews[index]))).difference(self.index))
+        new_columns = self.columns.append(pd.Index(np.asarray(pd.unique(user_reviews[columns]))).difference(self.columns))
+        shape = (len(new_index), len(new_columns))
+        row_codes = new_index.get_indexer(np.asarray(user_reviews[index]))
+        column_codes = new_columns.get_indexer(np.asarray(user_reviews[columns]))
+
+        matrix = self.matrix.copy()
+        matrix.resize(shape)
+        keep = np.ones(shape[0])
+        keep[row_codes] = 0
+        matrix = (diags(keep) @ matrix + _mean_matrix(user_reviews[values].to_numpy(dtype=np.float64), row_codes, column_codes, shape)).tocsr()
+        matrix.eliminate_zeros()
+        return UsersPivot(matrix, new_index.rename(index), new_columns.rename(columns))
+
+    def favorite_columns(self, user_rows, neighbour_rows, neighbour_distances, top_n: int = 10,
+                         block_bytes: int = 64 * 2**20):
+        """Любимые фильмы соседей, которых пользователь еще не оценил: для каждой строки user_rows фильмы ранжируются
+        по сумме оценок его соседей neighbour_rows с весом косинусного сходства (1 - расстояние), без повторов;
+        при равной сумме выше фильм ближайшего соседа. Возвращает индексы столбцов (пользователи, top_n) и расстояние
+        до ближайшего соседа, оценившего фильм; фильмов не хватило - -1 и inf"""
+        user_rows = np.asarray(user_rows, dtype=np.int64)
+        neighbour_rows = np.asarray(neighbour_rows, dtype=np.int64)
+        neighbour_distances = np.asarray(neighbour_distances, dtype=np.float64)
+        n_titles = self.matrix.shape[1]
+        top_n = min(top_n, n_titles)
+        columns = np.full((len(user_rows), top_n), -1, dtype=np.int64)
+        distances = np.full((len(user_rows), top_n), np.inf)
+        # Два плотных блока (пользователи блока, фильмы) - не больше block_bytes
+        block = max(1, block_bytes // (16 * max(n_titles, 1)))
+        for start in range(0, len(user_rows), block):
+            rows = slice(start, start + block)
+            columns[rows], distances[rows] = self._favorite_block(user_rows[rows], neighbour_rows[rows],
+                                                                  neighbour_distances[rows], top_n)
+        return columns, distances
+
+    def column_labels(self, indices: np.ndarray) -> tuple:
+        """Метки столбцов для индексов из favorite_columns одной выборкой и число найденных в каждой строке
+        (ненайденные, -1, стоят в конце строки)"""
+        return np.asarray(self.columns)[np.maximum(indices, 0)], (indices >= 0).sum(axis=1)
+
+    def _favorite_block(self, user_rows: np.ndarray, neighbour_rows: np.ndarray, neighbour_distances: np.ndarray, top_n: int):
+        n_users, n_neighbours = neighbour_rows.shape
+        # Оценки всех соседей блока одной выборкой строк; строка r принадлежит пользователю r // n_neighbours
+        rated = self.matrix[neighbour_rows.ravel()]
+        owners = np.repeat(np.arange(n_users), n_neighbours)
+        shape = (n_users, rated.shape[0])
+        weights = csr_matrix(((1 - neighbour_distances).ravel(), (owners, np.arange(rated.shape[0]))), shape=shape)
+        scores = (weights @ rated).toarray()
+        # При равной сумме выше фильм более близкого соседа: вес 2^-ранг больше суммы весов всех соседей дальше
+        # (точно в float64 до ~1000 соседей), и старший вес в сумме дает ранг ближайшего оценившего
+        rank_weights = csr_matrix((np.tile(0.5 ** np.arange(n_neighbours), n_users), (owners, np.arange(rated.shape[0]))), shape=shape)
+        rated.data = np.ones_like(rated.data)
+        closeness = (rank_weights @ rated).toarray()
+
+        own = self.matrix[user_rows].tocoo()
+        scores[own.row, own.col] = -np.inf
+        scores[closeness == 0] = -np.inf
+
+        n_titles = scores.shape[1]
+        part = np.argpartition(-scores, top_n - 1, axis=1)[:, :top_n] if n_titles > top_n else np.tile(np.arange(n_titles), (n_users, 1))
+        order = np.lexsort((-np.take_along_axis(closeness, part, axis=1), -np.take_along_axis(scores, part, axis=1)), axis=1)
+        best = np.take_along_axis(part, order, axis=1)
+        found = np.isfinite(np.take_along_axis(scores, best, axis=1))
+        with np.errstate(divide='ignore'):
+            nearest_rank = np.clip(-np.floor(np.log2(np.take_along_axis(closeness, best, axis=1))), 0, n_neighbours - 1).astype(np.int64)
+        distances = np.take_along_axis(neighbour_distances, nearest_rank, axis=1)
+        return np.where(found, best, -1), np.where(found, distances, np.inf)
+
+    @property
+    def shape(self) -> tuple:
+        return self.matrix.shape
+
+    def to_dense(self) -> pd.DataFrame:
+        return pd.DataFrame(self.matrix.toarray(), index=self.index, columns=self.columns)
+
+
+def _mean_matrix(values: np.ndarray, row_codes: np.ndarray, column_codes: np.ndarray, shape: tuple) -> csr_matrix:
+    sums = coo_matrix((values, (row_codes, column_codes)), shape=shape).tocsr()
+    counts = coo_matrix((np.ones(len(values), dtype=np.float64), (row_codes, column_codes)), shape=shape).tocsr()
+    if counts.nnz < len(values):
+        sums.data /= counts.data
+    sums.eliminate_zeros()
+    return sums
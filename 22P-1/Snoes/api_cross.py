@@ -1,19 +1,53 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.exceptions import RequestValidationError
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel, ValidationError
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
-import tensorflow as tf
 from PIL import Image
 import io
+import os
+import sys
 import base64
+import asyncio
 import logging
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from service_metrics import Metrics
+from micro_batching import MicroBatcher
+from bounded_executor import BoundedExecutor
+from numpy_runtime import NumpyModel
+
 # Настройка логирования
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Среда выполнения модели: keras - TensorFlow и keras_model_cross.h5, numpy - keras_model_cross.npz без импорта TensorFlow
+# (экспорт в папке 22P-1: python numpy_runtime.py "Snoes/keras_model_cross.h5")
+MODEL_RUNTIME = os.environ.get('MODEL_RUNTIME', 'keras')
+# Объединение одновременных запросов в один вызов модели: до INFERENCE_BATCH_SIZE изображений,
+# первое ждет остальных не дольше INFERENCE_BATCH_WINDOW_MS. INFERENCE_BATCH_SIZE=1 - каждый запрос отдельно
+INFERENCE_BATCH_SIZE = int(os.environ.get('INFERENCE_BATCH_SIZE', '32'))
+INFERENCE_BATCH_WINDOW_MS = float(os.environ.get('INFERENCE_BATCH_WINDOW_MS', '1'))
+# Где считается модель: thread - пул потоков (TensorFlow и NumPy отпускают GIL), process - пул процессов, inline - в event loop.
+# Одновременно не больше INFERENCE_MAX_IN_FLIGHT запросов (не меньше INFERENCE_BATCH_SIZE, иначе батчи не наберутся),
+# еще INFERENCE_MAX_QUEUE ждут, остальные получают 503
+INFERENCE_EXECUTOR = os.environ.get('INFERENCE_EXECUTOR', 'thread')
+INFERENCE_WORKERS = int(os.environ.get('INFERENCE_WORKERS', str(os.cpu_count() or 1)))
+INFERENCE_MAX_IN_FLIGHT = int(os.environ.get('INFERENCE_MAX_IN_FLIGHT', '64'))
+INFERENCE_MAX_QUEUE = int(os.environ.get('INFERENCE_MAX_QUEUE', '256'))
+# Не больше изображений в одном запросе к /predict_batch: все они разом лежат в памяти (224x224x3 float32 - 0.6 МБ)
+MAX_BATCH_IMAGES = int(os.environ.get('MAX_BATCH_IMAGES', '128'))
+# Потоки для декодирования и ресайза изображений (PIL отпускает GIL)
+PREPROCESS_WORKERS = int(os.environ.get('PREPROCESS_WORKERS', str(os.cpu_count() or 1)))
+
 app = FastAPI(title="Shoe Recognition API")
 
+# Длительности этапов и счетчики запросов на /metrics (METRICS_ENABLED=0 - выключить)
+metrics = Metrics()
+metrics.instrument(app)
+
 # Разрешаем CORS
 app.add_middleware(
     CORSMiddleware,
@@ -27,51 +61,90 @@ app.add_middleware(
 class PredictionRequest(BaseModel):
     image: str  # base64-encoded image (возможно с data URL prefix)
 
+class BatchPredictionRequest(BaseModel):
+    images: list[str]  # base64-encoded images (возможно с data URL prefix)
+
 # Классы обуви (в том же порядке, что и в выходных нейронах модели)
 CLASS_NAMES = ["boots", "sneakers", "shoes"]  # ← ПОМЕНЯЙ ПОРЯДОК, ЕСЛИ НУЖНО!
 
 # Загрузка модели
 try:
-    model = tf.keras.models.load_model('keras_model_cross.h5')
+    with metrics.model_load('keras_model_cross'):
+        if MODEL_RUNTIME == 'numpy':
+            model = NumpyModel.load('keras_model_cross.npz')
+        else:
+            import tensorflow as tf
+            model = tf.keras.models.load_model('keras_model_cross.h5')
     logger.info("✅ Модель обуви успешно загружена")
 except Exception as e:
     logger.error(f"❌ Ошибка загрузки модели: {e}")
     model = None
 
-def preprocess_image(image_data: str) -> np.ndarray:
-    try:
-        logger.info("Начало предобработки изображения")
+def run_model(batch: np.ndarray) -> np.ndarray:
+    """Один проход модели по батчу (n, 224, 224, 3)"""
+    return model.predict(batch, verbose=0)
 
-        # Убираем data URL prefix, если есть
-        if ',' in image_data:
-            image_data = image_data.split(',')[1]
+inference_pool = BoundedExecutor(INFERENCE_EXECUTOR, INFERENCE_WORKERS, INFERENCE_MAX_IN_FLIGHT, INFERENCE_MAX_QUEUE,
+                               name='keras_model_cross')
+batcher = MicroBatcher(run_model, INFERENCE_BATCH_SIZE, INFERENCE_BATCH_WINDOW_MS, metrics=metrics, name='keras_model_cross',
+                       run=inference_pool.submit)
+preprocess_pool = ThreadPoolExecutor(PREPROCESS_WORKERS, thread_name_prefix='preprocess')
 
-        # Декодируем base64
-        image_bytes = base64.b64decode(image_data)
-        logger.info("Base64 декодирован")
+def image_to_array(image_data) -> np.ndarray:
+    """Изображение в base64 (str), байты или открытый файл -> массив (224, 224, 3) float32 в диапазоне [0, 1]"""
+    with metrics.stage('decode'):
+        if isinstance(image_data, str):
+            # Убираем data URL prefix, если есть
+            if ',' in image_data:
+                image_data = image_data.split(',')[1]
+            image_data = base64.b64decode(image_data)
+
+        # BytesIO над bytes не копирует буфер; файл из multipart PIL читает сам
+        if isinstance(image_data, bytes):
+            image_data = io.BytesIO(image_data)
 
         # Открываем и конвертируем в RGB (важно для цветных моделей!)
-        image = Image.open(io.BytesIO(image_bytes)).convert('RGB')
-        logger.info("Изображение открыто и конвертировано в RGB")
+        image = Image.open(image_data).convert('RGB')
 
+    with metrics.stage('preprocess'):
         # Изменяем размер до 224x224 (или того, что ожидает модель)
         image = image.resize((224, 224))
         image_array = np.array(image)
-        logger.info(f"Размер изображения после ресайза: {image_array.shape}")
 
         # Нормализуем пиксели к диапазону [0, 1] (если модель обучена так)
-        image_array = image_array.astype('float32') / 255.0
+        return image_array.astype('float32') / 255.0
 
+def preprocess_image(image_data) -> np.ndarray:
+    try:
         # Добавляем batch dimension
-        image_array = np.expand_dims(image_array, axis=0)  # shape: (1, 224, 224, 3)
-        logger.info(f"Финальный размер для модели: {image_array.shape}")
-
-        return image_array
+        return np.expand_dims(image_to_array(image_data), axis=0)  # shape: (1, 224, 224, 3)
 
     except Exception as e:
         logger.error(f"Ошибка в preprocess_image: {str(e)}")
         raise HTTPException(status_code=400, detail=f"Ошибка обработки изображения: {str(e)}")
 
+async def preprocess_in_pool(image_data) -> np.ndarray:
+    """preprocess_image в пуле потоков предобработки: декодирование и ресайз не занимают event loop"""
+    return await asyncio.get_running_loop().run_in_executor(preprocess_pool, preprocess_image, image_data)
+
+def safe_image_to_array(image_data: str | bytes):
+    """Для /predict_batch: массив изображения или текст ошибки, чтобы одно битое изображение не роняло весь запрос"""
+    try:
+        return image_to_array(image_data)
+    except Exception as e:
+        return f"Ошибка обработки изображения: {str(e)}"
+
+def prediction_result(probabilities: np.ndarray) -> dict:
+    """Ответ модели для одного изображения -> класс, уверенность и вероятности всех классов"""
+    # Получаем индекс с максимальной вероятностью
+    predicted_idx = int(np.argmax(probabilities))
+    return {
+        "success": True,
+        "predicted_class": CLASS_NAMES[predicted_idx],
+        "confidence": float(np.max(probabilities)),
+        "probabilities": {CLASS_NAMES[i]: float(probabilities[i]) for i in range(len(CLASS_NAMES))}
+    }
+
 @app.get("/")
 async def root():
     return {"message": "Shoe Recognition API is running!"}
@@ -81,16 +154,25 @@ async def health_check():
     return {
         "status": "healthy",
         "model_loaded": model is not None,
+        "runtime": MODEL_RUNTIME,
         "classes": CLASS_NAMES,
         "message": "API готов к работе"
     }
 
+@app.get("/batching_stats")
+async def batching_stats():
+    """Размеры батчей, время ожидания в очереди и время прохода модели"""
+    return batcher.stats()
+
+@app.get("/inference_stats")
+async def inference_stats():
+    """Запросы в очереди и в работе, отказы из-за перегрузки, среднее ожидание и время работы модели"""
+    return inference_pool.stats()
+
 @app.post("/predict")
 async def predict_shoe(request: PredictionRequest):
     """Эндпоинт для предсказания типа обуви"""
     try:
-        logger.info("Получен запрос на /predict")
-
         if model is None:
             raise HTTPException(status_code=500, detail="Модель не загружена")
 
@@ -99,38 +181,96 @@ async def predict_shoe(request: PredictionRequest):
             raise HTTPException(status_code=400, detail="No image data provided")
 
         # Предобработка
-        processed_image = preprocess_image(image_data)
+        processed_image = await preprocess_in_pool(image_data)
 
-        # Предсказание
-        logger.info("Начало предсказания...")
-        predictions = model.predict(processed_image, verbose=0)
-        logger.info("Предсказание завершено")
+        return await classify_shoe(processed_image)
 
-        # Получаем индекс с максимальной вероятностью
-        predicted_idx = int(np.argmax(predictions[0]))
-        predicted_class = CLASS_NAMES[predicted_idx]
-        confidence = float(np.max(predictions[0]))
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Ошибка в predict_shoe: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
 
-        # Вероятности для всех классов
-        probabilities = {
-            CLASS_NAMES[i]: float(predictions[0][i]) for i in range(len(CLASS_NAMES))
-        }
+@app.post("/predict_raw")
+async def predict_shoe_raw(request: Request):
+    """Предсказание типа обуви без base64 и JSON: тело application/octet-stream с байтами JPEG/PNG
+    или multipart/form-data с файлом в поле image"""
+    try:
+        if model is None:
+            raise HTTPException(status_code=500, detail="Модель не загружена")
 
-        logger.info(f"Предсказанный класс: {predicted_class}, уверенность: {confidence:.4f}")
+        if request.headers.get('content-type', '').startswith('multipart/form-data'):
+            async with request.form(max_files=1) as form:
+                upload = form.get('image')
+                if upload is None or isinstance(upload, str):
+                    raise HTTPException(status_code=400, detail="No image file provided")
+                processed_image = await preprocess_in_pool(upload.file)
+        else:
+            image_bytes = await request.body()
+            if not image_bytes:
+                raise HTTPException(status_code=400, detail="No image data provided")
+            processed_image = await preprocess_in_pool(image_bytes)
 
-        return {
-            "success": True,
-            "predicted_class": predicted_class,
-            "confidence": confidence,
-            "probabilities": probabilities
-        }
+        return await classify_shoe(processed_image)
 
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Ошибка в predict_shoe: {str(e)}")
+        logger.error(f"Ошибка в predict_shoe_raw: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+async def classify_shoe(processed_image: np.ndarray) -> JSONResponse:
+    # Предсказание: изображение уходит в общий батч с другими одновременными запросами, модель считается в пуле
+    with metrics.stage('inference'):
+        async with inference_pool.slot():
+            predictions = await batcher.predict(processed_image)
+
+    with metrics.stage('serialization'):
+        return JSONResponse(prediction_result(predictions[0]))
+
+@app.post("/predict_batch")
+async def predict_shoe_batch(request: Request):
+    """Много изображений за один запрос: JSON {"images": [base64, ...]} или multipart/form-data с файлами в поле images.
+    Результаты в том же порядке; для битого изображения - success: false и текст ошибки, остальные считаются"""
+    if model is None:
+        raise HTTPException(status_code=500, detail="Модель не загружена")
+
+    if request.headers.get('content-type', '').startswith('multipart/form-data'):
+        async with request.form(max_files=MAX_BATCH_IMAGES) as form:
+            # В поле images - файлы или base64-строки
+            images = [item if isinstance(item, str) else await item.read() for item in form.getlist('images')]
+    else:
+        try:
+            images = BatchPredictionRequest.model_validate_json(await request.body()).images
+        except ValidationError as e:
+            raise RequestValidationError([{**error, 'loc': ('body', *error['loc'])} for error in e.errors(include_url=False)])
+
+    if not images:
+        raise HTTPException(status_code=400, detail="No image data provided")
+    if len(images) > MAX_BATCH_IMAGES:
+        raise HTTPException(status_code=413, detail=f"Не больше {MAX_BATCH_IMAGES} изображений за запрос")
+
+    # Декодирование и ресайз параллельно в пуле потоков, event loop остается свободным
+    loop = asyncio.get_running_loop()
+    arrays = await asyncio.gather(*(loop.run_in_executor(preprocess_pool, safe_image_to_array, image) for image in images))
+    valid = [i for i, array in enumerate(arrays) if not isinstance(array, str)]
+
+    # Батчи по INFERENCE_BATCH_SIZE изображений через общую очередь вместе с одиночными запросами
+    predictions = []
+    if valid:
+        chunk = max(INFERENCE_BATCH_SIZE, 1)
+        with metrics.stage('inference'):
+            async with inference_pool.slot():
+                outputs = await asyncio.gather(*(batcher.predict(np.stack([arrays[i] for i in valid[start:start + chunk]]))
+                                                 for start in range(0, len(valid), chunk)))
+        predictions = np.concatenate(outputs)
+
+    with metrics.stage('serialization'):
+        results = [{"success": False, "error": array} if isinstance(array, str) else None for array in arrays]
+        for i, probabilities in zip(valid, predictions):
+            results[i] = prediction_result(probabilities)
+        return JSONResponse({"success": True, "count": len(results), "results": results})
+
 # Тестовый эндпоинт (можно удалить)
 @app.post("/predict_test")
 async def predict_test():
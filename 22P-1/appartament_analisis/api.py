@@ -1,12 +1,24 @@
-from fastapi import FastAPI
-from pydantic import BaseModel
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel, TypeAdapter, ValidationError
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
 import numpy as np
-import pickle
 import uvicorn
+import asyncio
+import os
+import sys
 from typing import Dict, Any
 from datetime import date
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from service_metrics import Metrics
+from bounded_executor import BoundedExecutor
+from feature_layout import FeatureLayout
+from model_registry import ModelRegistry, ModelLoadError
+from prediction_cache import PredictionCache
+
 # Создание приложения FastAPI
 app = FastAPI(
     title="API для предсказания недвижимости",
@@ -14,39 +26,36 @@ app = FastAPI(
     version="1.0.0"
 )
 
-# Загрузка моделей
-try:
-    with open('xgb_reg.pkl', 'rb') as f:
-        regressor_model = pickle.load(f)
-
-    with open('bagging_clf.pkl', 'rb') as f:
-        classifier_model = pickle.load(f)
-
-    print("✅ Модели успешно загружены")
-
-    # Получаем имена признаков из моделей
-    try:
-        regressor_features = regressor_model.feature_names_in_
-        print(f"Признаки регрессора ({len(regressor_features)}): {list(regressor_features)}")
-        print(regressor_features)
-    except:
-        regressor_features = None
-        print("Не удалось получить признаки регрессора")
-
-    try:
-        classifier_features = classifier_model.feature_names_in_
-        print(f"Признаки классификатора ({len(classifier_features)}): {list(classifier_features)}")
-    except:
-        classifier_features = None
-        print("Не удалось получить признаки классификатора")
+# Не больше строк в одном запросе к /predict_batch
+MAX_BATCH_ROWS = int(os.environ.get('MAX_BATCH_ROWS', '100000'))
+# Где считаются модели: thread - пул потоков (sklearn и XGBoost отпускают GIL), process - пул процессов, inline - в event loop.
+# Одновременно не больше INFERENCE_MAX_IN_FLIGHT запросов, еще INFERENCE_MAX_QUEUE ждут, остальные получают 503
+INFERENCE_EXECUTOR = os.environ.get('INFERENCE_EXECUTOR', 'thread')
+INFERENCE_WORKERS = int(os.environ.get('INFERENCE_WORKERS', str(os.cpu_count() or 1)))
+INFERENCE_MAX_IN_FLIGHT = int(os.environ.get('INFERENCE_MAX_IN_FLIGHT', str(INFERENCE_WORKERS * 2)))
+INFERENCE_MAX_QUEUE = int(os.environ.get('INFERENCE_MAX_QUEUE', '256'))
+# Потоки для разбора тела /predict_batch (JSON, CSV, Parquet) - не в event loop и не в пуле моделей
+PREPROCESS_WORKERS = int(os.environ.get('PREPROCESS_WORKERS', str(os.cpu_count() or 1)))
+# Папка моделей (по умолчанию - папка api.py, а не текущая) и пути к файлам; MODEL_<ИМЯ>_SHA256 - ожидаемая контрольная сумма
+# (иначе берется из <файл>.sha256 рядом с моделью, если он есть). Файлы проверяются раз в MODEL_RELOAD_INTERVAL секунд
+# и при изменении модель подменяется без перезапуска
+MODEL_DIR = os.environ.get('MODEL_DIR', os.path.dirname(os.path.abspath(__file__)))
+MODEL_PATHS = {
+    'xgb_reg': os.path.join(MODEL_DIR, os.environ.get('MODEL_XGB_REG_PATH', 'xgb_reg.pkl')),
+    'bagging_clf': os.path.join(MODEL_DIR, os.environ.get('MODEL_BAGGING_CLF_PATH', 'bagging_clf.pkl')),
+}
+MODEL_CHECKSUMS = {name: os.environ.get(f'MODEL_{name.upper()}_SHA256') for name in MODEL_PATHS}
+MODEL_RELOAD_INTERVAL = float(os.environ.get('MODEL_RELOAD_INTERVAL', '2'))
+# Сколько ответов /predict помнить: фронтенд шлет в основном одни и те же объекты (PREDICTION_CACHE_SIZE=0 - без кэша)
+PREDICTION_CACHE_SIZE = int(os.environ.get('PREDICTION_CACHE_SIZE', '10000'))
 
-except Exception as e:
-    print(f"Ошибка загрузки моделей: {e}")
-    regressor_model = None
-    classifier_model = None
-    regressor_features = None
-    classifier_features = None
+# Длительности этапов и счетчики запросов на /metrics (METRICS_ENABLED=0 - выключить)
+metrics = Metrics()
+metrics.instrument(app)
 
+inference_pool = BoundedExecutor(INFERENCE_EXECUTOR, INFERENCE_WORKERS, INFERENCE_MAX_IN_FLIGHT, INFERENCE_MAX_QUEUE,
+                               name='property-models')
+preprocess_pool = ThreadPoolExecutor(PREPROCESS_WORKERS, thread_name_prefix='preprocess')
 
 # Модель данных для запроса
 class PropertyFeatures(BaseModel):
@@ -70,6 +79,91 @@ class PropertyFeatures(BaseModel):
     sub_type_encoded: int = 0
 
 
+# Признаки в порядке полей PropertyFeatures - если у модели нет feature_names_in_
+FEATURE_FIELDS = list(PropertyFeatures.model_fields)
+REQUIRED_FIELDS = [name for name, field in PropertyFeatures.model_fields.items() if field.is_required()]
+property_list_adapter = TypeAdapter(list[PropertyFeatures])
+
+# Модели загружаются при первом предсказании, а не при импорте: процесс стартует сразу
+registry = ModelRegistry(MODEL_PATHS, FEATURE_FIELDS, MODEL_CHECKSUMS, MODEL_RELOAD_INTERVAL, metrics=metrics)
+
+# Кэш ответов /predict по вектору всех полей запроса в float32 - в той же точности, что получают модели;
+# подмена модели сбрасывает его. В режиме process модели загружены только в процессах пула, и этот процесс
+# не узнает об их подмене - кэш выключен, чтобы не отдавать ответы старой версии
+cache_layout = FeatureLayout(None, FEATURE_FIELDS)
+prediction_cache = PredictionCache(PREDICTION_CACHE_SIZE if INFERENCE_EXECUTOR != 'process' else 0,
+                                   metrics=metrics, name='property-models')
+registry.on_reload(prediction_cache.invalidate)
+
+
+def columns_from_frame(frame: pd.DataFrame) -> Dict[str, np.ndarray]:
+    """Таблица из CSV/Parquet -> {признак: числовой столбец} с той же проверкой, что у PropertyFeatures:
+    обязательные значения должны быть, пустые необязательные берутся по умолчанию, лишние столбцы игнорируются"""
+    missing = [name for name in REQUIRED_FIELDS if name not in frame.columns]
+    if missing:
+        raise RequestValidationError([{'type': 'missing', 'loc': ('body', 'file', name), 'msg': 'Field required'}
+                                      for name in missing])
+    columns = {}
+    for name in FEATURE_FIELDS:
+        default = PropertyFeatures.model_fields[name].default
+        if name not in frame.columns:
+            columns[name] = np.full(len(frame), default)
+            continue
+        empty = frame[name].isna().to_numpy()
+        column = pd.to_numeric(frame[name], errors='coerce').to_numpy()
+        invalid = np.isnan(column) & ~empty
+        if invalid.any():
+            raise RequestValidationError([{'type': 'number_parsing', 'loc': ('body', 'file', int(np.argmax(invalid)), name),
+                                           'msg': 'Input should be a valid number'}])
+        if empty.any():
+            if name in REQUIRED_FIELDS:
+                raise RequestValidationError([{'type': 'missing', 'loc': ('body', 'file', int(np.argmax(empty)), name),
+                                               'msg': 'Field required'}])
+            column = np.where(empty, default, column)
+        columns[name] = column
+    return columns
+
+
+def feature_block(layout: FeatureLayout, rows: list, columns: Dict[str, np.ndarray], n_rows: int) -> np.ndarray:
+    """Блок float32 (n_rows, признаки) в порядке модели из JSON-строк или из столбцов таблицы"""
+    return layout.from_rows(rows) if rows is not None else layout.from_columns(columns, n_rows)
+
+
+def current_models() -> tuple:
+    """Версии регрессора и классификатора на весь запрос: подмена модели в реестре начатый запрос не задевает"""
+    return registry.get('xgb_reg'), registry.get('bagging_clf')
+
+
+def predict_one(features: PropertyFeatures) -> tuple:
+    """Цена, тип одного объекта и версии моделей, которые их посчитали; выполняется в пуле inference_pool,
+    у каждого потока свой буфер строки"""
+    regressor, classifier = current_models()
+    with metrics.stage('preprocess'):
+        # Признаки сразу в массивы float32 в порядке каждой модели, без словаря и DataFrame на запрос
+        regressor_row = regressor.layout.row(features)
+        classifier_row = regressor_row if classifier.layout.names == regressor.layout.names else classifier.layout.row(features)
+
+    # Делаем предсказания
+    with metrics.stage('inference'):
+        price_prediction = regressor.model.predict(regressor.layout.model_input(regressor_row))[0]
+        subtype_prediction = classifier.model.predict(classifier.layout.model_input(classifier_row))[0]
+    return price_prediction, subtype_prediction, (regressor.version, classifier.version)
+
+
+def predict_rows(rows: list, columns: Dict[str, np.ndarray], n_rows: int) -> tuple:
+    """Цены и типы пакета объектов по одному вызову каждой модели; выполняется в пуле inference_pool"""
+    regressor, classifier = current_models()
+    with metrics.stage('preprocess'):
+        regressor_block = feature_block(regressor.layout, rows, columns, n_rows)
+        classifier_block = (regressor_block if classifier.layout.names == regressor.layout.names
+                            else feature_block(classifier.layout, rows, columns, n_rows))
+
+    with metrics.stage('inference'):
+        price_predictions = np.asarray(regressor.model.predict(regressor.layout.model_input(regressor_block)), dtype=np.float64)
+        subtype_predictions = np.asarray(classifier.model.predict(classifier.layout.model_input(classifier_block)))
+    return price_predictions, subtype_predictions
+
+
 # Корневой эндпоинт
 @app.get("/")
 async def root():
@@ -77,102 +171,136 @@ async def root():
         "message": "API для предсказания недвижимости",
         "version": "1.0.0",
         "endpoints": {
-            "POST /predict": "Предсказание цены и типа недвижимости"
+            "POST /predict": "Предсказание цены и типа недвижимости",
+            "POST /predict_batch": "Предсказания для многих объектов: JSON-массив или файл CSV/Parquet",
+            "GET /inference_stats": "Очередь и загрузка пула, в котором считаются модели",
+            "GET /models": "Версии моделей, время загрузки и занимаемая память",
+            "GET /cache_stats": "Размер кэша предсказаний, попадания и вытеснения"
         }
     }
 
 
+@app.get("/cache_stats")
+async def cache_stats():
+    """Записи в кэше /predict, доля попаданий, вытеснения при переполнении и сбросы при подмене модели"""
+    return prediction_cache.stats()
+
+
+@app.get("/models")
+async def models():
+    """Для каждой модели: путь, версия (начало sha256), проверена ли контрольная сумма, время загрузки, память,
+    число подмен на лету и последняя ошибка загрузки"""
+    return registry.stats()
+
+
+@app.get("/inference_stats")
+async def inference_stats():
+    """Запросы в очереди и в работе, отказы из-за перегрузки, среднее ожидание и время работы моделей"""
+    return inference_pool.stats()
+
+
 # Эндпоинт для предсказаний
 @app.post("/predict")
 async def predict_price_and_type(features: PropertyFeatures) -> Dict[str, Any]:
-    if not regressor_model or not classifier_model:
+    # Такой же объект уже считали текущие версии моделей - ответ из кэша, без пула и моделей
+    vector = cache_layout.row(features).tobytes()
+    cached = prediction_cache.get(vector, registry.versions())
+    if cached is not None:
+        return JSONResponse(cached)
+
+    # Модели считаются в пуле: event loop в это время отвечает на другие запросы
+    try:
+        price_prediction, subtype_prediction, versions = await inference_pool.run(predict_one, features)
+    except ModelLoadError as e:
+        print(f"Ошибка загрузки моделей: {e}")
         return {
             "error": "Модели не загружены",
             "predicted_price": 0,
             "predicted_subtype": -1
         }
 
-    
-    # Создаем словарь со всеми признаками
-    feature_dict = {
-        'total_floor_count': features.total_floor_count,
-        'listing_type': features.listing_type,
-        'tom': features.tom,
-        'building_age': features.building_age,
-        'floor_no': features.floor_no,
-        'room_count': features.room_count,
-        'size': features.size,
-        'heating_type': features.heating_type,
-        'price': features.price,
-        "address_encoded" : features.address_encoded,
-        'start_day': features.start_day,
-        'start_year': features.start_year,
-        'start_month': features.start_month,
-        'end_year': features.end_year,
-        'end_month' : features.end_month,
-        'end_day':  features.end_day,
-        'heating_type_ecnoded':features.heating_type_ecnoded,
-        'sub_type_encoded': features.sub_type_encoded
-    }
+    with metrics.stage('serialization'):
+        result = {
+            "predicted_price": float(price_prediction),
+            # Скаляр NumPy -> обычное число Python, иначе JSON его не сериализует
+            "predicted_subtype": subtype_prediction.item() if isinstance(subtype_prediction, np.generic) else subtype_prediction,
+            "status": "success"
+        }
+        prediction_cache.put(vector, versions, result)
+        return JSONResponse(result)
 
-    # Создаем DataFrame для регрессора
-    if regressor_features is not None:
-        regressor_data = {col: [feature_dict[col]] for col in regressor_features}
-        regressor_df = pd.DataFrame(regressor_data)
-    else:
-        # Создаем DataFrame с правильными именами столбцов
-        regressor_df = pd.DataFrame([[
-            features.listing_type,
-            features.tom,
-            features.building_age,
-            features.total_floor_count,
-            features.floor_no,
-            features.room_count,
-            features.size,
-            features.heating_type,
-            features.price,
-            features.address_encoded,
-            features.start_year
-        ]], columns=[
-            'listing_type', 'tom', 'building_age', 'total_floor_count',
-            'floor_no', 'room_count', 'size', 'heating_type', 'price', 'address_encoded', 'start_year',
-            'start_day','start_month','end_year','end_month','end_day','heating_type_ecnoded',
-            'sub_type_encoded'
-        ])
-
-    # Создаем DataFrame для классификатора (аналогично)
-    if classifier_features is not None:
-        classifier_data = {col: [feature_dict[col]] for col in classifier_features}
-        classifier_df = pd.DataFrame(classifier_data)
+
+# Эндпоинт для пакетных предсказаний
+@app.post("/predict_batch")
+async def predict_batch(request: Request):
+    """Предсказания для многих объектов за один вызов каждой модели.
+    Тело - JSON-массив объектов PropertyFeatures или multipart/form-data с файлом .csv/.parquet в поле file.
+    Ответ - столбцы predicted_price и predicted_subtype в порядке входных строк"""
+    # Разбор и проверка тела - в пуле preprocess_pool: большой пакет не останавливает event loop
+    loop = asyncio.get_running_loop()
+    if request.headers.get('content-type', '').startswith('multipart/form-data'):
+        async with request.form(max_files=1) as form:
+            upload = form.get('file')
+            if upload is None or isinstance(upload, str):
+                raise HTTPException(status_code=400, detail="Нет файла в поле file")
+            rows, columns, n_rows = await loop.run_in_executor(preprocess_pool, parse_table, upload)
     else:
-        classifier_df = pd.DataFrame([[
-            features.listing_type,
-            features.tom,
-            features.building_age,
-            features.total_floor_count,
-            features.floor_no,
-            features.room_count,
-            features.size,
-            features.heating_type,
-            features.price,
-            features.address_encoded,
-            features.start_year
-        ]], columns=[
-            'listing_type', 'tom', 'building_age', 'total_floor_count',
-            'floor_no', 'room_count', 'size', 'heating_type', 'price', 'address_encoded', 'start_year',
-            'start_day','start_month','end_year','end_month','end_day','heating_type_ecnoded',
-            'sub_type_encoded'
-        ])
+        body = await request.body()
+        rows, columns, n_rows = await loop.run_in_executor(preprocess_pool, parse_json_rows, body)
 
-    # Делаем предсказания
-    price_prediction = regressor_model.predict(regressor_df)[0]
-    subtype_prediction = classifier_model.predict(classifier_df)[0]
+    if n_rows == 0:
+        return JSONResponse({"count": 0, "predicted_price": [], "predicted_subtype": [], "status": "success"})
 
-    return {
-        "predicted_price": float(price_prediction),
-        "predicted_subtype": (subtype_prediction),
-        "status": "success"
-    }
+    # По одному вызову каждой модели на весь пакет, в пуле вместе с одиночными запросами
+    try:
+        price_predictions, subtype_predictions = await inference_pool.run(predict_rows, rows, columns, n_rows)
+    except ModelLoadError as e:
+        raise HTTPException(status_code=503, detail=f"Модели не загружены: {e}")
+
+    with metrics.stage('serialization'):
+        return JSONResponse({
+            "count": n_rows,
+            "predicted_price": price_predictions.tolist(),
+            "predicted_subtype": subtype_predictions.tolist(),
+            "status": "success"
+        })
+
+
+def parse_json_rows(body: bytes) -> tuple:
+    """JSON-массив объектов PropertyFeatures -> (строки, None, число строк); выполняется в пуле preprocess_pool"""
+    with metrics.stage('decode'):
+        try:
+            rows = property_list_adapter.validate_json(body)
+        except ValidationError as e:
+            raise RequestValidationError([{**error, 'loc': ('body', *error['loc'])} for error in e.errors(include_url=False)])
+        check_batch_rows(len(rows))
+        return rows, None, len(rows)
+
+
+def parse_table(upload) -> tuple:
+    """Файл CSV/Parquet -> (None, столбцы признаков, число строк); выполняется в пуле preprocess_pool"""
+    with metrics.stage('decode'):
+        frame = read_table(upload)
+        check_batch_rows(len(frame))
+        return None, columns_from_frame(frame), len(frame)
+
+
+def check_batch_rows(n_rows: int):
+    if n_rows > MAX_BATCH_ROWS:
+        raise HTTPException(status_code=413, detail=f"Не больше {MAX_BATCH_ROWS} строк за запрос")
+
+
+def read_table(upload) -> pd.DataFrame:
+    """CSV или Parquet по расширению файла или content-type; для Parquet нужен pyarrow или fastparquet"""
+    filename = (upload.filename or '').lower()
+    try:
+        if filename.endswith(('.parquet', '.pq')) or 'parquet' in (upload.content_type or ''):
+            return pd.read_parquet(upload.file)
+        return pd.read_csv(upload.file)
+    except ImportError as e:
+        raise HTTPException(status_code=415, detail=f"Чтение Parquet недоступно: {e}")
+    except (ValueError, pd.errors.ParserError) as e:
+        raise HTTPException(status_code=400, detail=f"Не удалось прочитать файл: {e}")
 
 
 
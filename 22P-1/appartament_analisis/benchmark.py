@@ -0,0 +1,94 @@
+import argparse, os, pickle, sys, time, tracemalloc
+import numpy as np, pandas as pd
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from load_benchmark import APPARTAMENT_FEATURES, property_payload
+
+
+def load_models(args):
+    """Модели из xgb_reg.pkl и bagging_clf.pkl, если они есть, иначе модели sklearn того же вида,
+    обученные на синтетических объектах (обучены на DataFrame - feature_names_in_ как у настоящих)"""
+    if os.path.exists('xgb_reg.pkl') and os.path.exists('bagging_clf.pkl'):
+        with open('xgb_reg.pkl', 'rb') as f:
+            regressor = pickle.load(f)
+        with open('bagging_clf.pkl', 'rb') as f:
+            classifier = pickle.load(f)
+        print('Модели: xgb_reg.pkl, bagging_clf.pkl')
+        return regressor, classifier
+
+    from sklearn.ensemble import BaggingClassifier, HistGradientBoostingRegressor
+    rng = np.random.default_rng(args.seed)
+    train = pd.DataFrame([property_payload(rng) for _ in range(args.train_rows)])[APPARTAMENT_FEATURES]
+    regressor = HistGradientBoostingRegressor(max_iter=100, random_state=args.seed).fit(train, train['price'] * rng.random(len(train)))
+    classifier = BaggingClassifier(n_estimators=10, random_state=args.seed).fit(train, train['sub_type_encoded'])
+    print(f'Моделей .pkl нет - синтетические HistGradientBoostingRegressor и BaggingClassifier ({args.train_rows} строк)')
+    return regressor, classifier
+
+
+def legacy_model_input(features, feature_names) -> pd.DataFrame:
+    """Как /predict строил вход до FeatureLayout: словарь признаков, словарь списков и DataFrame на каждую модель"""
+    feature_dict = {name: getattr(features, name) for name in APPARTAMENT_FEATURES}
+    return pd.DataFrame({col: [feature_dict[col]] for col in feature_names})
+
+
+def measure(func, requests: list, repeat: int) -> tuple:
+    """Среднее время на запрос и пик выделенной за запрос памяти Python (tracemalloc)"""
+    for features in requests[:10]:
+        func(features)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for features in requests:
+            func(features)
+    latency = (time.perf_counter() - start) / (repeat * len(requests))
+
+    tracemalloc.start()
+    peaks = []
+    for features in requests:
+        current, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        func(features)
+        peaks.append(tracemalloc.get_traced_memory()[1] - current)
+    tracemalloc.stop()
+    return latency, float(np.mean(peaks))
+
+
+def bench_layout(args):
+    """Построение входа модели: словарь + DataFrame на запрос против FeatureLayout, отдельно и вместе с predict"""
+    import api
+    from feature_layout import FeatureLayout
+    regressor, classifier = load_models(args)
+    layout = FeatureLayout(regressor.feature_names_in_, api.FEATURE_FIELDS)
+    rng = np.random.default_rng(args.seed + 1)
+    requests = [api.PropertyFeatures(**property_payload(rng)) for _ in range(args.requests)]
+
+    cases = {
+        'вход: словарь + DataFrame': lambda features: legacy_model_input(features, regressor.feature_names_in_),
+        'вход: FeatureLayout.row': layout.row,
+        'вход + predict: DataFrame': lambda features: regressor.predict(legacy_model_input(features, regressor.feature_names_in_)),
+        'вход + predict: FeatureLayout': lambda features: regressor.predict(layout.model_input(layout.row(features))),
+    }
+    for name, func in cases.items():
+        latency, peak = measure(func, requests, args.repeat)
+        print(f'{name:32} {latency * 1e6:9.1f} мкс/запрос, пик памяти {peak / 1024:8.2f} КБ/запрос')
+
+    legacy = regressor.predict(pd.concat([legacy_model_input(features, regressor.feature_names_in_) for features in requests]))
+    planned = regressor.predict(layout.model_input(layout.from_rows(requests)))
+    print(f'Предсказания совпадают: {np.allclose(legacy, planned)}')
+
+
+BENCHMARKS = {
+    'layout': bench_layout,
+}
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Бенчмарки API предсказания недвижимости')
+    parser.add_argument('benchmark', choices=BENCHMARKS)
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--train-rows', type=int, default=5000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    # Модели и api ищутся относительно папки сервиса, как при запуске uvicorn
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    BENCHMARKS[args.benchmark](args)
@@ -0,0 +1,52 @@
+import operator, threading
+import numpy as np, pandas as pd
+
+
+class FeatureLayout:
+    """Порядок признаков модели, вычисленный один раз при загрузке: поля запроса пишутся сразу в массив float32
+    в порядке feature_names_in_, без словарей и DataFrame на каждый запрос.
+    Имена проверяются здесь же: признак, которого нет среди полей запроса, - ошибка загрузки, а не каждого запроса"""
+
+    def __init__(self, feature_names, fields: list):
+        self.names = list(feature_names) if feature_names is not None else list(fields)
+        # Модель обучена на DataFrame: sklearn сверяет имена признаков и предупреждает, если их не передать
+        self.named = feature_names is not None
+        unknown = [name for name in self.names if name not in fields]
+        if unknown:
+            raise ValueError(f"Модель ожидает признаки, которых нет в запросе: {unknown}")
+        duplicates = sorted({name for name in self.names if self.names.count(name) > 1})
+        if duplicates:
+            raise ValueError(f"Признаки повторяются: {duplicates}")
+        self.getter = operator.attrgetter(*self.names)
+        # Свой буфер на поток: обработчики и пул потоков не пишут в одну строку одновременно
+        self.local = threading.local()
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def row(self, features) -> np.ndarray:
+        """Один объект -> (1, признаки) в заранее выделенном буфере потока; действителен до следующего вызова в потоке"""
+        buffer = getattr(self.local, 'buffer', None)
+        if buffer is None:
+            buffer = self.local.buffer = np.empty((1, len(self.names)), dtype=np.float32)
+        buffer[0] = self.getter(features)
+        return buffer
+
+    def model_input(self, block: np.ndarray):
+        """Вход predict для блока из row/from_rows/from_columns: с именами признаков, если модель их знает, иначе сам массив.
+        DataFrame строится над тем же буфером, без копии"""
+        return pd.DataFrame(block, columns=self.names, copy=False) if self.named else block
+
+    def from_rows(self, rows: list) -> np.ndarray:
+        """Список объектов -> блок (строки, признаки)"""
+        block = np.empty((len(rows), len(self.names)), dtype=np.float32)
+        for i, row in enumerate(rows):
+            block[i] = self.getter(row)
+        return block
+
+    def from_columns(self, columns: dict, n_rows: int) -> np.ndarray:
+        """{признак: столбец} -> блок (строки, признаки), по столбцу за раз"""
+        block = np.empty((n_rows, len(self.names)), dtype=np.float32)
+        for j, name in enumerate(self.names):
+            block[:, j] = columns[name]
+        return block
@@ -0,0 +1,201 @@
+import hashlib, os, pickle, threading, time
+from datetime import datetime
+from feature_layout import FeatureLayout
+
+
+class ModelLoadError(Exception):
+    """Модель не загружена: файла нет, контрольная сумма не сошлась, unpickle или проверка признаков не прошли"""
+
+
+class LoadedModel:
+    """Загруженная версия модели вместе с планом признаков. После загрузки не меняется: запрос, который взял ее
+    из реестра, досчитывает на ней, даже если реестр уже переключился на новую версию"""
+
+    def __init__(self, name: str, path: str, model, layout: FeatureLayout, sha256: str, verified: bool, signature: tuple,
+                 load_seconds: float, memory_bytes: int | None):
+        self.name = name
+        self.path = path
+        self.model = model
+        self.layout = layout
+        self.sha256 = sha256
+        self.version = sha256[:12]
+        self.verified = verified
+        self.signature = signature
+        self.load_seconds = load_seconds
+        self.memory_bytes = memory_bytes
+        self.loaded_at = datetime.now().isoformat(timespec='seconds')
+
+
+class ModelRegistry:
+    """Модели из .pkl по путям из конфигурации: загрузка при первом обращении, проверка sha256
+    (из checksums или файла <модель>.pkl.sha256 рядом), подмена на лету при изменении файла.
+    Новая версия загружается в фоне, пока запросы считаются на старой, и ставится одной заменой ссылки;
+    если загрузка не удалась, остается старая версия. reload_interval - как часто проверять файлы, секунды (None - не проверять)"""
+
+    def __init__(self, paths: dict, fields: list, checksums: dict = None, reload_interval: float = None, metrics=None):
+        self.paths = paths
+        self.fields = fields
+        self.checksums = checksums or {}
+        self.reload_interval = reload_interval
+        self.metrics = metrics
+        self.models = {}
+        self.locks = {name: threading.Lock() for name in paths}
+        self.checked = {name: 0.0 for name in paths}
+        self.reloading = set()
+        self.errors = {}
+        self.reloads = {name: 0 for name in paths}
+        self.listeners = []
+
+    def get(self, name: str) -> LoadedModel:
+        """Текущая версия модели; первое обращение загружает ее, дальше раз в reload_interval проверяется файл"""
+        entry = self.models.get(name)
+        if entry is not None:
+            self._check_due(name, entry)
+            return entry
+
+        with self.locks[name]:
+            entry = self.models.get(name)
+            if entry is None:
+                # После неудачи файл не перечитывается на каждый запрос - только если он изменился или прошел интервал
+                failure = self.errors.get(name)
+                if failure is not None and failure[0] == _signature(self.paths[name]) and \
+                        time.monotonic() - failure[1] < (self.reload_interval or 0):
+                    raise ModelLoadError(failure[2])
+                entry = self.models[name] = self._load(name)
+                self.checked[name] = time.monotonic()
+            return entry
+
+    def versions(self) -> tuple | None:
+        """Версии всех моделей, если все уже загружены, иначе None. Ничего не загружает, но, как get(),
+        раз в reload_interval проверяет файлы - подмена замечается, даже если модели давно не вызывались"""
+        versions = []
+        for name in self.paths:
+            entry = self.models.get(name)
+            if entry is None:
+                return None
+            self._check_due(name, entry)
+            versions.append(entry.version)
+        return tuple(versions)
+
+    def on_reload(self, callback):
+        """callback(name, entry) после подмены модели новой версией"""
+        self.listeners.append(callback)
+
+    def _check_due(self, name: str, entry: LoadedModel):
+        if self.reload_interval is not None and time.monotonic() - self.checked[name] >= self.reload_interval:
+            self._check(name, entry)
+
+    def _check(self, name: str, entry: LoadedModel):
+        self.checked[name] = time.monotonic()
+        signature = _signature(self.paths[name])
+        failure = self.errors.get(name)
+        if signature is None or signature == entry.signature or (failure is not None and failure[0] == signature):
+            return
+        with self.locks[name]:
+            if name in self.reloading:
+                return
+            self.reloading.add(name)
+        threading.Thread(target=self._reload, args=(name,), name=f'reload-{name}', daemon=True).start()
+
+    def _reload(self, name: str):
+        try:
+            entry = self._load(name)
+            # Одна замена ссылки: новые запросы берут новую версию, начатые досчитывают на старой
+            self.models[name] = entry
+            self.reloads[name] += 1
+            print(f"🔄 Модель {name} обновлена: версия {entry.version}")
+            for callback in self.listeners:
+                callback(name, entry)
+        except ModelLoadError as e:
+            print(f"Модель {name} не обновлена, работает прежняя версия: {e}")
+        finally:
+            with self.locks[name]:
+                self.reloading.discard(name)
+
+    def _load(self, name: str) -> LoadedModel:
+        path = self.paths[name]
+        signature = _signature(path)
+        try:
+            start, rss_before = time.perf_counter(), _rss_bytes()
+            # Контрольная сумма и unpickle по одним и тем же байтам: файл не успеет подмениться между ними
+            with open(path, 'rb') as f:
+                data = f.read()
+            sha256 = hashlib.sha256(data).hexdigest()
+            expected = self.checksums.get(name) or _sidecar_checksum(path)
+            if expected and expected.lower() != sha256:
+                raise ModelLoadError(f"Контрольная сумма {path} не совпала: ожидалась {expected}, получена {sha256}")
+            model = pickle.loads(data)
+            del data
+            features = getattr(model, 'feature_names_in_', None)
+            layout = FeatureLayout(features, self.fields)
+            load_seconds = time.perf_counter() - start
+            rss_after = _rss_bytes()
+        except ModelLoadError as e:
+            self.errors[name] = (signature, time.monotonic(), str(e))
+            raise
+        except Exception as e:
+            message = f"Ошибка загрузки модели {name} из {path}: {e}"
+            self.errors[name] = (signature, time.monotonic(), message)
+            raise ModelLoadError(message) from e
+
+        self.errors.pop(name, None)
+        if self.metrics is not None:
+            self.metrics.model_load_seconds.set((name,), load_seconds)
+        memory = rss_after - rss_before if rss_before is not None and rss_after is not None else None
+        print(f"✅ Модель {name} загружена из {path} за {load_seconds:.2f} c, версия {sha256[:12]}")
+        if features is not None:
+            print(f"Признаки {name} ({len(features)}): {list(features)}")
+        return LoadedModel(name, path, model, layout, sha256, bool(expected), signature, load_seconds, memory)
+
+    def stats(self) -> dict:
+        result = {}
+        for name, path in self.paths.items():
+            entry = self.models.get(name)
+            failure = self.errors.get(name)
+            result[name] = {
+                'path': path,
+                'loaded': entry is not None,
+                'version': entry.version if entry else None,
+                'sha256': entry.sha256 if entry else None,
+                'checksum_verified': entry.verified if entry else None,
+                'loaded_at': entry.loaded_at if entry else None,
+                'load_seconds': entry.load_seconds if entry else None,
+                # Прирост RSS процесса за время загрузки: вместе с памятью нативных библиотек (XGBoost), а не только Python
+                'memory_mb': entry.memory_bytes / 2 ** 20 if entry and entry.memory_bytes is not None else None,
+                'file_mb': entry.signature[1] / 2 ** 20 if entry else None,
+                'reloads': self.reloads[name],
+                'reloading': name in self.reloading,
+                'last_error': failure[2] if failure else None,
+            }
+        return result
+
+
+def _signature(path: str) -> tuple | None:
+    """Время изменения и размер файла модели и время изменения <файл>.sha256: изменились - пора перечитать модель"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    try:
+        checksum_mtime = os.stat(path + '.sha256').st_mtime_ns
+    except OSError:
+        checksum_mtime = None
+    return stat.st_mtime_ns, stat.st_size, checksum_mtime
+
+
+def _sidecar_checksum(path: str) -> str | None:
+    """sha256 из файла <путь>.sha256 в формате sha256sum ("<хеш>  <имя>") или просто хеш"""
+    try:
+        with open(path + '.sha256', encoding='utf-8') as f:
+            return f.read().split()[0]
+    except (OSError, IndexError):
+        return None
+
+
+def _rss_bytes() -> int | None:
+    """Текущий RSS процесса из /proc (Linux); на других системах - None"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        return None
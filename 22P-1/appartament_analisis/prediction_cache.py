@@ -0,0 +1,97 @@
+import hashlib, threading
+from collections import OrderedDict
+
+
+class PredictionCache:
+    """Ответы моделей для уже виденных объектов. Ключ - хеш нормализованного вектора признаков (float32 в порядке полей
+    запроса, ровно то, что получает модель) и версий моделей; при переполнении вытесняется давно не запрошенный.
+    Версии в ключе: после подмены модели старые ответы не выдаются, даже если их сохранит запрос, начатый до подмены.
+    Хранятся записи одних версий: ответ другой версии или invalidate() при подмене модели сбрасывает кэш.
+    max_entries=0 - кэш выключен"""
+
+    def __init__(self, max_entries: int = 10000, metrics=None, name: str = 'predictions'):
+        self.max_entries = max_entries
+        self.metrics = metrics
+        self.name = name
+        self.entries = OrderedDict()
+        self.versions = None
+        # Запросы обращаются из event loop, сброс при подмене модели приходит из потока загрузки
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def _key(self, vector: bytes, versions: tuple) -> bytes:
+        digest = hashlib.blake2b(vector, digest_size=16)
+        for version in versions:
+            digest.update(version.encode())
+        return digest.digest()
+
+    def get(self, vector: bytes, versions: tuple | None):
+        """Сохраненный ответ моделей версий versions для вектора признаков или None; versions=None - модели еще
+        не загружены, это промах"""
+        if not self.enabled:
+            return None
+        key = self._key(vector, versions) if versions is not None else None
+        with self.lock:
+            value = self.entries.get(key) if key is not None else None
+            if value is None:
+                self.misses += 1
+            else:
+                self.entries.move_to_end(key)
+                self.hits += 1
+        if self.metrics is not None:
+            self.metrics.observe_cache(self.name, 'miss' if value is None else 'hit')
+        return value
+
+    def put(self, vector: bytes, versions: tuple, value):
+        """Ответ моделей версий versions; пришел ответ новой версии - прежние записи сбрасываются"""
+        if not self.enabled:
+            return
+        key = self._key(vector, versions)
+        evicted = 0
+        with self.lock:
+            if versions != self.versions:
+                self._clear()
+                self.versions = versions
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                evicted += 1
+            self.evictions += evicted
+        if evicted and self.metrics is not None:
+            self.metrics.observe_cache_eviction(self.name, 'size', evicted)
+
+    def invalidate(self, *args):
+        """Сброс всех записей, например при подмене модели (подходит как обработчик ModelRegistry.on_reload)"""
+        with self.lock:
+            self._clear()
+            self.versions = None
+
+    def _clear(self):
+        if self.entries:
+            self.invalidations += 1
+            if self.metrics is not None:
+                self.metrics.observe_cache_eviction(self.name, 'model_reload', len(self.entries))
+        self.entries.clear()
+
+    def stats(self) -> dict:
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'enabled': self.enabled,
+                'max_entries': self.max_entries,
+                'size': len(self.entries),
+                'versions': list(self.versions) if self.versions else None,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+            }
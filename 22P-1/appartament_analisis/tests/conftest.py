@@ -0,0 +1,5 @@
+import os, sys
+
+# Модули сервиса импортируются по имени, как в api.py: из папки сервиса и общие - из 22P-1
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [SERVICE_DIR, os.path.dirname(SERVICE_DIR)]
@@ -0,0 +1,87 @@
+import hashlib, os, pickle, time
+from types import SimpleNamespace
+import numpy as np
+import pytest
+from model_registry import ModelLoadError, ModelRegistry
+
+FIELDS = ['area', 'rooms', 'floor']
+
+
+def write_model(path, coef: float, checksum: str = None):
+    data = pickle.dumps(SimpleNamespace(feature_names_in_=np.array(['rooms', 'area']), coef=coef))
+    path.write_bytes(data)
+    with open(f'{path}.sha256', 'w', encoding='utf-8') as f:
+        f.write(f'{checksum or hashlib.sha256(data).hexdigest()}  {path.name}\n')
+    # Сигнатура файла - mtime и размер: сдвигаем mtime, чтобы замена заметилась даже в пределах одного тика часов
+    bump = time.time_ns() + 10**9 * (coef + 1)
+    for file in (str(path), f'{path}.sha256'):
+        os.utime(file, ns=(int(bump), int(bump)))
+
+
+def wait_reload(registry: ModelRegistry, name: str, timeout: float = 5.0):
+    deadline = time.monotonic() + timeout
+    while name in registry.reloading:
+        assert time.monotonic() < deadline, 'фоновая загрузка не закончилась'
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def model_path(tmp_path):
+    path = tmp_path / 'price.pkl'
+    write_model(path, coef=1.0)
+    return path
+
+
+def test_model_loads_with_verified_checksum(model_path):
+    registry = ModelRegistry({'price': str(model_path)}, FIELDS)
+    entry = registry.get('price')
+
+    assert entry.model.coef == 1.0
+    assert entry.verified
+    assert entry.layout.names == ['rooms', 'area']
+    assert registry.versions() == (entry.version,)
+
+
+def test_checksum_mismatch_on_first_load_raises(tmp_path):
+    path = tmp_path / 'price.pkl'
+    write_model(path, coef=1.0, checksum='0' * 64)
+    registry = ModelRegistry({'price': str(path)}, FIELDS)
+
+    with pytest.raises(ModelLoadError, match='Контрольная сумма'):
+        registry.get('price')
+    assert registry.versions() is None
+    assert 'Контрольная сумма' in registry.stats()['price']['last_error']
+
+
+def test_checksum_mismatch_on_reload_keeps_old_model(model_path):
+    registry = ModelRegistry({'price': str(model_path)}, FIELDS, reload_interval=0)
+    reloaded = []
+    registry.on_reload(lambda name, entry: reloaded.append(name))
+    old = registry.get('price')
+
+    write_model(model_path, coef=2.0, checksum='0' * 64)
+    registry.get('price')
+    wait_reload(registry, 'price')
+
+    assert registry.get('price') is old
+    assert registry.versions() == (old.version,)
+    assert reloaded == []
+    stats = registry.stats()['price']
+    assert stats['reloads'] == 0 and 'Контрольная сумма' in stats['last_error']
+
+
+def test_valid_reload_replaces_model(model_path):
+    registry = ModelRegistry({'price': str(model_path)}, FIELDS, reload_interval=0)
+    reloaded = []
+    registry.on_reload(lambda name, entry: reloaded.append(entry.model.coef))
+    old = registry.get('price')
+
+    write_model(model_path, coef=3.0)
+    registry.get('price')
+    wait_reload(registry, 'price')
+
+    entry = registry.get('price')
+    assert entry.model.coef == 3.0 and entry.version != old.version
+    assert old.model.coef == 1.0
+    assert reloaded == [3.0]
+    assert registry.stats()['price']['last_error'] is None
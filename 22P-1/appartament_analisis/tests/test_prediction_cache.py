@@ -0,0 +1,71 @@
+import numpy as np
+from prediction_cache import PredictionCache
+
+V1 = ('aaaaaaaaaaaa', 'bbbbbbbbbbbb')
+V2 = ('aaaaaaaaaaaa', 'cccccccccccc')
+
+
+def vector(*values) -> bytes:
+    return np.asarray(values, dtype=np.float32).tobytes()
+
+
+def test_hit_for_same_vector_and_versions():
+    cache = PredictionCache(max_entries=10)
+    cache.put(vector(1, 2), V1, 3.5)
+
+    assert cache.get(vector(1, 2), V1) == 3.5
+    assert cache.get(vector(1, 3), V1) is None
+    assert cache.get(vector(1, 2), None) is None
+    assert (cache.stats()['hits'], cache.stats()['misses']) == (1, 2)
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = PredictionCache(max_entries=2)
+    cache.put(vector(1), V1, 1.0)
+    cache.put(vector(2), V1, 2.0)
+    cache.get(vector(1), V1)
+    cache.put(vector(3), V1, 3.0)
+
+    assert cache.get(vector(2), V1) is None
+    assert cache.get(vector(1), V1) == 1.0
+    assert cache.stats()['evictions'] == 1
+
+
+def test_new_model_version_drops_old_answers():
+    cache = PredictionCache(max_entries=10)
+    cache.put(vector(1), V1, 1.0)
+    cache.put(vector(2), V1, 2.0)
+
+    assert cache.get(vector(1), V2) is None
+    cache.put(vector(1), V2, 10.0)
+    assert cache.get(vector(2), V1) is None
+    assert cache.get(vector(1), V2) == 10.0
+    stats = cache.stats()
+    assert (stats['size'], stats['versions'], stats['invalidations']) == (1, list(V2), 1)
+
+
+def test_answer_of_replaced_model_is_not_served():
+    cache = PredictionCache(max_entries=10)
+    cache.put(vector(1), V2, 10.0)
+    # Запрос, начатый до подмены модели, сохраняет ответ старой версии уже после нее
+    cache.put(vector(1), V1, 1.0)
+
+    assert cache.get(vector(1), V2) is None
+    assert cache.get(vector(1), V1) == 1.0
+
+
+def test_invalidate_on_reload():
+    cache = PredictionCache(max_entries=10)
+    cache.put(vector(1), V1, 1.0)
+    cache.invalidate('price', object())
+
+    assert cache.get(vector(1), V1) is None
+    assert cache.stats()['size'] == 0 and cache.stats()['versions'] is None
+
+
+def test_disabled_cache_stores_nothing():
+    cache = PredictionCache(max_entries=0)
+    cache.put(vector(1), V1, 1.0)
+
+    assert cache.get(vector(1), V1) is None
+    assert cache.stats()['size'] == 0 and not cache.stats()['enabled']
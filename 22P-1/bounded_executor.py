@@ -0,0 +1,181 @@
+import asyncio, multiprocessing, os, threading, time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import asynccontextmanager
+from fastapi import HTTPException
+
+EXECUTOR_MODES = ('inline', 'thread', 'process')
+
+
+class BoundedExecutor:
+    """Тяжелые вызовы (модели, запросы к рекомендательной системе) вне event loop, чтобы один запрос
+    не останавливал остальные и /health. thread - пул потоков: NumPy, SciPy, TensorFlow, sklearn и XGBoost отпускают GIL;
+    process - пул процессов для кода на чистом Python (функция - уровня модуля, ее состояние загружается в каждом процессе при импорте);
+    inline - прямо в event loop. Одновременно не больше max_in_flight вызовов, в очереди - не больше max_queue,
+    сверх нее сразу 503 с Retry-After. timeout - сколько run() ждет ответа, дальше 504; задача в пуле при этом дорабатывает
+    и до конца занимает слот лимита. Счетчики меняются только из event loop, поэтому блокировки для них не нужны"""
+
+    def __init__(self, mode: str = 'thread', max_workers: int = None, max_in_flight: int = None,
+                 max_queue: int = None, timeout: float = None, name: str = 'executor'):
+        if mode not in EXECUTOR_MODES:
+            raise ValueError(f"Неизвестный режим выполнения '{mode}', доступны: {list(EXECUTOR_MODES)}")
+        self.mode = mode
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.max_in_flight = max_in_flight or self.max_workers
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.name = name
+        self.semaphore = None
+        self.loop = None
+        self.pool_lock = threading.Lock()
+        self.thread_pool = None
+        self.process_pool = None
+        self.queued = 0
+        self.max_queued = 0
+        self.in_flight = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.abandoned = 0
+        self.wait_seconds = 0.0
+        self.run_seconds = 0.0
+
+    @asynccontextmanager
+    async def slot(self):
+        """async with pool.slot(): ... - место среди max_in_flight одновременных вызовов; очередь переполнена - 503"""
+        if self.max_queue is not None and self.queued >= self.max_queue:
+            self.rejected += 1
+            raise HTTPException(status_code=503, detail="Сервер перегружен, повторите запрос позже",
+                                headers={'Retry-After': '1'})
+
+        self.queued += 1
+        self.max_queued = max(self.max_queued, self.queued)
+        enqueued = time.perf_counter()
+        try:
+            semaphore = self._semaphore()
+            await semaphore.acquire()
+        finally:
+            self.queued -= 1
+        started = time.perf_counter()
+        self.wait_seconds += started - enqueued
+        self.in_flight += 1
+        slot = _Slot()
+        try:
+            yield slot
+            self.completed += 1
+        except Exception:
+            if slot.future is None:
+                self.failed += 1
+            raise
+        finally:
+            self.run_seconds += time.perf_counter() - started
+            if slot.future is None:
+                self.in_flight -= 1
+                semaphore.release()
+            else:
+                # Ответа уже не ждут, но задача еще считается в пуле: слот освободится, когда она закончится
+                self.abandoned += 1
+                loop = asyncio.get_running_loop()
+                slot.future.add_done_callback(lambda _: _call_soon(loop, self._release_abandoned, semaphore))
+
+    async def submit(self, func, *args, process: bool = True):
+        """func(*args) в пуле без учета лимита - для кода, который уже занял slot() (например, батч MicroBatcher).
+        process=False - в пуле потоков, даже если режим process"""
+        if self.mode == 'inline':
+            return func(*args)
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor(process), func, *args)
+        except BrokenProcessPool:
+            self._reset_process_pool()
+            raise
+
+    async def run(self, func, *args, process: bool = True):
+        """func(*args) в пуле с лимитом одновременных вызовов, очередью и таймаутом"""
+        async with self.slot() as slot:
+            if self.mode == 'inline':
+                return func(*args)
+            future = self.executor(process).submit(func, *args)
+            try:
+                # shield: по таймауту отменяется только ожидание, future остается и сообщит о завершении задачи
+                return await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), self.timeout)
+            except asyncio.TimeoutError:
+                self.timeouts += 1
+                slot.future = future
+                raise HTTPException(status_code=504, detail=f"Запрос не выполнен за {self.timeout} c")
+            except BrokenProcessPool:
+                self._reset_process_pool()
+                raise
+
+    def executor(self, process: bool = True):
+        """Пул для вызова: процессов в режиме process (если process=True), иначе потоков"""
+        with self.pool_lock:
+            if self.mode == 'process' and process:
+                if self.process_pool is None:
+                    # spawn, а не fork: в процессе уже работают потоки uvicorn и фоновых задач
+                    self.process_pool = ProcessPoolExecutor(self.max_workers, mp_context=multiprocessing.get_context('spawn'))
+                return self.process_pool
+            if self.thread_pool is None:
+                self.thread_pool = ThreadPoolExecutor(self.max_workers, thread_name_prefix=self.name)
+            return self.thread_pool
+
+    def _semaphore(self) -> asyncio.Semaphore:
+        # Семафор привязан к event loop; новый loop (перезапуск сервера, тесты) получает свой
+        loop = asyncio.get_running_loop()
+        if self.loop is not loop:
+            self.semaphore = asyncio.Semaphore(self.max_in_flight)
+            self.loop = loop
+        return self.semaphore
+
+    def _reset_process_pool(self):
+        # Процесс пула упал (например, нехватка памяти) - следующий вызов создаст пул заново
+        with self.pool_lock:
+            self.process_pool = None
+
+    def _release_abandoned(self, semaphore: asyncio.Semaphore):
+        self.abandoned -= 1
+        self.in_flight -= 1
+        semaphore.release()
+
+    def stats(self) -> dict:
+        finished = self.completed + self.failed + self.timeouts
+        return {
+            'mode': self.mode,
+            'max_workers': self.max_workers,
+            'max_in_flight': self.max_in_flight,
+            'max_queue': self.max_queue,
+            'timeout': self.timeout,
+            'queue_depth': self.queued,
+            'max_queue_depth': self.max_queued,
+            'in_flight': self.in_flight,
+            'completed': self.completed,
+            'failed': self.failed,
+            'rejected': self.rejected,
+            'timeouts': self.timeouts,
+            # Вызовы, ответа которых уже не ждут (таймаут), но которые еще занимают пул и слоты лимита
+            'abandoned': self.abandoned,
+            'avg_wait_ms': self.wait_seconds / finished * 1000 if finished else 0.0,
+            'avg_run_ms': self.run_seconds / finished * 1000 if finished else 0.0,
+        }
+
+    def shutdown(self):
+        with self.pool_lock:
+            for pool in (self.thread_pool, self.process_pool):
+                if pool is not None:
+                    pool.shutdown(wait=False, cancel_futures=True)
+            self.thread_pool = self.process_pool = None
+
+
+class _Slot:
+    """Занятый слот; future - задача, ответа которой не дождались: слот держится до ее завершения"""
+
+    def __init__(self):
+        self.future = None
+
+
+def _call_soon(loop: asyncio.AbstractEventLoop, callback, *args):
+    """callback в event loop из потока пула; loop уже закрыт (остановка сервера) - освобождать нечего"""
+    try:
+        loop.call_soon_threadsafe(callback, *args)
+    except RuntimeError:
+        pass
@@ -0,0 +1,418 @@
+import argparse, asyncio, base64, importlib.util, io, json, os, pickle, platform, resource, subprocess, sys, tempfile, time
+import numpy as np
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# Сервис: (папка, файл приложения)
+SERVICES = {
+    'appartament': ('appartament_analisis', 'api.py'),
+    'digits': ('Draw numbers', 'api.py'),
+    'shoes': ('Snoes', 'api_cross.py'),
+    'movies': ('Movie recommendations', 'api.py'),
+}
+# Сервисы с объединением запросов в батчи (INFERENCE_BATCH_SIZE / INFERENCE_BATCH_WINDOW_MS)
+BATCHING_SERVICES = ('digits', 'shoes')
+# Сервисы, где модель считается в пуле BoundedExecutor (INFERENCE_EXECUTOR), и их легкий эндпоинт для проверки отзывчивости
+POOL_SERVICES = {'appartament': '/', 'digits': '/health', 'shoes': '/health'}
+
+APPARTAMENT_FEATURES = ['total_floor_count', 'listing_type', 'tom', 'building_age', 'floor_no', 'room_count', 'size',
+                        'heating_type', 'price', 'address_encoded', 'start_day', 'start_year', 'start_month', 'end_year',
+                        'end_month', 'end_day', 'heating_type_ecnoded', 'sub_type_encoded']
+
+
+class FakeKerasModel:
+    """Замена keras-модели: softmax от случайной линейной проекции, чтобы измерять сам сервис, а не сеть.
+    overhead_ms - постоянная цена вызова, как у model.predict в TensorFlow на CPU, независимо от размера батча"""
+
+    def __init__(self, input_shape: tuple, n_classes: int, seed: int = 0, overhead_ms: float = 0.0):
+        rng = np.random.default_rng(seed)
+        self.weights = rng.standard_normal((int(np.prod(input_shape)), n_classes)).astype(np.float32) / 100
+        self.overhead = overhead_ms / 1000
+
+    def predict(self, x: np.ndarray, verbose: int = 0) -> np.ndarray:
+        if self.overhead:
+            time.sleep(self.overhead)
+        logits = x.reshape(len(x), -1) @ self.weights
+        exp = np.exp(logits - logits.max(axis=1, keepdims=True))
+        return exp / exp.sum(axis=1, keepdims=True)
+
+
+class FakeTabularModel:
+    """Замена xgb_reg.pkl / bagging_clf.pkl с тем же интерфейсом: feature_names_in_ и predict(DataFrame).
+    overhead_ms - постоянная цена вызова, как у ансамбля деревьев"""
+
+    def __init__(self, feature_names, classes: int = None, seed: int = 0, overhead_ms: float = 0.0):
+        self.feature_names_in_ = np.array(feature_names, dtype=object)
+        self.weights = np.random.default_rng(seed).random(len(feature_names))
+        self.classes = classes
+        self.overhead = overhead_ms / 1000
+
+    def predict(self, X) -> np.ndarray:
+        if self.overhead:
+            time.sleep(self.overhead)
+        values = np.asarray(X, dtype=np.float64) @ self.weights
+        return (values.astype(np.int64) % self.classes) if self.classes else values
+
+
+def load_app(service: str, real_models: bool, model_overhead_ms: float = 0.0):
+    """Импортирует приложение сервиса из его папки (модели там загружаются по относительным путям) и подменяет модели"""
+    folder, filename = SERVICES[service]
+    path = os.path.join(ROOT, folder)
+    sys.path.insert(0, path)
+    if service != 'movies':
+        os.chdir(path)
+    if service == 'appartament' and not real_models:
+        # Синтетические модели - в .pkl во временной папке: сервис загружает их своим реестром, как настоящие
+        model_dir = tempfile.mkdtemp(prefix='load_benchmark_models_')
+        fakes = {'xgb_reg.pkl': FakeTabularModel(APPARTAMENT_FEATURES, overhead_ms=model_overhead_ms),
+                 'bagging_clf.pkl': FakeTabularModel(APPARTAMENT_FEATURES, classes=5, seed=1, overhead_ms=model_overhead_ms)}
+        for model_file, fake in fakes.items():
+            with open(os.path.join(model_dir, model_file), 'wb') as f:
+                pickle.dump(fake, f)
+        os.environ['MODEL_DIR'] = model_dir
+    spec = importlib.util.spec_from_file_location('api', os.path.join(path, filename))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules['api'] = module
+    spec.loader.exec_module(module)
+
+    if not real_models:
+        if service == 'digits':
+            module.model = FakeKerasModel((28, 28, 1), 10, overhead_ms=model_overhead_ms)
+        elif service == 'shoes':
+            module.model = FakeKerasModel((224, 224, 3), len(module.CLASS_NAMES), overhead_ms=model_overhead_ms)
+    return module
+
+
+def image_bytes(size: tuple, mode: str, image_format: str, seed: int) -> bytes:
+    from PIL import Image
+    rng = np.random.default_rng(seed)
+    channels = 3 if mode == 'RGB' else 1
+    pixels = rng.integers(0, 256, size[::-1] + ((channels,) if channels > 1 else ()), dtype=np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(pixels, mode).save(buffer, format=image_format)
+    return buffer.getvalue()
+
+
+def image_payload(size: tuple, mode: str, image_format: str, seed: int) -> str:
+    """То же изображение data URL-строкой в base64, как его шлет фронтенд"""
+    return f'data:image/{image_format.lower()};base64,' + base64.b64encode(image_bytes(size, mode, image_format, seed)).decode()
+
+
+def property_payload(rng: np.random.Generator) -> dict:
+    return {
+        'listing_type': int(rng.integers(1, 4)), 'tom': int(rng.integers(0, 200)), 'building_age': int(rng.integers(0, 60)),
+        'total_floor_count': int(rng.integers(1, 30)), 'floor_no': int(rng.integers(0, 30)), 'room_count': int(rng.integers(1, 6)),
+        'size': int(rng.integers(20, 300)), 'heating_type': int(rng.integers(0, 8)), 'price': float(rng.integers(100_000, 5_000_000)),
+        'address_encoded': int(rng.integers(0, 500)), 'start_year': 2024, 'start_month': int(rng.integers(1, 13)),
+        'start_day': int(rng.integers(1, 29)), 'end_year': 2024, 'end_month': int(rng.integers(1, 13)),
+        'end_day': int(rng.integers(1, 29)), 'heating_type_ecnoded': int(rng.integers(0, 8)), 'sub_type_encoded': int(rng.integers(0, 5)),
+    }
+
+
+def streamlit_payload(rng: np.random.Generator) -> dict:
+    """Объект, как его шлет appartament_analisis/app.py: listing_type, price и address_encoded зашиты,
+    остальное - виджеты со значениями по умолчанию, которые пользователь меняет нечасто и немного"""
+    payload = {'total_floor_count': 5, 'floor_no': 3, 'room_count': 2, 'size': 80, 'building_age': 5, 'tom': 30,
+               'heating_type': 9, 'listing_type': 1, 'price': 0, 'address_encoded': 0}
+    if rng.random() < 0.5:
+        payload['size'] = int(rng.choice([60, 70, 75, 85, 90, 100, 120]))
+    if rng.random() < 0.3:
+        payload['room_count'] = int(rng.integers(1, 7))
+    if rng.random() < 0.2:
+        payload['floor_no'] = int(rng.integers(1, 10))
+    return payload
+
+
+def pd_csv(rows: list) -> bytes:
+    import pandas as pd
+    return pd.DataFrame(rows).to_csv(index=False).encode()
+
+
+def scenarios(service: str, module, args) -> dict:
+    """Эндпоинты сервиса: имя -> список запросов (метод, путь, тело), которые клиенты перебирают по кругу.
+    Тело - JSON, bytes (уходят как application/octet-stream) или кортеж (поле, (имя, байты, тип)) - файл в multipart"""
+    rng = np.random.default_rng(args.seed)
+    if service == 'digits':
+        raw = [image_bytes((28, 28), 'L', 'PNG', seed) for seed in range(16)]
+        images = [image_payload((28, 28), 'L', 'PNG', seed) for seed in range(16)]
+        return {
+            'GET /health': [('GET', '/health', None)],
+            'POST /predict': [('POST', '/predict', {'image': image}) for image in images],
+            'POST /predict_raw': [('POST', '/predict_raw', image) for image in raw],
+        }
+    if service == 'shoes':
+        raw = [image_bytes((args.image_size, args.image_size), 'RGB', 'JPEG', seed) for seed in range(16)]
+        images = [image_payload((args.image_size, args.image_size), 'RGB', 'JPEG', seed) for seed in range(16)]
+        return {
+            'GET /health': [('GET', '/health', None)],
+            'POST /predict': [('POST', '/predict', {'image': image}) for image in images],
+            'POST /predict_raw': [('POST', '/predict_raw', image) for image in raw],
+            'POST /predict_batch (16 изобр.)': [('POST', '/predict_batch', {'images': images})],
+        }
+    if service == 'appartament':
+        portfolio = [property_payload(rng) for _ in range(args.batch_rows)]
+        csv_file = ('file', ('portfolio.csv', pd_csv(portfolio), 'text/csv'))
+        return {
+            'GET /': [('GET', '/', None)],
+            # Разные объекты на каждый запрос - мимо кэша предсказаний, и повторяющиеся, как от фронтенда
+            'POST /predict': [('POST', '/predict', property_payload(rng)) for _ in range(args.requests)],
+            'POST /predict (как Streamlit)': [('POST', '/predict', streamlit_payload(rng)) for _ in range(args.requests)],
+            f'POST /predict_batch ({args.batch_rows} строк JSON)': [('POST', '/predict_batch', portfolio)],
+            f'POST /predict_batch ({args.batch_rows} строк CSV)': [('POST', '/predict_batch', csv_file)],
+        }
+
+    system = module.recomendation_system
+    users = rng.choice(system.users_id(), min(64, len(system.users_id())), replace=False).tolist()
+    titles = rng.choice(system.name_films(), 64).tolist()
+    genres = system.genre_films()
+    return {
+        'GET /get_popularite_films': [('GET', '/get_popularite_films', None)],
+        'GET /get_popularite_films_by_genre': [('GET', f'/get_popularite_films_by_genre/{genre}', None) for genre in genres],
+        'GET /get_same_films_by_name': [('GET', f'/get_same_films_by_name/{title}', None) for title in titles],
+        'GET /get_favorite_films': [('GET', f'/get_favorite_films/{user}', None) for user in users],
+        'POST /get_favorite_films_batch (NDJSON, 16 польз.)': [
+            ('POST', '/get_favorite_films_batch/', {'users_id': users[start:start + 16]}) for start in range(0, len(users), 16)
+        ],
+        'GET /get_recommended_films': [('GET', f'/get_recommended_films/{user}', None) for user in users],
+        'GET /get_find_rating_films_user': [('GET', f'/get_find_rating_films_user/{user}?limit=50', None) for user in users],
+        'GET /get_find_favorite_genres_user': [('GET', f'/get_find_favorite_genres_user/{user}', None) for user in users],
+        'GET /get_name_films': [('GET', '/get_name_films/', None)],
+    }
+
+
+async def drive(app, requests: list, n_requests: int, concurrency: int, probe_path: str = None,
+                probe_interval_ms: float = 10.0) -> dict:
+    """n_requests запросов из concurrency параллельных клиентов через ASGI-транспорт (без сети).
+    CPU на запрос - время процессора всего процесса, то есть вместе с клиентом httpx.
+    probe_path - параллельно с нагрузкой раз в probe_interval_ms запрашивается этот эндпоинт (например, /health):
+    его задержка показывает, свободен ли event loop, пока считаются предсказания"""
+    import httpx
+    latencies, statuses, sizes, probe_latencies = [], {}, [], []
+    counter = iter(range(n_requests))
+    done = asyncio.Event()
+
+    async def client_loop(client):
+        for i in counter:
+            method, path, payload = requests[i % len(requests)]
+            start = time.perf_counter()
+            response = await client.request(method, path, **request_body(payload))
+            latencies.append(time.perf_counter() - start)
+            sizes.append(int(response.request.headers.get('content-length', 0)))
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+    async def probe_loop(client):
+        # Задержка считается от момента, когда проверку пора было отправить, как у внешнего монитора по таймеру:
+        # если event loop занят моделью, то опаздывает уже пробуждение после sleep
+        scheduled = time.perf_counter()
+        while not done.is_set():
+            await client.get(probe_path)
+            probe_latencies.append(time.perf_counter() - scheduled)
+            scheduled = time.perf_counter() + probe_interval_ms / 1000
+            await asyncio.sleep(probe_interval_ms / 1000)
+
+    # Исключения приложения считаются ответом 500, как у настоящего сервера
+    transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+    async with httpx.AsyncClient(transport=transport, base_url='http://benchmark', timeout=120) as client:
+        method, path, payload = requests[0]
+        await client.request(method, path, **request_body(payload))
+        probe = asyncio.create_task(probe_loop(client)) if probe_path else None
+        start, cpu_start = time.perf_counter(), time.process_time()
+        await asyncio.gather(*(client_loop(client) for _ in range(concurrency)))
+        elapsed, cpu = time.perf_counter() - start, time.process_time() - cpu_start
+        done.set()
+        if probe is not None:
+            await probe
+
+    p50, p95, p99 = np.percentile(np.asarray(latencies) * 1000, [50, 95, 99])
+    probe_stats = {}
+    if probe_latencies:
+        probe_p50, probe_p99 = np.percentile(np.asarray(probe_latencies) * 1000, [50, 99])
+        probe_stats = {'probe_path': probe_path, 'probe_requests': len(probe_latencies), 'probe_p50_ms': probe_p50,
+                       'probe_p99_ms': probe_p99, 'probe_max_ms': max(probe_latencies) * 1000}
+    return {
+        'requests': len(latencies),
+        'errors': sum(count for status, count in statuses.items() if status >= 400),
+        'statuses': {str(status): count for status, count in sorted(statuses.items())},
+        'throughput_rps': len(latencies) / elapsed,
+        'p50_ms': p50, 'p95_ms': p95, 'p99_ms': p99,
+        'request_bytes': float(np.mean(sizes)),
+        'cpu_ms_per_request': cpu / len(latencies) * 1000,
+        **probe_stats,
+    }
+
+
+def request_body(payload) -> dict:
+    if isinstance(payload, bytes):
+        return {'content': payload, 'headers': {'content-type': 'application/octet-stream'}}
+    if isinstance(payload, tuple):
+        return {'files': [payload]}
+    return {'json': payload}
+
+
+async def drive_all(app, endpoints: dict, args) -> dict:
+    # Все эндпоинты в одном event loop, как у работающего сервера; с --health-probe под нагрузкой предсказаний
+    # параллельно опрашивается легкий эндпоинт сервиса
+    probe_path = POOL_SERVICES.get(args.service) if args.health_probe else None
+    return {name: await drive(app, requests, args.requests, args.concurrency,
+                              probe_path if name.startswith('POST') else None, args.probe_interval_ms)
+            for name, requests in endpoints.items()}
+
+
+def prepare_movies_workdir(args) -> str:
+    """Временная папка с синтетическим datasets/df_films_reviews.csv (генератор из benchmark.py рекомендательной системы)"""
+    folder = os.path.join(ROOT, SERVICES['movies'][0])
+    spec = importlib.util.spec_from_file_location('movie_benchmark', os.path.join(folder, 'benchmark.py'))
+    movie_benchmark = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(movie_benchmark)
+    workdir = args.workdir or tempfile.mkdtemp(prefix='load_benchmark_')
+    os.makedirs(os.path.join(workdir, 'datasets'), exist_ok=True)
+    csv_path = os.path.join(workdir, 'datasets', 'df_films_reviews.csv')
+    if not os.path.exists(csv_path):
+        movie_benchmark.make_synthetic_reviews(args.users, args.titles, args.ratings).to_csv(csv_path, index=False)
+    os.environ.setdefault('MIN_USER_RATINGS', str(args.min_ratings))
+    os.chdir(workdir)
+    return workdir
+
+
+def run_service(args) -> dict:
+    """Выполняется в отдельном процессе: пиковая память не смешивается между сервисами"""
+    if args.service == 'movies':
+        prepare_movies_workdir(args)
+    start = time.perf_counter()
+    module = load_app(args.service, args.real_models, args.model_overhead_ms)
+    startup = time.perf_counter() - start
+    endpoints = asyncio.run(drive_all(module.app, scenarios(args.service, module, args), args))
+    return {
+        'startup_seconds': startup,
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        'endpoints': endpoints,
+    }
+
+
+def git_revision() -> str | None:
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def service_runs(args) -> list:
+    """(метка в отчете, сервис, переменные окружения): с --batch-windows сервисы с батчами запускаются
+    без объединения запросов и с каждым окном, чтобы сравнить пропускную способность и задержку;
+    с --executors сервисы с пулом модели запускаются с каждым INFERENCE_EXECUTOR"""
+    runs = []
+    for service in args.services:
+        if service not in BATCHING_SERVICES or not args.batch_windows:
+            service_variants = [(service, {})]
+        else:
+            service_variants = [(f'{service}[без батчей]', {'INFERENCE_BATCH_SIZE': '1'})]
+            for window in args.batch_windows:
+                service_variants.append((f'{service}[окно {window:g} мс]',
+                                         {'INFERENCE_BATCH_SIZE': str(args.batch_size), 'INFERENCE_BATCH_WINDOW_MS': str(window)}))
+        for label, env in service_variants:
+            if service not in POOL_SERVICES or not args.executors:
+                runs.append((label, service, env))
+                continue
+            for executor in args.executors:
+                runs.append((f'{label}[{executor}]', service, {**env, 'INFERENCE_EXECUTOR': executor}))
+    return runs
+
+
+def main(args):
+    report = {
+        'revision': git_revision(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'cpu_count': os.cpu_count(),
+        'concurrency': args.concurrency,
+        'requests_per_endpoint': args.requests,
+        'real_models': args.real_models,
+        'model_overhead_ms': args.model_overhead_ms,
+        'model_runtime': args.model_runtime,
+        'services': {},
+    }
+    for label, service, env in service_runs(args):
+        command = [sys.executable, os.path.abspath(__file__), '--service', service, '--concurrency', str(args.concurrency),
+                   '--requests', str(args.requests), '--image-size', str(args.image_size), '--users', str(args.users),
+                   '--titles', str(args.titles), '--ratings', str(args.ratings), '--min-ratings', str(args.min_ratings),
+                   '--seed', str(args.seed), '--model-overhead-ms', str(args.model_overhead_ms),
+                   '--batch-rows', str(args.batch_rows), '--probe-interval-ms', str(args.probe_interval_ms)]
+        command += ['--real-models'] * args.real_models + ['--health-probe'] * args.health_probe + (['--workdir', os.path.abspath(args.workdir)] if args.workdir else [])
+        if args.model_runtime:
+            env = {'MODEL_RUNTIME': args.model_runtime, **env}
+        result = subprocess.run(command, capture_output=True, text=True, env={**os.environ, **env})
+        if result.returncode != 0:
+            # Например, в окружении нет tensorflow - сервис пропускается, остальные измеряются
+            error = result.stderr.strip().splitlines()[-1] if result.stderr.strip() else f'код возврата {result.returncode}'
+            report['services'][label] = {'skipped': error}
+            print(f'{label}: пропущен ({error})')
+            continue
+        report['services'][label] = json.loads(result.stdout.strip().splitlines()[-1])
+        for name, stats in report['services'][label]['endpoints'].items():
+            print(f"{label:12} {name:38} {stats['throughput_rps']:8.1f} запр/с, p50 {stats['p50_ms']:7.2f} мс, "
+                  f"p95 {stats['p95_ms']:7.2f} мс, p99 {stats['p99_ms']:7.2f} мс, ошибок {stats['errors']}, "
+                  f"запрос {stats['request_bytes'] / 1024:.1f} КБ, CPU {stats['cpu_ms_per_request']:.2f} мс/запр")
+            if 'probe_path' in stats:
+                print(f"{label:12} {'  GET ' + stats['probe_path'] + ' под нагрузкой':38} p50 {stats['probe_p50_ms']:7.2f} мс, "
+                      f"p99 {stats['probe_p99_ms']:7.2f} мс, макс {stats['probe_max_ms']:7.2f} мс")
+        print(f"{label:12} запуск {report['services'][label]['startup_seconds']:.2f} c, "
+              f"пиковый RSS {report['services'][label]['peak_rss_mb']:.0f} МБ")
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f'Отчет сохранен в {args.output}')
+    if args.compare:
+        compare(args.compare, report)
+
+
+def compare(baseline_path: str, report: dict):
+    """Сравнение с отчетом другого коммита: во сколько раз изменились пропускная способность и p95"""
+    with open(baseline_path, encoding='utf-8') as f:
+        baseline = json.load(f)
+    print(f"Сравнение с {baseline_path} (коммит {baseline.get('revision')})")
+    for service, result in report['services'].items():
+        old = baseline['services'].get(service, {})
+        for name, stats in result.get('endpoints', {}).items():
+            old_stats = old.get('endpoints', {}).get(name)
+            if old_stats is None:
+                continue
+            print(f"{service:12} {name:38} пропускная способность x{stats['throughput_rps'] / old_stats['throughput_rps']:.2f}, "
+                  f"p95 x{stats['p95_ms'] / old_stats['p95_ms']:.2f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Нагрузочный бенчмарк FastAPI-сервисов на синтетических данных')
+    parser.add_argument('--services', nargs='+', choices=SERVICES, default=list(SERVICES))
+    parser.add_argument('--service', choices=SERVICES, help=argparse.SUPPRESS)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=500, help='запросов на каждый эндпоинт')
+    parser.add_argument('--output', default='load_benchmark.json')
+    parser.add_argument('--compare', help='JSON-отчет предыдущего запуска для сравнения')
+    parser.add_argument('--real-models', action='store_true', help='использовать модели из папок сервисов вместо синтетических')
+    parser.add_argument('--model-overhead-ms', type=float, default=0.0,
+                        help='постоянная цена вызова синтетической модели, мс')
+    parser.add_argument('--model-runtime', choices=['keras', 'numpy'],
+                        help='MODEL_RUNTIME для сервисов с keras-моделями (вместе с --real-models)')
+    parser.add_argument('--batch-windows', type=float, nargs='+',
+                        help='окна объединения запросов в батч, мс: сервисы с батчами измеряются с каждым окном')
+    parser.add_argument('--batch-size', type=int, default=32, help='максимальный батч для --batch-windows')
+    parser.add_argument('--image-size', type=int, default=640, help='сторона изображения для сервиса обуви')
+    parser.add_argument('--executors', nargs='+', choices=['inline', 'thread', 'process'],
+                        help='INFERENCE_EXECUTOR: сервисы с пулом модели измеряются с каждым режимом')
+    parser.add_argument('--health-probe', action='store_true',
+                        help='параллельно с POST-нагрузкой опрашивать /health (у сервиса недвижимости - /) и мерить его задержку')
+    parser.add_argument('--probe-interval-ms', type=float, default=10.0, help='пауза между запросами --health-probe, мс')
+    parser.add_argument('--batch-rows', type=int, default=1000, help='строк в пакетном запросе к сервису недвижимости')
+    parser.add_argument('--workdir', help='папка с datasets/df_films_reviews.csv для рекомендательной системы')
+    parser.add_argument('--users', type=int, default=3000)
+    parser.add_argument('--titles', type=int, default=2000)
+    parser.add_argument('--ratings', type=int, default=300_000)
+    parser.add_argument('--min-ratings', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    if args.service:
+        print(json.dumps(run_service(args)))
+    else:
+        args.output = os.path.abspath(args.output)
+        args.compare = args.compare and os.path.abspath(args.compare)
+        main(args)
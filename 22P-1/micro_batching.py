@@ -0,0 +1,127 @@
+import asyncio, time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+
+class MicroBatcher:
+    """Объединяет одновременные запросы к модели в один батч: первый запрос ждет остальных не дольше window_ms
+    или пока не наберется max_batch_size строк, затем один вызов predict на весь батч, и каждый получает свои строки.
+    Пока батч считается, новые запросы копятся и уходят следующим батчем. max_batch_size=1 - без объединения.
+    run - async-функция run(func, *args), которая выполняет вызов модели (например, BoundedExecutor.submit);
+    по умолчанию - свой поток, event loop при этом свободен"""
+
+    def __init__(self, predict, max_batch_size: int = 32, window_ms: float = 2.0, metrics=None, name: str = 'model',
+                 run=None):
+        self.predict_fn = predict
+        self.run_fn = run or self._run_in_thread
+        self.max_batch_size = max_batch_size
+        self.window = window_ms / 1000
+        self.metrics = metrics
+        self.name = name
+        self.pending = []
+        self.loop = None
+        self.has_items = None
+        self.full = None
+        self.worker = None
+        # Один поток: модель считает батчи по очереди, event loop при этом свободен
+        self.executor = ThreadPoolExecutor(1, thread_name_prefix=f'{name}-batch')
+        self.batches = 0
+        self.items = 0
+        self.rows = 0
+        self.failed = 0
+        self.wait_seconds = 0.0
+        self.run_seconds = 0.0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_batch_size > 1
+
+    async def predict(self, inputs: np.ndarray) -> np.ndarray:
+        """inputs - массив (n, ...) с батчевой осью; возвращает n строк ответа модели"""
+        if not self.enabled:
+            return await self.run_fn(self.predict_fn, inputs)
+        self._ensure_worker()
+        future = self.loop.create_future()
+        self.pending.append((inputs, future, time.perf_counter()))
+        self.has_items.set()
+        if sum(len(item[0]) for item in self.pending) >= self.max_batch_size:
+            self.full.set()
+        return await future
+
+    def _ensure_worker(self):
+        # Очередь и события привязаны к event loop; новый loop (перезапуск сервера, тесты) получает свои
+        loop = asyncio.get_running_loop()
+        if self.loop is not loop:
+            self.loop = loop
+            self.pending = []
+            self.has_items = asyncio.Event()
+            self.full = asyncio.Event()
+            self.worker = loop.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            await self.has_items.wait()
+            if self.window > 0 and not self.full.is_set():
+                try:
+                    await asyncio.wait_for(self.full.wait(), self.window)
+                except asyncio.TimeoutError:
+                    pass
+            batch = self._take()
+            inputs = batch[0][0] if len(batch) == 1 else np.concatenate([item[0] for item in batch])
+            started = time.perf_counter()
+            try:
+                outputs = await self.run_fn(self.predict_fn, inputs)
+            except Exception as e:
+                self.failed += len(batch)
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            finally:
+                self.run_seconds += time.perf_counter() - started
+
+            self.batches += 1
+            self.items += len(batch)
+            self.rows += len(inputs)
+            if self.metrics is not None:
+                self.metrics.observe_batch(self.name, len(inputs))
+            offset = 0
+            for item, future, enqueued in batch:
+                self.wait_seconds += started - enqueued
+                # Клиент мог отключиться, пока батч считался
+                if not future.done():
+                    future.set_result(outputs[offset:offset + len(item)])
+                offset += len(item)
+
+    async def _run_in_thread(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+
+    def _take(self) -> list:
+        """Забирает из очереди запросы на один батч: не больше max_batch_size строк, но хотя бы один запрос"""
+        count, rows = 0, 0
+        for inputs, _, _ in self.pending:
+            if count and rows + len(inputs) > self.max_batch_size:
+                break
+            count += 1
+            rows += len(inputs)
+        batch, self.pending = self.pending[:count], self.pending[count:]
+        self.full.clear()
+        if not self.pending:
+            self.has_items.clear()
+        elif sum(len(item[0]) for item in self.pending) >= self.max_batch_size:
+            self.full.set()
+        return batch
+
+    def stats(self) -> dict:
+        return {
+            'enabled': self.enabled,
+            'max_batch_size': self.max_batch_size,
+            'window_ms': self.window * 1000,
+            'queue_depth': len(self.pending),
+            'batches': self.batches,
+            'requests': self.items,
+            'failed': self.failed,
+            'avg_batch_size': self.rows / self.batches if self.batches else 0.0,
+            'avg_wait_ms': self.wait_seconds / self.items * 1000 if self.items else 0.0,
+            'avg_batch_ms': self.run_seconds / self.batches * 1000 if self.batches else 0.0,
+        }
@@ -0,0 +1,352 @@
+import argparse, json, os, time
+import numpy as np
+
+# Слои, которые умеет считать NumpyModel; для остальных экспорт падает с понятной ошибкой
+SUPPORTED_LAYERS = ('InputLayer', 'Conv2D', 'DepthwiseConv2D', 'Dense', 'BatchNormalization', 'ReLU', 'Activation',
+                    'ZeroPadding2D', 'MaxPooling2D', 'GlobalAveragePooling2D', 'Flatten', 'Dropout', 'Add')
+GRAPH_KEY = '__graph__'
+# Примерный размер блока (элементов float32) для поэлементных операций depthwise-свертки: блок остается в кэше
+BLOCK_SIZE = 16384
+# Большой батч считается частями: промежуточные активации MobileNet на 32 изображения - сотни МБ, а быстрее не выходит
+MAX_CHUNK = 8
+
+
+def export(h5_path: str, output_path: str = None) -> str:
+    """Переводит keras-модель .h5 в .npz: граф слоев в JSON и веса массивами float32.
+    Нужен только h5py; BatchNormalization после линейной свертки или Dense вшивается в ее веса"""
+    import h5py
+
+    output_path = output_path or os.path.splitext(h5_path)[0] + '.npz'
+    with h5py.File(h5_path, 'r') as f:
+        config = json.loads(_text(f.attrs['model_config']))
+        weights = {}
+
+        def collect(path, item):
+            # Путь вида .../<слой>/<вес>[:0]: вложенные модели в разных версиях keras хранятся по-разному
+            if isinstance(item, h5py.Dataset):
+                layer, kind = path.split(':')[0].split('/')[-2:]
+                weights[layer, kind] = item[()].astype(np.float32)
+
+        f['model_weights'].visititems(collect)
+
+    nodes = []
+    output = _flatten(config, None, nodes, weights)
+    nodes = _fold_batch_norm(nodes)
+    arrays = {}
+    for node in nodes:
+        for kind, value in node.pop('arrays').items():
+            arrays[f"{node['name']}/{kind}"] = value
+            node.setdefault('weights', []).append(kind)
+    graph = {'nodes': nodes, 'output': output, 'source': os.path.basename(h5_path)}
+    np.savez(output_path, **arrays, **{GRAPH_KEY: np.array(json.dumps(graph))})
+    return output_path
+
+
+def _text(value) -> str:
+    return value.decode('utf-8') if isinstance(value, bytes) else str(value)
+
+
+def _flatten(config: dict, input_name, nodes: list, weights: dict) -> str:
+    """Разворачивает Sequential/Functional (в том числе вложенные) в плоский список узлов; возвращает имя выхода"""
+    class_name, layer_config = config['class_name'], config['config']
+    if class_name == 'Sequential':
+        current = input_name
+        for layer in layer_config['layers']:
+            current = _flatten(layer, current, nodes, weights)
+        return current
+    if class_name in ('Functional', 'Model'):
+        # Входы вложенной модели - это выход предыдущего слоя снаружи
+        aliases = {_history(item)[0]: input_name for item in layer_config['input_layers']}
+        for layer in layer_config['layers']:
+            if layer['class_name'] == 'InputLayer':
+                continue
+            inputs = [aliases.get(name, name) for name in _inbound(layer)]
+            aliases[layer['config']['name']] = _flatten(layer, inputs[0] if len(inputs) == 1 else inputs, nodes, weights)
+        return aliases[_history(layer_config['output_layers'][0])[0]]
+    if class_name == 'InputLayer':
+        return input_name
+    if class_name not in SUPPORTED_LAYERS:
+        raise ValueError(f"Слой {class_name} ({layer_config.get('name')}) не поддерживается")
+    if class_name == 'Dropout':
+        return input_name
+
+    name = layer_config['name']
+    node = {'name': name, 'op': class_name, 'inputs': input_name if isinstance(input_name, list) else [input_name],
+            'params': _params(class_name, layer_config), 'arrays': {}}
+    layer_weights = {kind: value for (layer, kind), value in weights.items() if layer == name}
+    if class_name == 'BatchNormalization':
+        # y = x * scale + shift с уже посчитанными scale и shift
+        variance = layer_weights['moving_variance']
+        scale = layer_weights.get('gamma', np.ones_like(variance)) / np.sqrt(variance + layer_config['epsilon'])
+        node['arrays'] = {'scale': scale, 'shift': layer_weights.get('beta', 0) - layer_weights['moving_mean'] * scale}
+    elif class_name == 'DepthwiseConv2D':
+        node['arrays'] = {'kernel': layer_weights['depthwise_kernel']}
+    elif class_name in ('Conv2D', 'Dense'):
+        node['arrays'] = {'kernel': layer_weights['kernel']}
+    if class_name in ('Conv2D', 'DepthwiseConv2D', 'Dense') and layer_config.get('use_bias', True):
+        node['arrays']['bias'] = layer_weights['bias']
+    nodes.append(node)
+    return name
+
+
+def _history(item) -> list:
+    # ['имя', 0, 0] в keras 2 или {'keras_history': [...]} в keras 3
+    return item['config']['keras_history'] if isinstance(item, dict) else item
+
+
+def _inbound(layer: dict) -> list:
+    """Имена слоев-входов из inbound_nodes в формате keras 2 или keras 3"""
+    names = []
+
+    def walk(value):
+        if isinstance(value, dict):
+            if 'keras_history' in value:
+                names.append(value['keras_history'][0])
+            else:
+                for item in value.values():
+                    walk(item)
+        elif isinstance(value, list):
+            if len(value) >= 3 and isinstance(value[0], str) and isinstance(value[1], int):
+                names.append(value[0])
+            else:
+                for item in value:
+                    walk(item)
+
+    walk(layer['inbound_nodes'])
+    return names
+
+
+def _params(class_name: str, config: dict) -> dict:
+    params = {}
+    for key in ('strides', 'padding', 'activation', 'pool_size', 'max_value', 'negative_slope', 'threshold', 'depth_multiplier'):
+        if key in config:
+            params[key] = config[key]
+    if config.get('dilation_rate', [1, 1]) not in ([1, 1], (1, 1), 1):
+        raise ValueError(f"Слой {config['name']}: dilation_rate не поддерживается")
+    if config.get('data_format', 'channels_last') != 'channels_last':
+        raise ValueError(f"Слой {config['name']}: поддерживается только channels_last")
+    if params.get('negative_slope') or params.get('threshold'):
+        raise ValueError(f"Слой {config['name']}: ReLU с negative_slope или threshold не поддерживается")
+    if class_name == 'MaxPooling2D' and params.get('strides') is None:
+        params['strides'] = params['pool_size']
+    if class_name == 'GlobalAveragePooling2D' and config.get('keepdims'):
+        raise ValueError(f"Слой {config['name']}: keepdims не поддерживается")
+    if 'activation' in params and params['activation'] not in ACTIVATIONS:
+        raise ValueError(f"Слой {config['name']}: активация {params['activation']} не поддерживается")
+    return params
+
+
+def _fold_batch_norm(nodes: list) -> list:
+    """BatchNormalization сразу после свертки/Dense без активации -> масштаб и сдвиг в весах самой свертки"""
+    consumers = {}
+    for node in nodes:
+        for name in node['inputs']:
+            consumers[name] = consumers.get(name, 0) + 1
+    by_name = {node['name']: node for node in nodes}
+    folded = []
+    for node in nodes:
+        source = by_name.get(node['inputs'][0])
+        if (node['op'] == 'BatchNormalization' and source is not None and source['op'] in ('Conv2D', 'DepthwiseConv2D', 'Dense')
+                and source['params'].get('activation', 'linear') == 'linear' and consumers[source['name']] == 1):
+            scale, shift = node['arrays']['scale'], node['arrays']['shift']
+            kernel = source['arrays']['kernel']
+            if source['op'] == 'DepthwiseConv2D':
+                # Ядро (kh, kw, каналы, множитель): выходной канал - канал * множитель + номер
+                kernel = kernel * scale.reshape(kernel.shape[2], kernel.shape[3])
+            else:
+                kernel = kernel * scale
+            source['arrays']['kernel'] = kernel.astype(np.float32)
+            source['arrays']['bias'] = (source['arrays'].get('bias', 0) * scale + shift).astype(np.float32)
+            # Следующие слои читают выход свертки под именем BatchNormalization
+            source['name'] = node['name']
+            continue
+        folded.append(node)
+    return folded
+
+
+def _relu(x, max_value=None, out=None):
+    if max_value is not None:
+        return np.clip(x, 0, max_value, out=out)
+    return np.maximum(x, 0, out=out)
+
+
+def _softmax(x):
+    x = np.exp(x - x.max(axis=-1, keepdims=True))
+    return x / x.sum(axis=-1, keepdims=True)
+
+
+# Активации считаются на месте: x - свежий выход слоя, который больше никто не читает
+ACTIVATIONS = {
+    'linear': lambda x: x,
+    'relu': lambda x: _relu(x, out=x),
+    'relu6': lambda x: _relu(x, 6.0, out=x),
+    'softmax': _softmax,
+    'sigmoid': lambda x: 1 / (1 + np.exp(-x)),
+    'tanh': np.tanh,
+}
+
+
+def _same_padding(size: int, kernel: int, stride: int) -> tuple:
+    """Отступы padding='same' как в TensorFlow: лишний ноль - справа/снизу"""
+    total = max((-(-size // stride) - 1) * stride + kernel - size, 0)
+    return total // 2, total - total // 2
+
+
+def _pad(x: np.ndarray, kernel: tuple, strides: tuple, padding: str, value: float = 0.0) -> np.ndarray:
+    if padding != 'same':
+        return x
+    (top, bottom), (left, right) = (_same_padding(x.shape[axis], kernel[i], strides[i]) for i, axis in enumerate((1, 2)))
+    if top or bottom or left or right:
+        x = np.pad(x, ((0, 0), (top, bottom), (left, right), (0, 0)), constant_values=value)
+    return x
+
+
+def _output_size(size: int, kernel: int, stride: int) -> int:
+    return (size - kernel) // stride + 1
+
+
+def _windows(x: np.ndarray, kernel: tuple, strides: tuple):
+    """Сдвиги окна свертки: для каждой позиции ядра (i, j) - срез входа (n, h_out, w_out, c) без копирования"""
+    (kh, kw), (sh, sw) = kernel, strides
+    h_out, w_out = _output_size(x.shape[1], kh, sh), _output_size(x.shape[2], kw, sw)
+    for i in range(kh):
+        for j in range(kw):
+            yield i, j, x[:, i:i + sh * (h_out - 1) + 1:sh, j:j + sw * (w_out - 1) + 1:sw, :]
+
+
+def _conv2d(x, kernel, strides, padding):
+    # im2col: сдвиги окна подряд по каналам, затем одно матричное умножение (n*h*w, kh*kw*c) x (kh*kw*c, filters).
+    # Для 1x1 со страйдом 1 это просто reshape входа
+    kh, kw, channels, filters = kernel.shape
+    x = _pad(x, (kh, kw), strides, padding)
+    windows = [window for _, _, window in _windows(x, (kh, kw), strides)]
+    columns = windows[0] if len(windows) == 1 else np.concatenate(windows, axis=3)
+    n, h_out, w_out, _ = columns.shape
+    out = np.ascontiguousarray(columns).reshape(-1, kh * kw * channels) @ kernel.reshape(-1, filters)
+    return out.reshape(n, h_out, w_out, filters)
+
+
+def _depthwise_conv2d(x, kernel, strides, padding):
+    # kh*kw поэлементных умножений с накоплением по блокам строк одного изображения, чтобы блок и буфер были в кэше
+    kh, kw, channels, multiplier = kernel.shape
+    x = _pad(x, (kh, kw), strides, padding)
+    if multiplier > 1:
+        x = np.repeat(x, multiplier, axis=3)
+    channels *= multiplier
+    kernel = kernel.reshape(kh, kw, channels)
+    (sh, sw) = strides
+    h_out, w_out = _output_size(x.shape[1], kh, sh), _output_size(x.shape[2], kw, sw)
+    out = np.empty((len(x), h_out, w_out, channels), dtype=np.float32)
+    rows = max(1, BLOCK_SIZE // (w_out * channels))
+    buffer = np.empty((rows, w_out, channels), dtype=np.float32)
+    for n in range(len(x)):
+        for top in range(0, h_out, rows):
+            bottom = min(top + rows, h_out)
+            block, part = out[n, top:bottom], buffer[:bottom - top]
+            for i in range(kh):
+                for j in range(kw):
+                    window = x[n, i + sh * top:i + sh * (bottom - 1) + 1:sh, j:j + sw * (w_out - 1) + 1:sw]
+                    if i == 0 and j == 0:
+                        np.multiply(window, kernel[i, j], out=block)
+                    else:
+                        np.multiply(window, kernel[i, j], out=part)
+                        block += part
+    return out
+
+
+def _max_pool(x, pool_size, strides, padding):
+    # Паддинг -inf, чтобы нули не побеждали отрицательные значения
+    x = _pad(x, pool_size, strides, padding, value=-np.inf)
+    out = None
+    for _, _, window in _windows(x, pool_size, strides):
+        out = window.copy() if out is None else np.maximum(out, window, out=out)
+    return out
+
+
+class NumpyModel:
+    """Прямой проход экспортированной keras-модели на NumPy: без TensorFlow, с тем же predict(x, verbose=0)"""
+
+    def __init__(self, nodes: list, output: str, arrays: dict, source: str = None):
+        self.nodes = nodes
+        self.output = output
+        self.arrays = arrays
+        self.source = source
+
+    @classmethod
+    def load(cls, path: str) -> 'NumpyModel':
+        with np.load(path, allow_pickle=False) as data:
+            graph = json.loads(str(data[GRAPH_KEY]))
+            arrays = {key: data[key] for key in data.files if key != GRAPH_KEY}
+        return cls(graph['nodes'], graph['output'], arrays, graph.get('source'))
+
+    @property
+    def nbytes(self) -> int:
+        return sum(array.nbytes for array in self.arrays.values())
+
+    def predict(self, x: np.ndarray, verbose: int = 0) -> np.ndarray:
+        """x - батч (n, ...) во входном формате keras-модели; verbose - для совместимости с keras"""
+        x = np.asarray(x, dtype=np.float32)
+        if len(x) <= MAX_CHUNK:
+            return self._forward(x)
+        return np.concatenate([self._forward(x[start:start + MAX_CHUNK]) for start in range(0, len(x), MAX_CHUNK)])
+
+    def _forward(self, x: np.ndarray) -> np.ndarray:
+        values = {None: x}
+        # Сколько раз еще понадобится каждый выход: ненужные промежуточные массивы сразу освобождаются
+        remaining = {}
+        for node in self.nodes:
+            for name in node['inputs']:
+                remaining[name] = remaining.get(name, 0) + 1
+        for node in self.nodes:
+            inputs = [values[name] for name in node['inputs']]
+            # Вход можно менять на месте, если этот слой читает его последним (и это не массив вызывающего)
+            owned = node['inputs'][0] is not None and remaining[node['inputs'][0]] == 1
+            values[node['name']] = self._run(node, inputs, owned)
+            for name in node['inputs']:
+                remaining[name] -= 1
+                if remaining[name] == 0 and name != self.output:
+                    del values[name]
+        return values[self.output]
+
+    def _run(self, node: dict, inputs: list, owned: bool = False) -> np.ndarray:
+        op, params, name = node['op'], node['params'], node['name']
+        weights = {kind: self.arrays[f'{name}/{kind}'] for kind in node.get('weights', ())}
+        x = inputs[0]
+        if op == 'Conv2D':
+            x = _conv2d(x, weights['kernel'], tuple(params['strides']), params['padding'])
+        elif op == 'DepthwiseConv2D':
+            x = _depthwise_conv2d(x, weights['kernel'], tuple(params['strides']), params['padding'])
+        elif op == 'Dense':
+            x = x @ weights['kernel']
+        elif op == 'BatchNormalization':
+            return x * weights['scale'] + weights['shift']
+        elif op == 'ReLU':
+            return _relu(x, params.get('max_value'), out=x if owned else None)
+        elif op == 'Activation':
+            return ACTIVATIONS[params['activation']](x if owned else x.copy())
+        elif op == 'ZeroPadding2D':
+            (top, bottom), (left, right) = params['padding']
+            return np.pad(x, ((0, 0), (top, bottom), (left, right), (0, 0)))
+        elif op == 'MaxPooling2D':
+            return _max_pool(x, tuple(params['pool_size']), tuple(params['strides']), params['padding'])
+        elif op == 'GlobalAveragePooling2D':
+            return x.mean(axis=(1, 2))
+        elif op == 'Flatten':
+            return x.reshape(len(x), -1)
+        elif op == 'Add':
+            return sum(inputs[1:], inputs[0].copy())
+        if 'bias' in weights:
+            x += weights['bias']
+        return ACTIVATIONS[params.get('activation', 'linear')](x)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Экспорт keras-моделей .h5 в .npz для NumpyModel (нужен h5py)')
+    parser.add_argument('models', nargs='+', help='пути к .h5')
+    args = parser.parse_args()
+    for path in args.models:
+        start = time.perf_counter()
+        output_path = export(path)
+        model = NumpyModel.load(output_path)
+        print(f'{path} -> {output_path}: {len(model.nodes)} слоев, {model.nbytes / 2**20:.1f} МБ весов, '
+              f'{time.perf_counter() - start:.2f} c')
@@ -0,0 +1,166 @@
+import bisect, os, threading, time
+from contextlib import contextmanager, nullcontext
+
+# Границы корзин гистограмм длительности, секунды
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BATCH_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+_NO_OP = nullcontext()
+
+
+class Histogram:
+    """Гистограмма длительностей с метками в формате Prometheus: счетчики корзин, сумма и количество на набор меток"""
+
+    def __init__(self, name: str, help_text: str, label_names: tuple, buckets: tuple = DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = buckets
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def observe(self, labels: tuple, value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.series.get(labels)
+            if series is None:
+                series = self.series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> list:
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        with self.lock:
+            series = {labels: (list(counts), total, count) for labels, (counts, total, count) in self.series.items()}
+        for labels, (counts, total, count) in sorted(series.items()):
+            label_text = _labels(self.label_names, labels)
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f'{self.name}_bucket{{{label_text}{"," if label_text else ""}le="{le}"}} {cumulative}')
+            lines.append(f'{self.name}_sum{{{label_text}}} {total}')
+            lines.append(f'{self.name}_count{{{label_text}}} {count}')
+        return lines
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str, label_names: tuple, kind: str = 'counter'):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.kind = kind
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, labels: tuple, value: float = 1):
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + value
+
+    def set(self, labels: tuple, value: float):
+        with self.lock:
+            self.values[labels] = value
+
+    def render(self) -> list:
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} {self.kind}']
+        with self.lock:
+            values = dict(self.values)
+        for labels, value in sorted(values.items()):
+            lines.append(f'{self.name}{{{_labels(self.label_names, labels)}}} {value}')
+        return lines
+
+
+class Metrics:
+    """Метрики сервиса: длительности этапов обработки, счетчики и длительности запросов, время загрузки моделей.
+    При enabled=False stage() возвращает пустой контекст, а middleware не подключается - накладных расходов почти нет"""
+
+    def __init__(self, enabled: bool = None):
+        self.enabled = os.environ.get('METRICS_ENABLED', '1') != '0' if enabled is None else enabled
+        self.stage_seconds = Histogram('stage_duration_seconds', 'Длительность этапа обработки запроса', ('stage',))
+        self.request_seconds = Histogram('http_request_duration_seconds', 'Длительность HTTP-запроса', ('method', 'path'))
+        self.requests = Counter('http_requests_total', 'Число HTTP-запросов', ('method', 'path', 'status'))
+        self.model_load_seconds = Counter('model_load_seconds', 'Время загрузки модели', ('model',), kind='gauge')
+        self.batch_size = Histogram('inference_batch_size', 'Размер батча при вызове модели', ('model',), BATCH_BUCKETS)
+        self.cache_requests = Counter('prediction_cache_requests_total', 'Обращения к кэшу предсказаний', ('cache', 'result'))
+        self.cache_evictions = Counter('prediction_cache_evictions_total', 'Удаленные из кэша предсказаний записи',
+                                       ('cache', 'reason'))
+
+    def stage(self, name: str):
+        """with metrics.stage('decode'): ... - время этапа попадает в гистограмму stage_duration_seconds"""
+        if not self.enabled:
+            return _NO_OP
+        return self._timed(name)
+
+    @contextmanager
+    def _timed(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stage_seconds.observe((name,), time.perf_counter() - start)
+
+    def observe_stage(self, name: str, seconds: float):
+        if self.enabled:
+            self.stage_seconds.observe((name,), seconds)
+
+    def observe_batch(self, model: str, size: int):
+        if self.enabled:
+            self.batch_size.observe((model,), size)
+
+    def observe_cache(self, cache: str, result: str):
+        if self.enabled:
+            self.cache_requests.inc((cache, result))
+
+    def observe_cache_eviction(self, cache: str, reason: str, count: int = 1):
+        if self.enabled:
+            self.cache_evictions.inc((cache, reason), count)
+
+    @contextmanager
+    def model_load(self, name: str):
+        """Время загрузки модели записывается всегда: это один раз при запуске"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.model_load_seconds.set((name,), time.perf_counter() - start)
+
+    def render(self) -> str:
+        lines = []
+        for metric in (self.requests, self.request_seconds, self.stage_seconds, self.batch_size, self.model_load_seconds,
+                       self.cache_requests, self.cache_evictions):
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+    def instrument(self, app):
+        """Подключает к FastAPI-приложению счетчики запросов и эндпоинт /metrics в текстовом формате Prometheus"""
+        from fastapi.responses import PlainTextResponse
+
+        @app.get('/metrics', include_in_schema=False)
+        async def metrics_endpoint():
+            return PlainTextResponse(self.render(), media_type='text/plain; version=0.0.4')
+
+        if not self.enabled:
+            return
+
+        @app.middleware('http')
+        async def count_requests(request, call_next):
+            start = time.perf_counter()
+            status = 500
+            try:
+                response = await call_next(request)
+                status = response.status_code
+                return response
+            finally:
+                # Шаблон маршрута вместо пути запроса, чтобы id пользователей не плодили серии
+                route = request.scope.get('route')
+                path = getattr(route, 'path', 'unmatched')
+                self.requests.inc((request.method, path, str(status)))
+                self.request_seconds.observe((request.method, path), time.perf_counter() - start)
+
+
+def _labels(names: tuple, values: tuple) -> str:
+    return ','.join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')